@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import os
+import time
+from functools import partial
+
+from dotenv import load_dotenv
+from google import genai
+from google.genai import types
+
+import settings
+from available_functions import available_functions
+from batch import clone_workspace
+from executor import arun_function_calls
+from main import add_common_arguments, call_function, log_usage
+from resilience import ResilientClient
+from compaction import compact_contents
+from tool_cache import ToolResultCache
+from tracing import configure_tracing, span, usage_attributes
+
+
+async def acall_function(
+    function_call_part: types.FunctionCall,
+    verbose=False,
+    cache: ToolResultCache | None = None,
+    working_directory: str | None = None,
+) -> types.Content:
+    """
+    Awaitable version of `main.call_function`.
+
+    Args:
+        function_call_part (types.FunctionCall): An object containing the name of the function to call and its arguments.
+        verbose (bool, optional): If True, prints detailed information about the function call. Defaults to False.
+        cache (ToolResultCache | None, optional): Session cache consulted for read-only tools. Defaults to None.
+        working_directory (str | None, optional): The directory the tool is confined to. Defaults to `settings.WORKING_DIR`.
+
+    Returns:
+        types.Content: An object containing the result of the function call or an error message if the function is unknown.
+
+    Notes:
+        - The tools block on file-system and subprocess syscalls, so they run on the
+          default executor and the event loop keeps driving other sessions meanwhile.
+        - `asyncio.to_thread` copies the context, so tool spans nest under the session's turn.
+    """
+    return await asyncio.to_thread(
+        call_function, function_call_part, verbose, cache, working_directory
+    )
+
+
+async def run_agent_async(
+    client: genai.Client,
+    user_prompt: str,
+    verbose: bool = False,
+    working_directory: str | None = None,
+) -> str | None:
+    """
+    Runs one agent session on the async client.
+
+    Args:
+        client (genai.Client): The generative AI client; its `aio` interface is used.
+        user_prompt (str): The prompt starting the session.
+        verbose (bool, optional): If True, prints detailed information about the session. Defaults to False.
+        working_directory (str | None, optional): The directory the session's tools are confined to. Defaults to `settings.WORKING_DIR`.
+
+    Returns:
+        str | None: The model's final text response, or None if the session ran out of iterations.
+    """
+    contents: list = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+
+    config: types.GenerateContentConfig = types.GenerateContentConfig(
+        system_instruction=settings.SYSTEM_PROMPT, tools=[available_functions]
+    )
+
+    working_directory = working_directory or settings.WORKING_DIR
+    cache = ToolResultCache(working_directory)
+    dispatch = partial(acall_function, cache=cache, working_directory=working_directory)
+
+    for turn in range(1, settings.MAX_ITERS + 1):
+
+        cache.workspace.begin_turn()
+        contents = compact_contents(contents)
+
+        with span("model_call", model=settings.MODEL_ID, turn=turn) as model_span:
+            response = await client.aio.models.generate_content(
+                model=settings.MODEL_ID,
+                contents=contents,
+                config=config,
+            )
+            model_span.set(
+                function_calls=len(response.function_calls or []),
+                **usage_attributes(response.usage_metadata),
+            )
+
+        if verbose:
+            log_usage(turn, response.usage_metadata)
+
+        if response.candidates:
+            for candidate in response.candidates:
+                contents.append(candidate.content)
+
+        if not response.function_calls:
+            if verbose and response.usage_metadata:
+                print(f"User prompt: {user_prompt}")
+                print(f"Prompt tokens: {response.usage_metadata.prompt_token_count}")
+                print(
+                    f"Response tokens: {response.usage_metadata.candidates_token_count}"
+                )
+                print(f"Tool cache: {cache.hits} hits, {cache.misses} misses")
+            return response.text.strip() if response.text else None
+
+        with span("tools", turn=turn, calls=len(response.function_calls)):
+            tool_responses = await arun_function_calls(
+                response.function_calls, dispatch, verbose=verbose
+            )
+
+        for func_call in tool_responses:
+            if not func_call.parts or not func_call.parts[0].function_response:
+                raise Exception("Empty function call result!")
+            if verbose:
+                print(f"-> {func_call.parts[0].function_response.response}")
+            contents.append(func_call)
+
+    return None
+
+
+async def run_batch(
+    prompts: list[str],
+    concurrency: int = settings.BATCH_CONCURRENCY,
+    verbose: bool = False,
+    client: genai.Client | None = None,
+    workspaces_dir: str | None = settings.BATCH_WORKSPACES_DIR,
+) -> list[str | None]:
+    """
+    Runs several agent sessions concurrently in a single interpreter, each in its own clone of the workspace.
+
+    Args:
+        prompts (list[str]): One prompt per session.
+        concurrency (int, optional): Maximum number of sessions in flight at once. Defaults to `settings.BATCH_CONCURRENCY`.
+        verbose (bool, optional): If True, prints detailed information about each session. Defaults to False.
+        client (genai.Client | None, optional): Client shared by all sessions. Created from `GEMINI_API_KEY` if omitted.
+        workspaces_dir (str | None, optional): Directory the clones are created in. Defaults to
+            `settings.BATCH_WORKSPACES_DIR`, or when that is None, a directory next to `settings.WORKING_DIR`.
+
+    Returns:
+        list[str | None]: Final responses in the same order as `prompts`.
+
+    Notes:
+        - Session i works in `<workspaces_dir>/<timestamp>/session-<i>`, cloned from
+          `settings.WORKING_DIR` with `batch.clone_workspace`, so sessions never see each
+          other's writes or runs, and no session's tool cache serves a file another session
+          changed. Clones are kept after the run so the changes can be inspected.
+        - A session that raises is reported as an error string instead of cancelling the batch.
+        - Model calls are retried and rate limited by `resilience.ResilientClient`; the rate
+          limit is shared by all sessions of the batch.
+    """
+    if client is None:
+        load_dotenv()
+        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+    client = ResilientClient(client)
+
+    source = os.path.abspath(settings.WORKING_DIR)
+    root = workspaces_dir or os.path.join(
+        os.path.dirname(source), f".{os.path.basename(source)}-batch"
+    )
+    batch_dir = os.path.join(os.path.abspath(root), time.strftime("%Y%m%d-%H%M%S"))
+    os.makedirs(batch_dir, exist_ok=True)
+    print(f"Sessions work in clones of {source} under {batch_dir}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(index: int, prompt: str) -> str | None:
+        async with semaphore:
+            try:
+                workspace = os.path.join(batch_dir, f"session-{index:04d}")
+                await asyncio.to_thread(clone_workspace, source, workspace)
+                with span("session", model=settings.MODEL_ID):
+                    return await run_agent_async(
+                        client, prompt, verbose=verbose, working_directory=workspace
+                    )
+            except Exception as err:
+                return f"Error: session failed. Details: {err}"
+
+    return list(
+        await asyncio.gather(
+            *(run_one(index, prompt) for index, prompt in enumerate(prompts))
+        )
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns the command-line parser; option defaults come from `settings`.
+    """
+    parser = argparse.ArgumentParser(
+        prog="agent_async.py",
+        description="Runs the agent on every prompt of a file concurrently, each in its own clone of the workspace.",
+    )
+    parser.add_argument("prompts", help="file with one prompt per line")
+    add_common_arguments(parser)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.BATCH_CONCURRENCY,
+        help="sessions in flight at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--working-dir",
+        default=settings.WORKING_DIR,
+        help="directory each session gets a clone of (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workspaces",
+        metavar="DIR",
+        default=settings.BATCH_WORKSPACES_DIR,
+        help="directory the clones are created in (default: next to the working directory)",
+    )
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    settings.MODEL_ID = args.model
+    settings.MAX_ITERS = args.max_iters
+    settings.RATE_LIMIT_RPM = args.rate_limit
+    settings.HEDGE_REQUESTS = args.hedge or settings.HEDGE_REQUESTS
+    settings.WORKING_DIR = args.working_dir
+
+    with open(args.prompts, "r", encoding="utf-8") as f:
+        prompts = [line.strip() for line in f if line.strip()]
+
+    configure_tracing(args.trace)
+    results = asyncio.run(
+        run_batch(
+            prompts,
+            concurrency=args.concurrency,
+            verbose=args.verbose,
+            workspaces_dir=args.workspaces,
+        )
+    )
+    configure_tracing(None)
+
+    for prompt, result in zip(prompts, results):
+        print(f"Prompt: {prompt}")
+        print(f"Response: {result}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import os
+import tempfile
+
+import settings
+
+
+def _read_umask() -> int:
+    # os.umask can only be read by setting it, so do it once at import rather than while tools run in threads.
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+UMASK = _read_umask()
+
+
+def atomic_write(path: str, content: str, fsync: bool = settings.FSYNC_WRITES) -> None:
+    """
+    Replaces the file at `path` with `content` so readers only ever see the old or the new version.
+
+    Args:
+        path (str): Absolute path of the file to write. Parent directories are created as needed.
+        content (str): The new text content, written as UTF-8.
+        fsync (bool, optional): If True, flushes the data and the directory entry to disk before returning.
+            Defaults to `settings.FSYNC_WRITES`.
+
+    Raises:
+        OSError: If the file cannot be written; the original file is left untouched.
+
+    Notes:
+        - Content goes to a temporary file in the same directory, which is then renamed over `path`.
+        - The permissions of an existing file are kept.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = None
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        else:
+            os.chmod(temp_path, 0o666 & ~UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+    if fsync:
+        _fsync_directory(directory)
+
+
+def atomic_delete(path: str, fsync: bool = settings.FSYNC_WRITES) -> None:
+    """
+    Deletes the file at `path`, flushing the directory entry to disk if `fsync` is True.
+    """
+    os.remove(path)
+    if fsync:
+        _fsync_directory(os.path.dirname(path))
+
+
+def _fsync_directory(directory: str) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
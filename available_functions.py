@@ -2,15 +2,18 @@ from functions.get_files_info import schema_get_files_info
 from functions.write_file import schema_write_file
 from functions.run_python_file import schema_run_python_file
 from functions.get_file_content import schema_get_file_content
+from functions.search_workspace import schema_search_workspace
+from functions.apply_patch import schema_apply_patch
 
-
-from google.genai import types
-
-available_functions = types.Tool(
-    function_declarations=[
+# Plain dicts, validated into a `types.Tool` by `types.GenerateContentConfig`,
+# so declaring the tools does not import the SDK.
+available_functions: dict = {
+    "function_declarations": [
         schema_get_files_info,
         schema_write_file,
         schema_run_python_file,
         schema_get_file_content,
+        schema_search_workspace,
+        schema_apply_patch,
     ]
-)
+}
@@ -0,0 +1,511 @@
+"""
+Runs the agent over many prompts in a process pool, each task in its own clone of the workspace.
+
+Tasks are read from a JSONL file, one per line, either a bare JSON string (the prompt) or an
+object: {"prompt": ..., "id": ..., "working_dir": ..., "model": ...}, where only "prompt" is
+required. Each task works in a clone of its working directory under the workspaces directory,
+so tasks can edit files without seeing each other's changes. One JSONL result is written per
+task as it finishes, with its final response, summary, changed files and timings.
+
+Unlike `agent_async.run_batch`, which drives sessions concurrently in one interpreter, every
+task here gets its own process, and tasks can work on different directories.
+
+Usage:
+    python batch.py tasks.jsonl [-o results.jsonl] [--workers N] [--clone MODE] [--workspaces DIR]
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import settings
+
+FICLONE = 0x40049409  # Linux ioctl sharing a file's blocks between two files
+TASK_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]+$")
+
+
+def _reflink(source: str, destination: str) -> None:
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+    shutil.copystat(source, destination)
+
+
+CLONERS = {
+    "reflink": _reflink,
+    "hardlink": os.link,
+    "copy": shutil.copy2,
+}
+CLONE_FALLBACKS = {
+    # Hardlinks are never a fallback: a file written in place would change the source too.
+    "auto": ["reflink", "copy"],
+    "reflink": ["reflink"],
+    "hardlink": ["hardlink"],
+    "copy": ["copy"],
+}
+
+
+def clone_workspace(
+    source: str, destination: str, mode: str = settings.BATCH_CLONE_MODE
+) -> str:
+    """
+    Clones a directory tree without copying file contents where the file system allows it.
+
+    Args:
+        source (str): The workspace to clone.
+        destination (str): Where the clone is created; must not exist yet.
+        mode (str, optional): "reflink", "hardlink", "copy", or "auto" for a reflink where the file system
+            supports it and a copy otherwise. Defaults to `settings.BATCH_CLONE_MODE`.
+
+    Returns:
+        str: The clone method that ended up being used.
+
+    Raises:
+        OSError: If the clone cannot be created with the requested method.
+
+    Notes:
+        - Reflinks share blocks until either file is written, so they are true copy-on-write clones.
+        - Hardlinks share the file itself, so they are only used when asked for. This is safe for
+          the agent's own edits, which `atomic_io.atomic_write` makes by replacing the file, but a
+          program started by `run_python_file` that writes a file in place also changes the source
+          workspace and every other clone of it.
+        - Symlinks are recreated as symlinks.
+    """
+    methods = list(CLONE_FALLBACKS[mode])
+    source = os.path.abspath(source)
+    os.makedirs(destination)
+    for dirpath, dirnames, filenames in os.walk(source):
+        target_dir = os.path.join(destination, os.path.relpath(dirpath, source))
+        for name in list(dirnames):
+            if os.path.islink(os.path.join(dirpath, name)):
+                dirnames.remove(name)
+                filenames.append(name)
+            else:
+                os.mkdir(os.path.join(target_dir, name))
+        for name in filenames:
+            src = os.path.join(dirpath, name)
+            dst = os.path.join(target_dir, name)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+                continue
+            while True:
+                try:
+                    CLONERS[methods[0]](src, dst)
+                    break
+                except OSError:
+                    if len(methods) == 1:
+                        raise
+                    methods.pop(0)
+        shutil.copystat(dirpath, target_dir)
+    return methods[0]
+
+
+def _tree_stats(root: str) -> dict[str, tuple[int, int, int]]:
+    stats = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                stat = os.lstat(path)
+            except OSError:
+                continue
+            stats[os.path.relpath(path, root)] = (
+                stat.st_mtime_ns,
+                stat.st_size,
+                stat.st_ino,
+            )
+    return stats
+
+
+def workspace_changes(
+    source: str, clone: str, baseline: dict[str, tuple[int, int, int]] | None = None
+) -> dict[str, list[str]]:
+    """
+    Lists the files added, modified and deleted in a clone.
+
+    Args:
+        source (str): The workspace the clone was made from.
+        clone (str): The clone.
+        baseline (dict | None, optional): `_tree_stats` of the clone taken right after cloning. Defaults to None.
+
+    Returns:
+        dict[str, list[str]]: Relative paths under "added", "modified" and "deleted".
+
+    Notes:
+        - With a baseline, files are compared by mtime, size and inode, so a file replaced by an
+          atomic write is caught even if its mtime and size match, and so is a hardlinked file
+          written in place, whose source changed along with it.
+        - Without one, the clone is compared with the source by mtime and size; inodes of a copy
+          always differ from the source's.
+    """
+    after = _tree_stats(clone)
+    if baseline is not None:
+        before = baseline
+    else:
+        before = {path: stat[:2] for path, stat in _tree_stats(source).items()}
+        after = {path: stat[:2] for path, stat in after.items()}
+    return {
+        "added": sorted(after.keys() - before.keys()),
+        "modified": sorted(
+            path for path in after.keys() & before.keys() if after[path] != before[path]
+        ),
+        "deleted": sorted(before.keys() - after.keys()),
+    }
+
+
+def read_tasks(path: str) -> list[dict]:
+    """
+    Reads and validates a tasks file.
+
+    Args:
+        path (str): JSONL file with one prompt string or task object per line; blank lines are skipped.
+
+    Returns:
+        list[dict]: Tasks with "id", "prompt" and "working_dir" filled in.
+
+    Raises:
+        ValueError: If a line is not valid JSON, has no prompt, or repeats or misuses an id.
+    """
+    tasks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                task = json.loads(line)
+            except json.JSONDecodeError as err:
+                raise ValueError(f"line {line_number}: {err}") from err
+            if isinstance(task, str):
+                task = {"prompt": task}
+            if not isinstance(task, dict) or not isinstance(task.get("prompt"), str):
+                raise ValueError(f"line {line_number}: expected a prompt")
+            task.setdefault("id", f"task-{len(tasks):04d}")
+            task.setdefault("working_dir", settings.WORKING_DIR)
+            if not TASK_ID_PATTERN.match(str(task["id"])):
+                raise ValueError(
+                    f"line {line_number}: id {task['id']!r} is not a valid directory name"
+                )
+            tasks.append(task)
+
+    ids = [task["id"] for task in tasks]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate task ids: {', '.join(duplicates)}")
+    return tasks
+
+
+def _final_response(contents: list) -> str | None:
+    for content in reversed(contents):
+        if content.role == "model":
+            text = "".join(part.text or "" for part in content.parts or [])
+            return text.strip() or None
+    return None
+
+
+_client = None
+
+
+def _init_worker(overrides: dict) -> None:
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+
+def _make_client(replay: str | None):
+    global _client
+    if replay:
+        from replay import ReplayClient
+
+        client = ReplayClient(replay)
+    else:
+        if _client is None:
+            from dotenv import load_dotenv
+            from google import genai
+
+            load_dotenv()
+            _client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        client = _client
+
+    from resilience import ResilientClient
+
+    return ResilientClient(client)
+
+
+def run_task(
+    task: dict,
+    workspace: str,
+    clone_mode: str = settings.BATCH_CLONE_MODE,
+    replay: str | None = None,
+    submitted: float | None = None,
+) -> dict:
+    """
+    Clones the task's working directory and runs the agent on it; called in a worker process.
+
+    Args:
+        task (dict): The task, as returned by `read_tasks`.
+        workspace (str): Where the clone is created.
+        clone_mode (str, optional): Passed to `clone_workspace`. Defaults to `settings.BATCH_CLONE_MODE`.
+        replay (str | None, optional): Recording to replay instead of calling the API. Defaults to None.
+        submitted (float | None, optional): `time.time()` when the task was queued. Defaults to None.
+
+    Returns:
+        dict: The result line; "status" is "error" with an "error" message if the task failed.
+
+    Notes:
+        - The agent's output goes to `<workspace>.log` rather than the batch's stdout.
+    """
+    from main import run_agent
+    from routing import TurnSignals, load_router
+    from summary import SessionSummary
+
+    start = time.perf_counter()
+    result = {
+        "id": task["id"],
+        "prompt": task["prompt"],
+        "workspace": workspace,
+        "log": f"{workspace}.log",
+        "status": "ok",
+        "timing": {
+            "queued_s": round(time.time() - submitted, 3) if submitted else None
+        },
+    }
+    timing = result["timing"]
+    default_model = settings.MODEL_ID
+    try:
+        result["clone_mode"] = clone_workspace(
+            task["working_dir"], workspace, clone_mode
+        )
+        baseline = _tree_stats(workspace)
+        timing["clone_s"] = round(time.perf_counter() - start, 3)
+
+        settings.WORKING_DIR = workspace
+        settings.MODEL_ID = task.get("model") or default_model
+        client = _make_client(replay)
+        summary = SessionSummary(
+            client,
+            model=load_router().choose(TurnSignals(0, "summary", 0, 0)).model,
+            # Rolling updates would take the answers of a replay, see main.main.
+            mode="template" if replay and settings.SUMMARY_MODE == "rolling" else None,
+        )
+        with (
+            open(result["log"], "w", encoding="utf-8") as log,
+            contextlib.redirect_stdout(log),
+        ):
+            agent_start = time.perf_counter()
+            contents = run_agent(client, task["prompt"], summary=summary)
+            timing["agent_s"] = round(time.perf_counter() - agent_start, 3)
+            result["response"] = _final_response(contents)
+            result["turns"] = sum(content.role == "model" for content in contents)
+
+            summary_start = time.perf_counter()
+            result["summary"] = summary.result(contents)
+            timing["summary_s"] = round(time.perf_counter() - summary_start, 3)
+        result["changes"] = workspace_changes(task["working_dir"], workspace, baseline)
+        result["model_calls"] = client.stats
+    except Exception as err:
+        result["status"] = "error"
+        result["error"] = f"{type(err).__name__}: {err}"
+    finally:
+        settings.MODEL_ID = default_model
+    timing["total_s"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def run_tasks(
+    tasks: list[dict],
+    output,
+    workers: int = settings.BATCH_WORKERS,
+    clone_mode: str = settings.BATCH_CLONE_MODE,
+    workspaces_dir: str | None = settings.BATCH_WORKSPACES_DIR,
+    replay: str | None = None,
+) -> list[dict]:
+    """
+    Runs tasks across a process pool, writing each result to `output` as soon as it is done.
+
+    Args:
+        tasks (list[dict]): Tasks as returned by `read_tasks`.
+        output (TextIO): Stream the JSONL results are written to.
+        workers (int, optional): Worker processes. Defaults to `settings.BATCH_WORKERS`.
+        clone_mode (str, optional): Passed to `clone_workspace`. Defaults to `settings.BATCH_CLONE_MODE`.
+        workspaces_dir (str | None, optional): Directory the clones are created in. Defaults to
+            `settings.BATCH_WORKSPACES_DIR`, or when that is None, a directory next to each task's
+            working directory, so clones are on the same file system and can share its blocks.
+        replay (str | None, optional): Recording every task replays instead of calling the API. Defaults to None.
+
+    Returns:
+        list[dict]: The results, in the order of `tasks`.
+
+    Notes:
+        - Each worker has its own rate limiter, so `settings.RATE_LIMIT_RPM` is split evenly between them.
+        - Clones are kept after the run so the changes can be inspected.
+    """
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    # Workers may be spawned rather than forked, so settings changed here are passed on.
+    overrides = {
+        name: getattr(settings, name) for name in dir(settings) if name.isupper()
+    }
+    if settings.RATE_LIMIT_RPM:
+        overrides["RATE_LIMIT_RPM"] = settings.RATE_LIMIT_RPM / workers
+
+    results: list[dict | None] = [None] * len(tasks)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(overrides,)
+    ) as pool:
+        futures = {}
+        for index, task in enumerate(tasks):
+            source = os.path.abspath(task["working_dir"])
+            root = workspaces_dir or os.path.join(
+                os.path.dirname(source), f".{os.path.basename(source)}-batch"
+            )
+            workspace = os.path.join(os.path.abspath(root), stamp, task["id"])
+            os.makedirs(os.path.dirname(workspace), exist_ok=True)
+            future = pool.submit(
+                run_task,
+                {**task, "working_dir": source},
+                workspace,
+                clone_mode,
+                replay,
+                time.time(),
+            )
+            futures[future] = index
+
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as err:
+                # The worker process died, e.g. killed by the OOM killer.
+                result = {
+                    "id": tasks[index]["id"],
+                    "prompt": tasks[index]["prompt"],
+                    "status": "error",
+                    "error": f"{type(err).__name__}: {err}",
+                }
+            result["index"] = index
+            results[index] = result
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            total = result.get("timing", {}).get("total_s")
+            print(
+                f"[{done}/{len(tasks)}] {result['id']}: {result['status']}"
+                + (f" in {total:.1f}s" if total is not None else ""),
+                file=sys.stderr,
+            )
+    return results  # type: ignore
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="batch.py",
+        description="Runs the agent on every task of a JSONL file, each in its own clone of the workspace.",
+    )
+    parser.add_argument(
+        "tasks", help="JSONL file with one prompt or task object per line"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="F",
+        help="JSONL file the results are written to (default: stdout)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.BATCH_WORKERS,
+        help="worker processes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--clone",
+        choices=sorted(CLONE_FALLBACKS),
+        default=settings.BATCH_CLONE_MODE,
+        help="how workspaces are cloned (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--workspaces",
+        metavar="DIR",
+        default=settings.BATCH_WORKSPACES_DIR,
+        help="directory the clones are created in (default: next to each working directory)",
+    )
+    parser.add_argument(
+        "--model",
+        default=settings.MODEL_ID,
+        help="model for tasks that do not name one (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-iters",
+        type=int,
+        default=settings.MAX_ITERS,
+        help="maximum number of model turns per task (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        metavar="RPM",
+        default=settings.RATE_LIMIT_RPM,
+        help="maximum model requests per minute across all workers (default: unlimited)",
+    )
+    parser.add_argument(
+        "--summary",
+        choices=["rolling", "template", "full", "none"],
+        default=settings.SUMMARY_MODE,
+        help="how each task's summary is made (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="F",
+        help="replays model responses from F in every task instead of calling the API",
+    )
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    settings.MODEL_ID = args.model
+    settings.MAX_ITERS = args.max_iters
+    settings.RATE_LIMIT_RPM = args.rate_limit
+    settings.SUMMARY_MODE = args.summary
+
+    try:
+        tasks = read_tasks(args.tasks)
+    except (OSError, ValueError) as err:
+        print(f"Error: cannot read tasks from {args.tasks}: {err}")
+        sys.exit(1)
+
+    with contextlib.ExitStack() as stack:
+        output = (
+            stack.enter_context(open(args.output, "w", encoding="utf-8"))
+            if args.output
+            else sys.stdout
+        )
+        results = run_tasks(
+            tasks,
+            output,
+            workers=args.workers,
+            clone_mode=args.clone,
+            workspaces_dir=args.workspaces,
+            replay=args.replay,
+        )
+
+    failed = sum(result["status"] != "ok" for result in results)
+    print(
+        f"{len(results) - failed} of {len(results)} task(s) succeeded", file=sys.stderr
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+End-to-end benchmarks of the agent loop, replaying scripted model turns offline.
+
+Each scenario is a list of model turns turned into a replay recording, run through
+`main.run_agent` against a generated workspace. Reported per scenario: per-iteration
+latency, tool execution time by function, time spent serializing `contents` and its
+final size, and peak Python memory.
+
+Usage:
+    python benchmarks/bench_agent.py [--scenario=NAME] [--repeat=N] [--json]
+"""
+
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types
+
+import main
+import settings
+from replay import ReplayClient
+
+CALCULATOR_FILES = {
+    "main.py": """\
+import sys
+
+from pkg.calculator import Calculator
+from pkg.render import render
+
+
+def main():
+    calculator = Calculator()
+    if len(sys.argv) <= 1:
+        print("Calculator App")
+        print('Usage: python main.py "<expression>"')
+        return
+    expression = " ".join(sys.argv[1:])
+    result = calculator.evaluate(expression)
+    print(render(expression, result))
+
+
+if __name__ == "__main__":
+    main()
+""",
+    "pkg/__init__.py": "",
+    "pkg/calculator.py": """\
+class Calculator:
+    def __init__(self):
+        self.operators = {
+            "+": lambda a, b: a + b,
+            "-": lambda a, b: a - b,
+            "*": lambda a, b: a * b,
+            "/": lambda a, b: a / b,
+        }
+        self.precedence = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+    def evaluate(self, expression):
+        if not expression or expression.isspace():
+            return None
+        return self._evaluate_infix(expression.strip().split())
+
+    def _evaluate_infix(self, tokens):
+        values = []
+        operators = []
+        for token in tokens:
+            if token in self.operators:
+                while (
+                    operators
+                    and operators[-1] in self.operators
+                    and self.precedence[operators[-1]] >= self.precedence[token]
+                ):
+                    self._apply_operator(operators, values)
+                operators.append(token)
+            else:
+                values.append(float(token))
+        while operators:
+            self._apply_operator(operators, values)
+        return values[0]
+
+    def _apply_operator(self, operators, values):
+        operator = operators.pop()
+        b = values.pop()
+        a = values.pop()
+        values.append(self.operators[operator](a, b))
+""",
+    "pkg/render.py": """\
+def render(expression, result):
+    if isinstance(result, float) and result.is_integer():
+        result = int(result)
+    return f"{expression} = {result}"
+""",
+    "tests.py": """\
+import unittest
+
+from pkg.calculator import Calculator
+
+
+class TestCalculator(unittest.TestCase):
+    def setUp(self):
+        self.calculator = Calculator()
+
+    def test_addition(self):
+        self.assertEqual(self.calculator.evaluate("3 + 5"), 8)
+
+    def test_precedence(self):
+        self.assertEqual(self.calculator.evaluate("3 + 7 * 2"), 17)
+
+    def test_division(self):
+        self.assertEqual(self.calculator.evaluate("10 / 4"), 2.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
+""",
+    "lorem.txt": "Lorem ipsum dolor sit amet, consectetur adipiscing elit.\n" * 400,
+}
+
+
+def call(name: str, **args) -> types.Part:
+    return types.Part(function_call=types.FunctionCall(name=name, args=args))
+
+
+def text(value: str) -> types.Part:
+    return types.Part(text=value)
+
+
+def turn(*parts: types.Part, prompt_tokens: int = 0) -> dict:
+    response = types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(content=types.Content(role="model", parts=list(parts)))
+        ],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens, candidates_token_count=20
+        ),
+    )
+    return {
+        "model": settings.MODEL_ID,
+        "response": response.model_dump(mode="json", exclude_none=True),
+    }
+
+
+def calculator_scenario() -> list[dict]:
+    return [
+        turn(
+            call("get_files_info", max_depth=3),
+            call("get_file_content", file_path="main.py"),
+            call("get_file_content", file_path="pkg/calculator.py"),
+            call("get_file_content", file_path="pkg/render.py"),
+        ),
+        turn(call("run_python_file", file_path="tests.py")),
+        turn(call("search_workspace", query="precedence")),
+        turn(
+            call(
+                "apply_patch",
+                edits=[
+                    {
+                        "file_path": "pkg/render.py",
+                        "search": 'return f"{expression} = {result}"',
+                        "replace": 'return f"{expression.strip()} = {result}"',
+                    }
+                ],
+            )
+        ),
+        turn(
+            call("run_python_file", file_path="tests.py"),
+            call("get_file_content", file_path="pkg/render.py"),
+        ),
+        turn(
+            text("The calculator passes its tests; render now strips the expression.")
+        ),
+    ]
+
+
+def long_session_scenario() -> list[dict]:
+    turns = []
+    for i in range(settings.MAX_ITERS - 1):
+        turns.append(
+            turn(
+                call("get_file_content", file_path="lorem.txt", offset=i * 1000),
+                call("get_files_info"),
+            )
+        )
+    turns.append(turn(text("Done reading.")))
+    return turns
+
+
+def write_heavy_scenario() -> list[dict]:
+    turns = []
+    for i in range(10):
+        turns.append(
+            turn(
+                call(
+                    "write_file",
+                    file_path=f"gen/module_{i}.py",
+                    content=f"VALUE = {i}\n" * 200,
+                ),
+                call("get_file_content", file_path=f"gen/module_{i}.py"),
+                call("run_python_file", file_path=f"gen/module_{i}.py"),
+            )
+        )
+    turns.append(turn(text("Generated ten modules.")))
+    return turns
+
+
+SCENARIOS = {
+    "calculator": calculator_scenario,
+    "long_session": long_session_scenario,
+    "write_heavy": write_heavy_scenario,
+}
+
+
+def make_workspace(root: str) -> None:
+    for rel_path, content in CALCULATOR_FILES.items():
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+
+
+def run_scenario(name: str) -> dict:
+    tool_times: dict[str, list[float]] = {}
+    original_call_function = main.call_function
+
+    def timed_call_function(function_call_part, verbose=False, cache=None):
+        start = time.perf_counter()
+        try:
+            return original_call_function(
+                function_call_part, verbose=verbose, cache=cache
+            )
+        finally:
+            tool_times.setdefault(function_call_part.name, []).append(
+                time.perf_counter() - start
+            )
+
+    with tempfile.TemporaryDirectory() as workspace:
+        make_workspace(workspace)
+        previous_working_dir = settings.WORKING_DIR
+        settings.WORKING_DIR = workspace
+        main.call_function = timed_call_function
+        client = ReplayClient(records=SCENARIOS[name]())
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                contents = main.run_agent(client, f"Benchmark scenario {name}")
+        finally:
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            main.call_function = original_call_function
+            settings.WORKING_DIR = previous_working_dir
+
+    starts = [c["started"] for c in client.calls] + [start + elapsed]
+    iterations = [b - a for a, b in zip(starts, starts[1:])]
+    return {
+        "scenario": name,
+        "iterations": len(client.calls),
+        "contents": len(contents),
+        "total_s": elapsed,
+        "iteration_mean_ms": statistics.mean(iterations) * 1000,
+        "iteration_max_ms": max(iterations) * 1000,
+        "tool_ms": {
+            tool: sum(times) * 1000 for tool, times in sorted(tool_times.items())
+        },
+        "serialize_ms": sum(c["serialize_time"] for c in client.calls) * 1000,
+        "final_request_bytes": client.calls[-1]["request_bytes"],
+        "peak_memory_mb": peak / 1024 / 1024,
+    }
+
+
+def main_benchmark():
+    names = list(SCENARIOS)
+    repeat = 1
+    as_json = "--json" in sys.argv
+    for arg in sys.argv[1:]:
+        if arg.startswith("--scenario="):
+            names = [arg.split("=", 1)[1]]
+        elif arg.startswith("--repeat="):
+            repeat = int(arg.split("=", 1)[1])
+
+    for name in names:
+        for _ in range(repeat):
+            result = run_scenario(name)
+            if as_json:
+                print(json.dumps(result))
+                continue
+            print(f"== {name}")
+            print(f"  iterations          {result['iterations']}")
+            print(f"  total               {result['total_s'] * 1000:10.1f} ms")
+            print(
+                f"  iteration mean/max  {result['iteration_mean_ms']:10.1f} / {result['iteration_max_ms']:.1f} ms"
+            )
+            for tool, ms in result["tool_ms"].items():
+                print(f"  tool {tool:<18} {ms:10.1f} ms")
+            print(f"  serialize contents  {result['serialize_ms']:10.1f} ms")
+            print(f"  final request size  {result['final_request_bytes']:10d} bytes")
+            print(f"  peak memory         {result['peak_memory_mb']:10.1f} MB")
+
+
+if __name__ == "__main__":
+    main_benchmark()
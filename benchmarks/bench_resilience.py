@@ -0,0 +1,191 @@
+"""
+Fault-injection benchmark for `resilience.ResilientClient`.
+
+Starts a local HTTP server that speaks the `generateContent` endpoint of the Gemini API,
+failing a share of requests with 429 or 503 and delaying a share of them by a long tail.
+A real `genai.Client` is pointed at it, and the same number of calls is made plainly,
+with retries, and with retries and hedging. Prints success rate, retries, hedges and
+latency percentiles for each.
+
+Usage:
+    python benchmarks/bench_resilience.py [--calls=N] [--error-rate=F] [--slow-rate=F] [--slow-ms=N] [--json]
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai
+from google.genai import types
+
+import resilience
+import settings
+from resilience import ResilientClient
+
+MODEL = "gemini-2.5-flash"
+
+RESPONSE = {
+    "candidates": [
+        {
+            "content": {"role": "model", "parts": [{"text": "ok"}]},
+            "finishReason": "STOP",
+        }
+    ],
+    "usageMetadata": {
+        "promptTokenCount": 10,
+        "candidatesTokenCount": 1,
+        "totalTokenCount": 11,
+    },
+}
+
+
+class FaultInjector:
+    def __init__(self, error_rate: float, slow_rate: float, slow_ms: int, fast_ms: int):
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.fast_ms = fast_ms
+        self.requests = 0
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+    def decide(self) -> tuple[int, float]:
+        """
+        Returns the status code and the delay in seconds of the next response.
+        """
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            delay = (
+                self.slow_ms
+                if self._random.random() < self.slow_rate
+                else self._random.uniform(0.5, 1.5) * self.fast_ms
+            )
+        if roll < self.error_rate / 2:
+            return 429, delay / 1000
+        if roll < self.error_rate:
+            return 503, delay / 1000
+        return 200, delay / 1000
+
+
+def make_handler(faults: FaultInjector):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status, delay = faults.decide()
+            time.sleep(delay)
+            if status == 200:
+                body = json.dumps(RESPONSE).encode("utf-8")
+            else:
+                body = json.dumps(
+                    {"error": {"code": status, "message": "injected", "status": "X"}}
+                ).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # a hedged call that lost the race
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def run_calls(client, calls: int) -> dict:
+    latencies = []
+    failures = 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            client.models.generate_content(model=MODEL, contents="ping")
+        except Exception:
+            failures += 1
+            continue
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    def percentile(p: float) -> float:
+        if not latencies:
+            return float("nan")
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    return {
+        "success_rate": (calls - failures) / calls,
+        "p50_ms": statistics.median(latencies) if latencies else float("nan"),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+def main_benchmark():
+    options = {
+        "calls": 200,
+        "error-rate": 0.1,
+        "slow-rate": 0.05,
+        "slow-ms": 1000,
+        "fast-ms": 20,
+    }
+    as_json = "--json" in sys.argv
+    for arg in sys.argv[1:]:
+        name, _, value = arg.lstrip("-").partition("=")
+        if name in options:
+            options[name] = type(options[name])(value)
+
+    faults = FaultInjector(
+        options["error-rate"],
+        options["slow-rate"],
+        options["slow-ms"],
+        options["fast-ms"],
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(faults))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    raw = genai.Client(
+        api_key="benchmark",
+        http_options=types.HttpOptions(
+            base_url=f"http://127.0.0.1:{server.server_address[1]}"
+        ),
+    )
+
+    settings.RETRY_BASE_DELAY = 0.05
+    settings.RETRY_MAX_DELAY = 1.0
+    variants = {
+        "no retries": (raw, False),
+        "retries": (ResilientClient(raw), False),
+        "retries + hedging": (ResilientClient(raw), True),
+    }
+    for name, (client, hedge) in variants.items():
+        settings.HEDGE_REQUESTS = hedge
+        requests_before = faults.requests
+        result = {"variant": name, **run_calls(client, options["calls"])}
+        result["requests"] = faults.requests - requests_before
+        if isinstance(client, ResilientClient):
+            result.update(client.stats)
+        if as_json:
+            print(json.dumps(result))
+            continue
+        print(f"== {name}")
+        print(f"  success rate          {result['success_rate']:10.1%}")
+        print(f"  requests sent         {result['requests']:10d}")
+        for key in ("retries", "hedges", "hedge_wins"):
+            if key in result:
+                print(f"  {key:<21} {result[key]:10d}")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            print(f"  {key:<21} {result[key]:10.1f}")
+
+    server.shutdown()
+    resilience._get_hedge_pool().shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,100 @@
+"""
+CLI startup benchmark based on `python -X importtime`.
+
+Runs each command in a fresh interpreter, parses the import-time report written to
+stderr and prints the wall time, the total import time, whether the SDK was loaded,
+and the slowest top-level imports.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat=N] [--top=N] [--json]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COMMANDS = {
+    "usage": ["main.py"],
+    "help": ["main.py", "--help"],
+    "import main": ["-c", "import main"],
+    "sdk only": ["-c", "import google.genai"],
+}
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """
+    Parses `-X importtime` output into (module, self us, cumulative us, nesting depth) rows.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def run_command(args: list[str]) -> dict:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    rows = parse_importtime(completed.stderr)
+    return {
+        "wall_ms": wall * 1000,
+        "import_ms": sum(row[1] for row in rows) / 1000,
+        "modules": len(rows),
+        "sdk_imported": any(row[0].startswith("google.genai") for row in rows),
+        "top": sorted(
+            ((row[0], row[2] / 1000) for row in rows if row[3] == 0),
+            key=lambda item: -item[1],
+        ),
+    }
+
+
+def main_benchmark():
+    repeat = 5
+    top = 8
+    as_json = "--json" in sys.argv
+    for arg in sys.argv[1:]:
+        if arg.startswith("--repeat="):
+            repeat = int(arg.split("=", 1)[1])
+        elif arg.startswith("--top="):
+            top = int(arg.split("=", 1)[1])
+
+    for name, args in COMMANDS.items():
+        runs = [run_command(args) for _ in range(repeat)]
+        result = {
+            "command": name,
+            "wall_ms": statistics.median(run["wall_ms"] for run in runs),
+            "import_ms": statistics.median(run["import_ms"] for run in runs),
+            "modules": runs[-1]["modules"],
+            "sdk_imported": runs[-1]["sdk_imported"],
+            "top": runs[-1]["top"][:top],
+        }
+        if as_json:
+            print(json.dumps(result))
+            continue
+        print(f"== {name}: python {' '.join(args)}")
+        print(f"  wall time (median)    {result['wall_ms']:10.1f} ms")
+        print(f"  import time (median)  {result['import_ms']:10.1f} ms")
+        print(f"  modules imported      {result['modules']:10d}")
+        print(
+            f"  google.genai loaded   {'yes' if result['sdk_imported'] else 'no':>10}"
+        )
+        for module, ms in result["top"]:
+            print(f"    {module:<30} {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main_benchmark()
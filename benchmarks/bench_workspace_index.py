@@ -0,0 +1,97 @@
+"""
+Benchmarks building, updating and querying the workspace index on a synthetic tree.
+
+Usage:
+    python benchmarks/bench_workspace_index.py [--files=50000]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workspace_index import WorkspaceIndex
+
+FILES_PER_DIR = 100
+
+MODULE_TEMPLATE = '''\
+import os
+
+
+class Widget{n}:
+    """Synthetic widget number {n}."""
+
+    def render_{n}(self, value):
+        return f"widget {n}: {{value}}"
+
+
+def helper_{n}(items):
+    total = 0
+    for item in items:
+        total += len(str(item))
+    return total
+'''
+
+
+def make_tree(root: str, files: int) -> None:
+    for n in range(files):
+        directory = os.path.join(root, f"pkg{n // FILES_PER_DIR:04d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"mod{n}.py"), "w", encoding="utf-8") as f:
+            f.write(MODULE_TEMPLATE.format(n=n))
+
+
+def timed(label: str, func, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<40} {elapsed * 1000:10.1f} ms")
+    return result
+
+
+def main():
+    files = 50000
+    for arg in sys.argv[1:]:
+        if arg.startswith("--files="):
+            files = int(arg.split("=", 1)[1])
+
+    with (
+        tempfile.TemporaryDirectory() as root,
+        tempfile.TemporaryDirectory() as index_dir,
+    ):
+        timed(f"generate {files} files", lambda: make_tree(root, files))
+
+        index = WorkspaceIndex(root, index_dir=index_dir)
+        timed("cold build", index.update)
+        timed("no-op update", index.update)
+
+        for n in range(0, files, max(files // 100, 1)):
+            path = os.path.join(root, f"pkg{n // FILES_PER_DIR:04d}", f"mod{n}.py")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(f"\n\ndef touched_{n}():\n    pass\n")
+        timed("incremental update (1% changed)", index.update)
+
+        timed("load from disk", lambda: WorkspaceIndex(root, index_dir=index_dir))
+
+        rare = f"widget {files // 2}:"
+        hits = timed(f'text query "{rare}"', lambda: index.search_text(rare), 20)
+        print(f"{'':<40} {len(hits)} hits")
+        timed('text query "total" (50 hits)', lambda: index.search_text("total"), 20)
+        hits = timed(
+            f'symbol query "helper_{files - 1}"',
+            lambda: index.search_symbols(f"helper_{files - 1}"),
+            20,
+        )
+        print(f"{'':<40} {len(hits)} hits")
+        timed(
+            'symbol query "touched" (50 hits)',
+            lambda: index.search_symbols("touched"),
+            20,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+from typing import Callable
+
+from google.genai import types
+
+import settings
+from functions.apply_patch import patched_paths
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(contents: list[types.Content]) -> int:
+    """
+    Roughly estimates the prompt tokens of a conversation without calling the API.
+
+    Args:
+        contents (list[types.Content]): The conversation.
+
+    Returns:
+        int: Estimated token count, assuming about four characters per token.
+    """
+    return (
+        sum(len(content.model_dump_json(exclude_none=True)) for content in contents)
+        // CHARS_PER_TOKEN
+    )
+
+
+def with_response(content: types.Content, index: int, response: dict) -> types.Content:
+    parts = list(content.parts or [])
+    function_response = parts[index].function_response
+    parts[index] = types.Part.from_function_response(
+        name=function_response.name or "Unknown", response=response  # type: ignore
+    )
+    return types.Content(role=content.role, parts=parts)
+
+
+def pair_calls(
+    contents: list[types.Content],
+) -> list[tuple[int, int, types.FunctionCall | None]]:
+    """
+    Pairs every function response in the conversation with the call that produced it.
+
+    Returns:
+        list[tuple[int, int, types.FunctionCall | None]]: (content index, part index, call) per response.
+    """
+    pairs = []
+    pending: list[types.FunctionCall] = []
+    for content_index, content in enumerate(contents):
+        for part_index, part in enumerate(content.parts or []):
+            if part.function_call:
+                pending.append(part.function_call)
+            elif part.function_response:
+                call = pending.pop(0) if pending else None
+                pairs.append((content_index, part_index, call))
+    return pairs
+
+
+def _call_path(call: types.FunctionCall | None) -> str | None:
+    if call is None or not call.args or not call.args.get("file_path"):
+        return None
+    return os.path.normpath(call.args["file_path"])
+
+
+def _drop_superseded_reads(contents: list[types.Content]) -> list[types.Content]:
+    """
+    Replaces `get_file_content` results for files that a later `write_file` or `apply_patch` changed.
+    """
+    pairs = pair_calls(contents)
+    written_after: set[str] = set()
+    stale: list[tuple[int, int, str]] = []
+    for content_index, part_index, call in reversed(pairs):
+        if call is not None and call.name == "apply_patch":
+            written_after.update(
+                patched_paths(
+                    (call.args or {}).get("patch"), (call.args or {}).get("edits")
+                )
+            )
+            continue
+        path = _call_path(call)
+        if path is None:
+            continue
+        if call.name == "write_file":  # type: ignore
+            written_after.add(path)
+        elif call.name == "get_file_content" and path in written_after:  # type: ignore
+            stale.append((content_index, part_index, path))
+
+    compacted = list(contents)
+    for content_index, part_index, path in stale:
+        compacted[content_index] = with_response(
+            compacted[content_index],
+            part_index,
+            {
+                "result": f'[Stale content of "{path}" dropped, it was overwritten later]'
+            },
+        )
+    return compacted
+
+
+def _turn_starts(contents: list[types.Content]) -> list[int]:
+    return [
+        index
+        for index, content in enumerate(contents)
+        if index > 0 and content.role == "model"
+    ]
+
+
+def _stub_old_outputs(
+    contents: list[types.Content], keep_from: int, min_chars: int
+) -> list[types.Content]:
+    """
+    Replaces large tool outputs before `keep_from` with a one-line stub.
+    """
+    compacted = list(contents)
+    for content_index, part_index, call in pair_calls(contents):
+        if content_index >= keep_from:
+            continue
+        part = compacted[content_index].parts[part_index]  # type: ignore
+        response = part.function_response.response or {}  # type: ignore
+        result = response.get("result")
+        if not isinstance(result, str) or len(result) <= min_chars:
+            continue
+        name = call.name if call else part.function_response.name  # type: ignore
+        args = call.args if call else {}
+        compacted[content_index] = with_response(
+            compacted[content_index],
+            part_index,
+            {
+                "result": f"[Compacted: {name}({args}) returned {len(result)} characters]"
+            },
+        )
+    return compacted
+
+
+def compact_contents(
+    contents: list[types.Content],
+    token_budget: int = settings.CONTEXT_TOKEN_BUDGET,
+    keep_recent_turns: int = settings.COMPACT_KEEP_TURNS,
+    min_chars: int = settings.COMPACT_MIN_CHARS,
+    summarise: Callable[[list[types.Content]], str | None] | None = None,
+    prompt_index: int = 0,
+) -> list[types.Content]:
+    """
+    Shrinks the conversation sent to the model once it exceeds a token budget.
+
+    Args:
+        contents (list[types.Content]): The conversation, starting with the user prompt.
+        token_budget (int, optional): Estimated prompt tokens allowed before compacting. Defaults to `settings.CONTEXT_TOKEN_BUDGET`.
+        keep_recent_turns (int, optional): Most recent model turns kept verbatim. Defaults to `settings.COMPACT_KEEP_TURNS`.
+        min_chars (int, optional): Tool outputs up to this size are never stubbed. Defaults to `settings.COMPACT_MIN_CHARS`.
+        summarise (Callable | None, optional): Summarises older turns when stubbing is not enough. Defaults to None.
+        prompt_index (int, optional): Index of the current run's user prompt, which comes after the
+            first one in a resumed session. Defaults to 0.
+
+    Returns:
+        list[types.Content]: The compacted conversation; `contents` itself is not modified.
+
+    Notes:
+        - File contents superseded by a later `write_file` or `apply_patch` are always dropped.
+        - Older large tool outputs are stubbed next; if the estimate is still over budget
+          and `summarise` is given, every turn before the recent ones is replaced by its summary.
+          The first prompt and the current one are kept verbatim ahead of the summary, so a
+          resumed session never loses the request it is working on.
+    """
+    compacted = _drop_superseded_reads(contents)
+    if estimate_tokens(compacted) <= token_budget:
+        return compacted
+
+    turn_starts = _turn_starts(compacted)
+    if len(turn_starts) <= keep_recent_turns:
+        return compacted
+    keep_from = turn_starts[-keep_recent_turns] if keep_recent_turns else len(compacted)
+
+    compacted = _stub_old_outputs(compacted, keep_from, min_chars)
+    if estimate_tokens(compacted) <= token_budget or summarise is None:
+        return compacted
+
+    summary = summarise(compacted[:keep_from])
+    if not summary:
+        return compacted
+
+    parts = list(compacted[0].parts or [])
+    parts.append(types.Part(text=f"Summary of the work done so far:\n{summary}"))
+    if 0 < prompt_index < keep_from:
+        parts.append(types.Part(text="Current request:"))
+        parts.extend(compacted[prompt_index].parts or [])
+    return [types.Content(role="user", parts=parts), *compacted[keep_from:]]
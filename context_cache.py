@@ -0,0 +1,238 @@
+"""
+Server-side context caching of the request prefix that stays the same for a whole session.
+
+The prefix is the system prompt, the tool declarations and, optionally, a snapshot of the
+small text files in the working directory. It is stored once with `client.caches.create`
+and every turn refers to it by name instead of resending it.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+from google import genai
+from google.genai import types
+
+import settings
+
+SKIPPED_DIRS = {".git", "__pycache__", ".venv", "venv", "node_modules"}
+
+
+def workspace_snapshot(
+    working_directory: str,
+    max_file_bytes: int = settings.SNAPSHOT_MAX_FILE_BYTES,
+    max_bytes: int = settings.SNAPSHOT_MAX_BYTES,
+) -> list[types.Content]:
+    """
+    Collects the small text files of the working directory into one user content.
+
+    Args:
+        working_directory (str): The directory to snapshot.
+        max_file_bytes (int, optional): Larger files are left out. Defaults to `settings.SNAPSHOT_MAX_FILE_BYTES`.
+        max_bytes (int, optional): Total size of the snapshot. Defaults to `settings.SNAPSHOT_MAX_BYTES`.
+
+    Returns:
+        list[types.Content]: The snapshot as a single content, or an empty list if no file qualified.
+
+    Notes:
+        - Files are visited in sorted order so the same tree always gives the same snapshot,
+          and with it the same cache key.
+    """
+    root = os.path.abspath(working_directory)
+    sections = []
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(
+            d for d in dirnames if d not in SKIPPED_DIRS and not d.startswith(".")
+        )
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            try:
+                if os.path.getsize(path) > max_file_bytes:
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            if total + len(text) > max_bytes:
+                continue
+            total += len(text)
+            sections.append(f'--- "{os.path.relpath(path, root)}" ---\n{text}')
+
+    if not sections:
+        return []
+    header = (
+        "Snapshot of the small text files in the working directory at the start of "
+        "this session. Tool results later in the conversation supersede it.\n\n"
+    )
+    return [
+        types.Content(
+            role="user", parts=[types.Part(text=header + "\n".join(sections))]
+        )
+    ]
+
+
+class ContextCache:
+    """
+    Keeps the stable request prefix in a server-side cached content.
+
+    Args:
+        client (genai.Client): The generative AI client; its `caches` interface is used.
+        config (types.GenerateContentConfig): Config holding the system instruction and tools.
+        snapshot (list[types.Content] | None, optional): Contents to cache after them, such as a
+            `workspace_snapshot`. Defaults to None.
+        ttl_seconds (int, optional): Lifetime of the cache. Defaults to `settings.CONTEXT_CACHE_TTL_SECONDS`.
+        min_tokens (int, optional): Estimated prefix size below which nothing is cached, as the API
+            rejects small caches. Defaults to `settings.CONTEXT_CACHE_MIN_TOKENS`.
+        verbose (bool, optional): If True, prints cache creation, refreshes and failures. Defaults to False.
+        enabled (bool, optional): If False, nothing is cached and `request` only prepends the snapshot. Defaults to True.
+
+    Notes:
+        - Caches are bound to a model, so one is kept per model the session uses, keyed on a hash
+          of the model and the prefix. A live cache with the same key, e.g. from an earlier
+          invocation, is reused. A changed prefix gets a new key, so a stale cache is never used.
+        - Caches are never deleted, only left to expire after `ttl_seconds`: the next invocation
+          can reuse them, and concurrent sessions sharing one (such as `batch.py` clones of the
+          same tree) never lose it to another session's teardown.
+        - The TTL is extended once less than `settings.CONTEXT_CACHE_REFRESH_SECONDS` remain.
+        - If the caching API fails, the session carries on sending the full prefix.
+    """
+
+    def __init__(
+        self,
+        client: genai.Client,
+        config: types.GenerateContentConfig,
+        snapshot: list[types.Content] | None = None,
+        ttl_seconds: int = settings.CONTEXT_CACHE_TTL_SECONDS,
+        min_tokens: int = settings.CONTEXT_CACHE_MIN_TOKENS,
+        verbose: bool = False,
+        enabled: bool = True,
+    ):
+        self.client = client
+        self.config = config
+        self.snapshot = snapshot or []
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self.verbose = verbose
+        self.cached: types.CachedContent | None = None
+        self.disabled = not enabled
+        self._caches: dict[str, types.CachedContent | None] = {}
+        self._prefix: str | None = None
+
+    def _prefix_json(self) -> str:
+        if self._prefix is None:
+            self._prefix = self._dump_prefix()
+        return self._prefix
+
+    def _dump_prefix(self) -> str:
+        return json.dumps(
+            [
+                self.config.model_dump(
+                    mode="json",
+                    exclude_none=True,
+                    include={"system_instruction", "tools"},
+                ),
+                [c.model_dump(mode="json", exclude_none=True) for c in self.snapshot],
+            ],
+            sort_keys=True,
+        )
+
+    def _log(self, message: str) -> None:
+        if self.verbose:
+            print(f"Context cache: {message}")
+
+    def _find(self, display_name: str) -> types.CachedContent | None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        for cached in self.client.caches.list():
+            if cached.display_name == display_name and (
+                cached.expire_time is None or cached.expire_time > now
+            ):
+                return cached
+        return None
+
+    def _create(self, model: str, key: str) -> types.CachedContent | None:
+        if len(self._prefix_json()) // 4 < self.min_tokens:
+            self._log(f"prefix under {self.min_tokens} tokens, not cached")
+            return None
+
+        display_name = f"cli-ai-tool-{key[:16]}"
+        cached = self._find(display_name)
+        if cached is not None:
+            self._log(f"reusing {cached.name}")
+            return cached
+
+        cached = self.client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                system_instruction=self.config.system_instruction,
+                tools=self.config.tools,
+                contents=self.snapshot or None,
+                ttl=f"{self.ttl_seconds}s",
+            ),
+        )
+        tokens = (
+            cached.usage_metadata.total_token_count if cached.usage_metadata else None
+        )
+        self._log(f"created {cached.name} for {model} ({tokens} tokens)")
+        return cached
+
+    def _refresh(self, cached: types.CachedContent) -> types.CachedContent:
+        if cached.expire_time is None:
+            return cached
+        remaining = cached.expire_time - datetime.datetime.now(datetime.timezone.utc)
+        if remaining.total_seconds() > settings.CONTEXT_CACHE_REFRESH_SECONDS:
+            return cached
+        cached = self.client.caches.update(
+            name=cached.name,  # type: ignore
+            config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+        )
+        self._log(f"extended {cached.name} by {self.ttl_seconds}s")
+        return cached
+
+    def _ensure(self, model: str) -> None:
+        key = hashlib.sha256(
+            f"{model}\n{self._prefix_json()}".encode("utf-8")
+        ).hexdigest()
+        if key not in self._caches:
+            self._caches[key] = self._create(model, key)
+        cached = self._caches[key]
+        if cached is not None:
+            cached = self._caches[key] = self._refresh(cached)
+        self.cached = cached
+
+    def request(
+        self, model: str, contents: list[types.Content]
+    ) -> tuple[types.GenerateContentConfig, list[types.Content]]:
+        """
+        Returns the config and contents to send for one turn.
+
+        Args:
+            model (str): The model the turn is sent to; caches are bound to a model.
+            contents (list[types.Content]): The conversation, without the snapshot.
+
+        Returns:
+            tuple[types.GenerateContentConfig, list[types.Content]]: With a live cache, a config referring
+            to it and `contents` unchanged; otherwise the full config and the snapshot followed by `contents`.
+        """
+        if not self.disabled:
+            try:
+                self._ensure(model)
+            except Exception as err:
+                self._log(f"disabled for this session after error: {err}")
+                self.disabled = True
+                self.cached = None
+
+        if self.cached is None:
+            return self.config, self.snapshot + contents
+        return (
+            self.config.model_copy(
+                update={
+                    "system_instruction": None,
+                    "tools": None,
+                    "cached_content": self.cached.name,
+                }
+            ),
+            contents,
+        )
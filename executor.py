@@ -0,0 +1,204 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable
+
+from google.genai import types
+
+import settings
+
+WRITE_FUNCTIONS = {"write_file", "apply_patch"}
+SUBPROCESS_FUNCTIONS = {"run_python_file"}
+
+
+def _call_path(function_call_part: types.FunctionCall) -> str:
+    """
+    Returns the normalised workspace path a function call operates on.
+
+    Args:
+        function_call_part (types.FunctionCall): The function call requested by the model.
+
+    Returns:
+        str: The relative path the call touches, "." meaning the whole working directory.
+
+    Notes:
+        - A program started by `run_python_file` may import or change any file, so it touches ".".
+    """
+    if function_call_part.name in SUBPROCESS_FUNCTIONS:
+        return "."
+    args: dict = function_call_part.args or {}
+    path = args.get("file_path") or args.get("directory") or "."
+    return os.path.normpath(path)
+
+
+def _paths_overlap(first: str, second: str) -> bool:
+    """
+    Checks whether two relative paths are the same or one contains the other.
+    """
+    if first == "." or second == "." or first == second:
+        return True
+    try:
+        return os.path.commonpath([first, second]) in (first, second)
+    except ValueError:
+        return True
+
+
+def _writes(function_call_part: types.FunctionCall) -> bool:
+    return (
+        function_call_part.name in WRITE_FUNCTIONS
+        or function_call_part.name in SUBPROCESS_FUNCTIONS
+    )
+
+
+def _dependencies(function_calls: list[types.FunctionCall], index: int) -> list[int]:
+    """
+    Returns indices of earlier calls that must finish before the call at `index` may run.
+
+    Two calls conflict when their paths overlap and at least one of them writes. A run counts
+    as a write to the whole working directory: it waits for earlier writes, and every later call waits for it.
+    """
+    call = function_calls[index]
+    path = _call_path(call)
+    dependencies = []
+    for earlier_index, earlier in enumerate(function_calls[:index]):
+        if not _writes(call) and not _writes(earlier):
+            continue
+        if _paths_overlap(path, _call_path(earlier)):
+            dependencies.append(earlier_index)
+    return dependencies
+
+
+def _run_after(
+    dependencies: list[Future],
+    call_function: Callable[..., types.Content],
+    function_call_part: types.FunctionCall,
+    verbose: bool,
+) -> types.Content:
+    wait(dependencies)
+    return call_function(function_call_part, verbose=verbose)
+
+
+class FunctionCallRunner:
+    """
+    Dispatches function calls to the tool pools as soon as they are known.
+
+    Args:
+        call_function (Callable): Dispatcher turning one function call into a tool response.
+        verbose (bool, optional): Passed through to `call_function`. Defaults to False.
+
+    Notes:
+        - File-system tools run on a thread pool of `settings.IO_WORKERS`,
+          `run_python_file` runs on a separate pool of `settings.SUBPROCESS_WORKERS`.
+        - Calls touching the same path are serialised when one of them writes,
+          so a `write_file` is always visible to a later read or run of that path.
+          Runs are serialised with every other call, since they may read or write any file.
+        - Dependencies only point at earlier calls and both pools are FIFO, so waiting cannot deadlock.
+        - Each call runs in a copy of the submitting thread's context, so tool spans nest under the current turn.
+    """
+
+    def __init__(
+        self, call_function: Callable[..., types.Content], verbose: bool = False
+    ):
+        self.call_function = call_function
+        self.verbose = verbose
+        self._io_pool = ThreadPoolExecutor(max_workers=settings.IO_WORKERS)
+        self._subprocess_pool = ThreadPoolExecutor(
+            max_workers=settings.SUBPROCESS_WORKERS
+        )
+        self._calls: list[types.FunctionCall] = []
+        self._futures: list[Future] = []
+
+    def submit(self, function_call_part: types.FunctionCall) -> None:
+        self._calls.append(function_call_part)
+        dependencies = [
+            self._futures[i] for i in _dependencies(self._calls, len(self._calls) - 1)
+        ]
+        pool = (
+            self._subprocess_pool
+            if function_call_part.name in SUBPROCESS_FUNCTIONS
+            else self._io_pool
+        )
+        self._futures.append(
+            pool.submit(
+                contextvars.copy_context().run,
+                _run_after,
+                dependencies,
+                self.call_function,
+                function_call_part,
+                self.verbose,
+            )
+        )
+
+    def results(self) -> list[types.Content]:
+        """
+        Waits for every submitted call and returns the tool responses in submission order.
+        """
+        return [future.result() for future in self._futures]
+
+    def shutdown(self) -> None:
+        self._io_pool.shutdown()
+        self._subprocess_pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+def run_function_calls(
+    function_calls: list[types.FunctionCall],
+    call_function: Callable[..., types.Content],
+    verbose: bool = False,
+) -> list[types.Content]:
+    """
+    Runs the function calls from a single model turn concurrently.
+
+    Args:
+        function_calls (list[types.FunctionCall]): Function calls in the order the model requested them.
+        call_function (Callable): Dispatcher turning one function call into a tool response.
+        verbose (bool, optional): Passed through to `call_function`. Defaults to False.
+
+    Returns:
+        list[types.Content]: Tool responses in the same order as `function_calls`.
+    """
+    if len(function_calls) <= 1:
+        return [call_function(call, verbose=verbose) for call in function_calls]
+
+    with FunctionCallRunner(call_function, verbose=verbose) as runner:
+        for call in function_calls:
+            runner.submit(call)
+        return runner.results()
+
+
+async def arun_function_calls(
+    function_calls: list[types.FunctionCall],
+    acall_function: Callable[..., Awaitable[types.Content]],
+    verbose: bool = False,
+) -> list[types.Content]:
+    """
+    Asyncio counterpart of `run_function_calls`.
+
+    Args:
+        function_calls (list[types.FunctionCall]): Function calls in the order the model requested them.
+        acall_function (Callable): Coroutine function turning one function call into a tool response.
+        verbose (bool, optional): Passed through to `acall_function`. Defaults to False.
+
+    Returns:
+        list[types.Content]: Tool responses in the same order as `function_calls`.
+
+    Notes:
+        - Uses the same path ordering rules as `run_function_calls`.
+    """
+    tasks: list[asyncio.Task] = []
+
+    async def run_after(dependencies: list[asyncio.Task], call: types.FunctionCall):
+        if dependencies:
+            await asyncio.wait(dependencies)
+        return await acall_function(call, verbose=verbose)
+
+    for index, call in enumerate(function_calls):
+        dependencies = [tasks[i] for i in _dependencies(function_calls, index)]
+        tasks.append(asyncio.create_task(run_after(dependencies, call)))
+    return list(await asyncio.gather(*tasks))
@@ -0,0 +1,504 @@
+"""
+Fast detection of a file's type and text encoding, and compact previews of files that are not text.
+
+`sniff` looks only at the first block of a file (`settings.SNIFF_BYTES`): magic numbers identify
+archives, images, executables and other known formats, the share of NUL and other control bytes
+separates binary data from text, and byte-order marks, the NUL pattern of UTF-16 and a strict
+UTF-8 decode pick the encoding of text. No detection library is needed and no file is read twice.
+
+`preview` describes a file that should not be read as text: a member list for zip and tar
+archives, the schema and row count for Parquet (read from the footer, plus the first rows if
+pyarrow is installed) and a hexdump of the first bytes for anything else. `csv_preview` gives the
+columns and first rows of a large CSV or TSV file.
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import os
+import struct
+import tarfile
+import zipfile
+import zlib
+from typing import NamedTuple
+
+import settings
+
+# (offset, magic bytes, kind, description); kinds other than "binary" have their own preview.
+MAGIC_NUMBERS = [
+    (0, b"PK\x03\x04", "zip", "Zip archive"),
+    (0, b"PK\x05\x06", "zip", "Zip archive (empty)"),
+    (0, b"\x1f\x8b", "compressed", "gzip compressed data"),
+    (4, b"1AY&SY", "compressed", "bzip2 compressed data"),
+    (0, b"\xfd7zXZ\x00", "compressed", "xz compressed data"),
+    (0, b"\x28\xb5\x2f\xfd", "binary", "zstd compressed data"),
+    (0, b"7z\xbc\xaf\x27\x1c", "binary", "7-zip archive"),
+    (257, b"ustar", "tar", "tar archive"),
+    (0, b"PAR1", "parquet", "Parquet file"),
+    (0, b"SQLite format 3\x00", "binary", "SQLite database"),
+    (0, b"%PDF-", "binary", "PDF document"),
+    (0, b"\x89PNG\r\n\x1a\n", "binary", "PNG image"),
+    (0, b"\xff\xd8\xff", "binary", "JPEG image"),
+    (0, b"GIF87a", "binary", "GIF image"),
+    (0, b"GIF89a", "binary", "GIF image"),
+    (0, b"\x7fELF", "binary", "ELF executable"),
+    (0, b"\xcf\xfa\xed\xfe", "binary", "Mach-O executable"),
+    (0, b"\x00asm", "binary", "WebAssembly module"),
+    (0, b"\x93NUMPY", "binary", "NumPy array"),
+]
+
+# Checked longest first, so a UTF-32 mark is not taken for a UTF-16 one.
+BYTE_ORDER_MARKS = [
+    (b"\xff\xfe\x00\x00", "utf-32-le"),
+    (b"\x00\x00\xfe\xff", "utf-32-be"),
+    (b"\xef\xbb\xbf", "utf-8"),
+    (b"\xff\xfe", "utf-16-le"),
+    (b"\xfe\xff", "utf-16-be"),
+]
+
+CSV_EXTENSIONS = {".csv": ",", ".tsv": "\t"}
+
+# Control characters that are common in text files.
+TEXT_CONTROL_BYTES = set(b"\t\n\v\f\r\b\x1b")
+
+# A damaged file makes the format's reader fail in its own way; the preview then falls back to a hexdump.
+PREVIEW_ERRORS = (
+    OSError,
+    ValueError,
+    lzma.LZMAError,
+    zlib.error,
+    EOFError,
+    IndexError,
+    KeyError,
+    struct.error,
+    zipfile.BadZipFile,
+    tarfile.TarError,
+    csv.Error,
+)
+
+
+class FileType(NamedTuple):
+    kind: str  # "text", "csv", "zip", "tar", "compressed", "parquet" or "binary"
+    description: str
+    encoding: str | None = None  # codec of text, without BOM handling
+    bom: int = 0  # length of the byte-order mark text starts after
+
+
+def newline_bytes(encoding: str | None) -> bytes:
+    """
+    Returns how a newline is encoded in `encoding`.
+    """
+    return "\n".encode(encoding or "utf-8")
+
+
+def _utf16_without_bom(head: bytes) -> str | None:
+    """
+    Recognises BOM-less UTF-16 of mostly ASCII text by its NULs, which fall on every other byte.
+    """
+    if len(head) < 4:
+        return None
+    even, odd = head[0::2], head[1::2]
+    even_nuls, odd_nuls = even.count(0) / len(even), odd.count(0) / len(odd)
+    if odd_nuls > 0.4 and even_nuls < 0.05:
+        return "utf-16-le"
+    if even_nuls > 0.4 and odd_nuls < 0.05:
+        return "utf-16-be"
+    return None
+
+
+def _is_utf8(head: bytes, truncated: bool) -> bool:
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as err:
+        # The block may end in the middle of a character.
+        return truncated and err.reason == "unexpected end of data"
+    return True
+
+
+def sniff(head: bytes, name: str = "", truncated: bool = False) -> FileType:
+    """
+    Returns the type of a file from its first block.
+
+    Args:
+        head (bytes): The first bytes of the file, usually `settings.SNIFF_BYTES` of them.
+        name (str, optional): The file name, used to tell CSV and TSV files apart from other text. Defaults to "".
+        truncated (bool, optional): True if the file continues after `head`. Defaults to False.
+
+    Returns:
+        FileType: The kind of the file, a short description and, for text, its encoding.
+    """
+    for offset, magic, kind, description in MAGIC_NUMBERS:
+        if head[offset : offset + len(magic)] == magic:
+            return FileType(kind, description)
+
+    encoding, bom = None, 0
+    for mark, codec in BYTE_ORDER_MARKS:
+        if head.startswith(mark):
+            encoding, bom = codec, len(mark)
+            break
+    else:
+        encoding = _utf16_without_bom(head)
+
+    if encoding is None:
+        if b"\0" in head:
+            return FileType("binary", "binary data")
+        control = sum(
+            1 for byte in head if (byte < 0x20 and byte not in TEXT_CONTROL_BYTES)
+        )
+        if head and control / len(head) > settings.SNIFF_CONTROL_RATIO:
+            return FileType("binary", "binary data")
+        if _is_utf8(head, truncated):
+            encoding = "utf-8"
+        else:
+            # cp1252 leaves five bytes undefined; latin-1 decodes anything.
+            try:
+                head.decode("cp1252")
+                encoding = "cp1252"
+            except UnicodeDecodeError:
+                encoding = "latin-1"
+
+    kind = "csv" if os.path.splitext(name)[1].lower() in CSV_EXTENSIONS else "text"
+    description = f"{encoding.upper()} {'CSV' if kind == 'csv' else 'text'}"
+    if bom and encoding == "utf-8":
+        description += " with BOM"
+    return FileType(kind, description, encoding, bom)
+
+
+def hexdump(data: bytes, start: int = 0) -> str:
+    """
+    Formats bytes like `hexdump -C`: offset, 16 bytes in hex and the printable ones as ASCII.
+    """
+    lines = []
+    for i in range(0, len(data), 16):
+        row = data[i : i + 16]
+        hex_part = " ".join(f"{byte:02x}" for byte in row[:8])
+        if len(row) > 8:
+            hex_part += "  " + " ".join(f"{byte:02x}" for byte in row[8:])
+        text = "".join(chr(byte) if 0x20 <= byte < 0x7F else "." for byte in row)
+        lines.append(f"{start + i:08x}  {hex_part:<49} |{text}|")
+    return "\n".join(lines)
+
+
+def _zip_preview(file_abspath: str) -> str:
+    with zipfile.ZipFile(file_abspath) as archive:
+        members = archive.infolist()
+    total = sum(member.file_size for member in members)
+    lines = [f"{len(members)} members, {total} bytes uncompressed:"]
+    for member in members[: settings.PREVIEW_MEMBERS]:
+        lines.append(f"{member.file_size:>12}  {member.filename}")
+    if len(members) > settings.PREVIEW_MEMBERS:
+        lines.append(f"[...{len(members) - settings.PREVIEW_MEMBERS} more members]")
+    return "\n".join(lines)
+
+
+def _tar_preview(file_abspath: str) -> str:
+    """
+    Lists the first members of a tar archive, compressed or not, reading it as a stream.
+    """
+    lines = []
+    more = False
+    with tarfile.open(file_abspath, mode="r|*") as archive:
+        for member in archive:
+            if len(lines) == settings.PREVIEW_MEMBERS:
+                more = True
+                break
+            name = member.name + ("/" if member.isdir() else "")
+            lines.append(f"{member.size:>12}  {name}")
+    if not lines:
+        raise tarfile.TarError("no members")
+    header = f"Tar archive, {'first ' if more else ''}{len(lines)} members:"
+    return "\n".join([header, *lines] + (["[...more members]"] if more else []))
+
+
+DECOMPRESSORS = {"gzip": gzip.open, "bzip2": bz2.open, "xz": lzma.open}
+
+
+def _decompressed_preview(file_abspath: str, file_type: FileType) -> str:
+    """
+    Shows the start of a compressed file that is not a tar archive, decompressing only its first block.
+    """
+    opener = DECOMPRESSORS[file_type.description.split()[0]]
+    with opener(file_abspath, "rb") as f:
+        head = f.read(settings.SNIFF_BYTES)
+    inner = sniff(head, os.path.splitext(file_abspath)[0], truncated=True)
+    if inner.encoding is None:
+        data = head[: settings.PREVIEW_HEX_BYTES]
+        return f"Decompressed, {inner.description}. Hexdump of bytes 0-{len(data)}:\n{hexdump(data)}"
+    lines = head[inner.bom :].decode(inner.encoding, errors="replace").splitlines()
+    return "\n".join(
+        [
+            f"Decompressed, {inner.description}. First {settings.PREVIEW_ROWS} lines:",
+            *lines[: settings.PREVIEW_ROWS],
+        ]
+    )
+
+
+class _ThriftReader:
+    """
+    Reads Thrift compact protocol structs as {field id: value}, the encoding of Parquet's footer.
+    """
+
+    # Nesting of structs, lists and maps; Parquet's footer needs fewer than 10.
+    MAX_DEPTH = 64
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+        self.depth = 0
+
+    def _byte(self) -> int:
+        self.position += 1
+        return self.data[self.position - 1]
+
+    def _varint(self) -> int:
+        result = shift = 0
+        while True:
+            byte = self._byte()
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def _zigzag(self) -> int:
+        value = self._varint()
+        return (value >> 1) ^ -(value & 1)
+
+    def _value(self, kind: int):
+        if kind in (9, 10, 11, 12):
+            self.depth += 1
+            if self.depth > self.MAX_DEPTH:
+                raise ValueError("Thrift data nested too deeply")
+            try:
+                return self._container(kind)
+            finally:
+                self.depth -= 1
+        if kind in (1, 2):
+            return kind == 1
+        if kind == 3:
+            byte = self._byte()
+            return byte - 256 if byte > 127 else byte
+        if kind in (4, 5, 6):
+            return self._zigzag()
+        if kind == 7:
+            self.position += 8
+            return struct.unpack("<d", self.data[self.position - 8 : self.position])[0]
+        if kind == 8:
+            length = self._varint()
+            self.position += length
+            return self.data[self.position - length : self.position]
+        raise ValueError(f"unknown Thrift type {kind}")
+
+    def _container(self, kind: int):
+        if kind in (9, 10):
+            header = self._byte()
+            size = header >> 4 if header >> 4 != 15 else self._varint()
+            if header & 0x0F in (1, 2):
+                # Booleans in a list take a byte each instead of living in the type.
+                return [self._byte() == 1 for _ in range(size)]
+            return [self._value(header & 0x0F) for _ in range(size)]
+        if kind == 11:
+            size = self._varint()
+            types = self._byte() if size else 0
+            if types >> 4 in (9, 10, 11, 12):
+                raise ValueError("Thrift map with container keys")
+            return {
+                self._value(types >> 4): self._value(types & 0x0F) for _ in range(size)
+            }
+        return self.read_struct()
+
+    def read_struct(self) -> dict:
+        fields = {}
+        field_id = 0
+        while True:
+            header = self._byte()
+            if header == 0:
+                return fields
+            delta = header >> 4
+            field_id = field_id + delta if delta else self._zigzag()
+            fields[field_id] = self._value(header & 0x0F)
+
+
+PARQUET_TYPES = [
+    "BOOLEAN",
+    "INT32",
+    "INT64",
+    "INT96",
+    "FLOAT",
+    "DOUBLE",
+    "BYTE_ARRAY",
+    "FIXED_LEN_BYTE_ARRAY",
+]
+PARQUET_CONVERTED_TYPES = {
+    0: "UTF8",
+    5: "DECIMAL",
+    6: "DATE",
+    7: "TIME_MILLIS",
+    8: "TIME_MICROS",
+    9: "TIMESTAMP_MILLIS",
+    10: "TIMESTAMP_MICROS",
+    19: "JSON",
+}
+
+
+def _is_schema_element(element) -> bool:
+    """
+    Tells whether a footer value has the shape of a Parquet SchemaElement, in the fields the preview reads.
+    """
+    return (
+        isinstance(element, dict)
+        and isinstance(element.get(4, b""), bytes)
+        and all(isinstance(element.get(field, 0), int) for field in (1, 3, 5, 6))
+    )
+
+
+def _parquet_preview(file_abspath: str, size: int) -> str:
+    """
+    Describes a Parquet file's columns and row count from its footer, and shows its first rows if pyarrow is installed.
+    """
+    with open(file_abspath, "rb") as f:
+        f.seek(size - 8)
+        footer_length, magic = struct.unpack("<i4s", f.read(8))
+        if magic != b"PAR1" or not 0 < footer_length <= size - 12:
+            raise ValueError("no Parquet footer")
+        f.seek(size - 8 - footer_length)
+        metadata = _ThriftReader(f.read(footer_length)).read_struct()
+
+    # The schema is a flattened tree: each group is followed by its `num_children` children.
+    # A damaged footer can still parse as Thrift, with any value in any field.
+    schema = metadata.get(2, [])
+    if not (
+        isinstance(schema, list)
+        and isinstance(metadata.get(4, []), list)
+        and all(_is_schema_element(element) for element in schema)
+    ):
+        raise ValueError("malformed Parquet schema")
+    columns = []
+    stack: list[tuple[str, int]] = []
+    for element in schema[1:]:
+        name = element[4].decode("utf-8", errors="replace") if 4 in element else ""
+        path = ".".join([parent for parent, _ in stack] + [name])
+        if element.get(5):
+            stack.append((name, element[5]))
+            continue
+        column_type = PARQUET_TYPES[element[1]] if 1 in element else "GROUP"
+        if element.get(6) in PARQUET_CONVERTED_TYPES:
+            column_type += f" ({PARQUET_CONVERTED_TYPES[element[6]]})"
+        if element.get(3) == 1:
+            column_type += " nullable"
+        elif element.get(3) == 2:
+            column_type += " repeated"
+        columns.append(f"  {path}: {column_type}")
+        while stack:
+            parent, remaining = stack.pop()
+            if remaining > 1:
+                stack.append((parent, remaining - 1))
+                break
+
+    lines = [
+        f"{metadata.get(3, 0)} rows in {len(metadata.get(4, []))} row groups, {len(columns)} columns:",
+        *columns,
+    ]
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        lines.append("[Install pyarrow to see the first rows.]")
+        return "\n".join(lines)
+
+    parquet_file = pyarrow.parquet.ParquetFile(file_abspath)
+    batch = next(parquet_file.iter_batches(batch_size=settings.PREVIEW_ROWS), None)
+    if batch is not None:
+        lines.append(f"First {batch.num_rows} rows:")
+        lines.extend(str(row) for row in batch.to_pylist())
+    return "\n".join(lines)
+
+
+def preview(file_abspath: str, file_type: FileType, size: int) -> str:
+    """
+    Returns a compact description of a file that is not text.
+
+    Args:
+        file_abspath (str): The file's absolute path.
+        file_type (FileType): The file's type, from `sniff`.
+        size (int): The file's size in bytes.
+
+    Returns:
+        str: A member list for archives, the schema and first rows for Parquet, or a hexdump of the first bytes.
+    """
+    try:
+        if file_type.kind == "zip":
+            return _zip_preview(file_abspath)
+        if file_type.kind == "tar":
+            return _tar_preview(file_abspath)
+        if file_type.kind == "compressed":
+            try:
+                return _tar_preview(file_abspath)
+            except tarfile.TarError:
+                return _decompressed_preview(file_abspath, file_type)
+        if file_type.kind == "parquet":
+            return _parquet_preview(file_abspath, size)
+    except PREVIEW_ERRORS:
+        pass
+    with open(file_abspath, "rb") as f:
+        data = f.read(settings.PREVIEW_HEX_BYTES)
+    return f"Hexdump of bytes 0-{len(data)}:\n{hexdump(data)}"
+
+
+def _column_type(values: list[str]) -> str:
+    values = [value.strip() for value in values if value.strip()]
+    if not values:
+        return "empty"
+    for name, parse in (("int", int), ("float", float)):
+        try:
+            for value in values:
+                parse(value)
+        except ValueError:
+            continue
+        return name
+    return "text"
+
+
+def csv_preview(text: str, file_path: str) -> str:
+    """
+    Returns the columns, with types inferred from the sampled rows, and the first rows of CSV text.
+
+    Args:
+        text (str): The start of the file, decoded; it should hold more than `settings.PREVIEW_ROWS` lines.
+        file_path (str): The file's path, whose extension gives the default delimiter.
+
+    Returns:
+        str: The delimiter, the columns and the first `settings.PREVIEW_ROWS` rows as they appear in the file.
+    """
+    lines = text.splitlines()[: settings.PREVIEW_ROWS + 1]
+    sample = "\n".join(lines)
+    delimiter = CSV_EXTENSIONS.get(os.path.splitext(file_path)[1].lower(), ",")
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        delimiter = dialect.delimiter
+    except csv.Error:
+        pass
+
+    rows = list(csv.reader(io.StringIO(sample), delimiter=delimiter))
+    if not rows:
+        return "No rows."
+    try:
+        has_header = csv.Sniffer().has_header(sample)
+    except csv.Error:
+        has_header = False
+    header = rows[0] if has_header else [f"column {i + 1}" for i in range(len(rows[0]))]
+    body = rows[1:] if has_header else rows
+    columns = [
+        f"{name} {_column_type([row[i] for row in body if i < len(row)])}"
+        for i, name in enumerate(header)
+    ]
+    shown = lines[1:] if has_header else lines
+    return "\n".join(
+        [
+            f"Delimiter {delimiter!r}, {len(header)} columns"
+            + (" (header row)" if has_header else "")
+            + f": {', '.join(columns)}",
+            f"First {len(shown)} rows:",
+            *shown,
+        ]
+    )
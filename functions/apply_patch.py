@@ -0,0 +1,355 @@
+import os
+import re
+from atomic_io import atomic_delete, atomic_write
+from workspace import get_workspace
+
+HUNK_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(Exception):
+    pass
+
+
+def _strip_diff_path(header: str) -> str | None:
+    path = header[4:].split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
+
+
+def _parse_unified_diff(patch: str) -> list[tuple[str | None, str | None, list]]:
+    """
+    Parses a unified diff into (old path, new path, hunks) per file.
+
+    Each hunk is (old_start, lines, no_newline_at_end), where lines are (tag, text) pairs
+    with tag one of " ", "-", "+".
+    """
+    files: list[tuple[str | None, str | None, list]] = []
+    lines = patch.splitlines()
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if not line.startswith("--- ") or index + 1 >= len(lines):
+            index += 1
+            continue
+        if not lines[index + 1].startswith("+++ "):
+            raise PatchError(f"Expected '+++' after '{line}'")
+        old_path = _strip_diff_path(line)
+        new_path = _strip_diff_path(lines[index + 1])
+        hunks = []
+        index += 2
+        while index < len(lines) and lines[index].startswith("@@"):
+            match = HUNK_HEADER_RE.match(lines[index])
+            if not match:
+                raise PatchError(f"Malformed hunk header '{lines[index]}'")
+            old_start = int(match.group(1))
+            old_count = int(match.group(2) or 1)
+            new_count = int(match.group(4) or 1)
+            hunk_lines: list[tuple[str, str]] = []
+            no_newline_at_end = False
+            seen_old = seen_new = 0
+            index += 1
+            while index < len(lines) and (seen_old < old_count or seen_new < new_count):
+                hunk_line = lines[index]
+                tag, text = (hunk_line[:1] or " "), hunk_line[1:]
+                if tag not in " -+":
+                    raise PatchError(f"Unexpected line in hunk: '{hunk_line}'")
+                hunk_lines.append((tag, text))
+                seen_old += tag in " -"
+                seen_new += tag in " +"
+                index += 1
+                while index < len(lines) and lines[index].startswith("\\"):
+                    if tag in " +":
+                        no_newline_at_end = True
+                    index += 1
+            hunks.append((old_start, hunk_lines, no_newline_at_end))
+        files.append((old_path, new_path, hunks))
+    if not files:
+        raise PatchError("No file headers ('---' / '+++') found in patch")
+    return files
+
+
+def _find_block(lines: list[str], block: list[str], expected: int) -> int:
+    """
+    Returns where `block` occurs in `lines`, preferring the occurrence closest to `expected`.
+    """
+    if not block:
+        return min(max(expected, 0), len(lines))
+    last_start = len(lines) - len(block)
+    for strip in (False, True):
+        wanted = [line.rstrip() for line in block] if strip else block
+        for distance in range(0, max(last_start, 0) + max(expected, 0) + 2):
+            for start in (expected - distance, expected + distance):
+                if 0 <= start <= last_start:
+                    candidate = lines[start : start + len(block)]
+                    if strip:
+                        candidate = [line.rstrip() for line in candidate]
+                    if candidate == wanted:
+                        return start
+    return -1
+
+
+def _apply_hunks(text: str, hunks: list, path: str) -> tuple[str, int, int]:
+    """
+    Applies unified diff hunks to `text`.
+
+    Returns:
+        tuple[str, int, int]: The new text and the number of added and removed lines.
+    """
+    newline = "\r\n" if "\r\n" in text else "\n"
+    lines = text.splitlines()
+    ends_with_newline = text.endswith(("\n", "\r")) or not text
+    offset = added = removed = 0
+
+    for old_start, hunk_lines, no_newline_at_end in hunks:
+        old_block = [line for tag, line in hunk_lines if tag in " -"]
+        new_block = [line for tag, line in hunk_lines if tag in " +"]
+        expected = (old_start - 1 if old_block else old_start) + offset
+        start = _find_block(lines, old_block, expected)
+        if start == -1:
+            raise PatchError(
+                f'Hunk at line {old_start} of "{path}" does not match the current content'
+            )
+        lines[start : start + len(old_block)] = new_block
+        if start + len(new_block) == len(lines):
+            ends_with_newline = not no_newline_at_end
+        offset += len(new_block) - len(old_block)
+        added += sum(tag == "+" for tag, _ in hunk_lines)
+        removed += sum(tag == "-" for tag, _ in hunk_lines)
+
+    new_text = newline.join(lines)
+    if lines and ends_with_newline:
+        new_text += newline
+    return new_text, added, removed
+
+
+def _apply_search_replace(text: str, search: str, replace: str, path: str) -> str:
+    if not search:
+        if text:
+            raise PatchError(
+                f'Empty search text for "{path}", which already has content'
+            )
+        return replace
+    occurrences = text.count(search)
+    if occurrences == 0:
+        raise PatchError(f'Search text not found in "{path}"')
+    if occurrences > 1:
+        raise PatchError(
+            f'Search text matches {occurrences} times in "{path}"; include more surrounding lines to make it unique'
+        )
+    return text.replace(search, replace, 1)
+
+
+def patched_paths(
+    patch: str | None = None, edits: list[dict] | None = None
+) -> list[str]:
+    """
+    Returns the relative paths an `apply_patch` call would touch, ignoring malformed input.
+    """
+    paths = [
+        edit["file_path"]
+        for edit in (edits if isinstance(edits, list) else [])
+        if isinstance(edit, dict)
+        and isinstance(edit.get("file_path"), str)
+        and edit["file_path"]
+    ]
+    if isinstance(patch, str) and patch:
+        try:
+            for old_path, new_path, _ in _parse_unified_diff(patch):
+                paths.extend(path for path in (old_path, new_path) if path)
+        except PatchError:
+            pass
+    return [os.path.normpath(path) for path in paths]
+
+
+def apply_patch(
+    working_directory: str,
+    patch: str | None = None,
+    edits: list[dict] | None = None,
+    verbose: bool = False,
+) -> str:
+    """
+    Applies a unified diff and/or search/replace edits to files within the working directory.
+
+    Args:
+        working_directory (str): The base directory within which file edits are permitted.
+        patch (str | None, optional): A unified diff, possibly covering several files. Defaults to None.
+        edits (list[dict] | None, optional): Search/replace edits, each with "file_path", "search" and "replace".
+            An empty "search" creates a new file. Defaults to None.
+        verbose (bool, optional): If True, prints detailed status and error messages. Defaults to False.
+
+    Returns:
+        str: A summary of the changed files, or a message describing why nothing was changed.
+
+    Notes:
+        - Every hunk and edit is validated against the current content before any file is written,
+          so a batch is applied completely or not at all (barring I/O errors during the writes).
+        - Hunks are located near their stated line and may have moved; their context must still match.
+        - Each file is replaced atomically via a temporary file and rename.
+        - Paths are resolved through symlinks; edits that would land outside the working directory are refused.
+        - Does not raise exceptions directly; returns error messages as strings instead.
+    """
+    workspace = get_workspace(working_directory)
+
+    if not patch and not edits:
+        return "Error: Provide a unified diff in `patch` or a list of `edits`"
+
+    if patch and not isinstance(patch, str):
+        return "Error: `patch` must be a unified diff string"
+
+    if edits and not (
+        isinstance(edits, list)
+        and all(
+            isinstance(edit, dict)
+            and all(
+                isinstance(edit.get(key) or "", str)
+                for key in ("file_path", "search", "replace")
+            )
+            for edit in edits
+        )
+    ):
+        return 'Error: `edits` must be a list of objects with string "file_path", "search" and "replace"'
+
+    # rel_path -> new content, or None to delete the file
+    results: dict[str, str | None] = {}
+    originals: dict[str, str | None] = {}
+    stats: dict[str, list[int]] = {}
+
+    def resolve(path: str) -> str:
+        file_abspath = workspace.resolve(path)
+        if file_abspath is None:
+            raise PatchError(
+                f'Cannot edit "{path}" as it is outside the permitted working directory'
+            )
+        if workspace.is_dir(file_abspath):
+            raise PatchError(f'"{path}" is a directory, not a file')
+        return file_abspath
+
+    def current(path: str) -> str | None:
+        if path in results:
+            return results[path]
+        file_abspath = resolve(path)
+        if workspace.stat(file_abspath) is None:
+            originals[path] = None
+        else:
+            try:
+                with open(file_abspath, "r", encoding="utf-8", newline="") as f:
+                    originals[path] = f.read()
+            except (OSError, UnicodeDecodeError) as err:
+                raise PatchError(f'Cannot read "{path}": {err}')
+        results[path] = originals[path]
+        return results[path]
+
+    try:
+        if patch:
+            for old_path, new_path, hunks in _parse_unified_diff(patch):
+                path = os.path.normpath(new_path or old_path or "")
+                text = current(os.path.normpath(old_path)) if old_path else None
+                if old_path and text is None:
+                    raise PatchError(f'File "{old_path}" does not exist')
+                if not old_path:
+                    if current(path) is not None:
+                        raise PatchError(f'File "{path}" already exists')
+                    text = ""
+                new_text, added, removed = _apply_hunks(text, hunks, path)  # type: ignore
+                if old_path and new_path and os.path.normpath(old_path) != path:
+                    current(path)
+                    results[os.path.normpath(old_path)] = None
+                results[path] = None if new_path is None else new_text
+                counts = stats.setdefault(path, [0, 0])
+                counts[0] += added
+                counts[1] += removed
+
+        for edit in edits or []:
+            path = os.path.normpath(edit.get("file_path") or "")
+            if not edit.get("file_path"):
+                raise PatchError("Every edit needs a file_path")
+            text = current(path)
+            if text is None and edit.get("search"):
+                raise PatchError(f'File "{path}" does not exist')
+            new_text = _apply_search_replace(
+                text or "", edit.get("search") or "", edit.get("replace") or "", path
+            )
+            results[path] = new_text
+            counts = stats.setdefault(path, [0, 0])
+            counts[0] += (edit.get("replace") or "").count("\n") + 1
+            counts[1] += (
+                (edit.get("search") or "").count("\n") + 1 if edit.get("search") else 0
+            )
+    except PatchError as err:
+        if verbose:
+            print("--- error ---")
+            print(f"Error: Patch not applied, no files were changed: {err}")
+        return f"Error: Patch not applied, no files were changed: {err}"
+
+    summary = []
+    try:
+        for path, new_text in results.items():
+            if new_text == originals.get(path):
+                continue
+            file_abspath = resolve(path)
+            workspace.invalidate(file_abspath)
+            if new_text is None:
+                atomic_delete(file_abspath)
+                summary.append(f'"{path}" (deleted)')
+            else:
+                atomic_write(file_abspath, new_text)
+                if originals.get(path) is None:
+                    summary.append(f'"{path}" (created)')
+                else:
+                    added, removed = stats.get(path, [0, 0])
+                    summary.append(f'"{path}" (+{added} -{removed} lines)')
+    except OSError as err:
+        done = ", ".join(summary) or "none"
+        if verbose:
+            print("--- error ---")
+            print(
+                f"Error: Failed to write patched files: {err}. Already written: {done}"
+            )
+        return f"Error: Failed to write patched files: {err}. Already written: {done}"
+
+    if not summary:
+        return "Patch applied but no file content changed"
+    if verbose:
+        print("--- apply_patch ---")
+        print(f"Successfully patched {len(summary)} file(s): {', '.join(summary)}")
+    return f"Successfully patched {len(summary)} file(s): {', '.join(summary)}"
+
+
+schema_apply_patch: dict = {
+    "name": "apply_patch",
+    "description": "Edits one or more existing files without resending their full content. Give a unified diff in `patch`, or search/replace `edits`. All changes are validated first; if any does not match, nothing is written.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "patch": {
+                "type": "STRING",
+                "description": "A unified diff with '--- a/path' and '+++ b/path' headers and '@@' hunks, paths relative to the working directory. Use /dev/null to create or delete a file.",
+            },
+            "edits": {
+                "type": "ARRAY",
+                "description": "Search/replace edits applied in order.",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "file_path": {
+                            "type": "STRING",
+                            "description": "The relative path to the file to edit.",
+                        },
+                        "search": {
+                            "type": "STRING",
+                            "description": "Exact text to replace; must occur exactly once. Empty to create a new file.",
+                        },
+                        "replace": {
+                            "type": "STRING",
+                            "description": "The replacement text.",
+                        },
+                    },
+                    "required": ["file_path", "search", "replace"],
+                },
+            },
+        },
+    },
+}
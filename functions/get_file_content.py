@@ -1,79 +1,308 @@
-import os
-from google.genai import types
+import mmap
+from functools import lru_cache
+import settings
+from file_types import FileType, csv_preview, hexdump, newline_bytes, preview, sniff
+from workspace import get_workspace
+
+LINE_COUNT_CHUNK = 1024 * 1024
+
+
+@lru_cache(maxsize=128)
+def _file_type(file_abspath: str, mtime_ns: int, size: int) -> FileType:
+    """
+    Sniffs the type and encoding of a file version from its first block, cached on its mtime and size.
+    """
+    with open(file_abspath, "rb") as f:
+        head = f.read(settings.SNIFF_BYTES)
+    return sniff(head, file_abspath, truncated=size > len(head))
+
+
+def _find_newline(mm: mmap.mmap, newline: bytes, position: int) -> int:
+    """
+    Returns the offset of the next newline at or after `position`, skipping matches that straddle two UTF-16 or UTF-32 characters.
+    """
+    while True:
+        position = mm.find(newline, position)
+        if position == -1 or position % len(newline) == 0:
+            return position
+        position += 1
+
+
+@lru_cache(maxsize=128)
+def _count_lines(
+    file_abspath: str, mtime_ns: int, size: int, newline: bytes = b"\n"
+) -> int:
+    """
+    Counts the lines of a file version, cached on its mtime and size.
+    """
+    with (
+        open(file_abspath, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+    ):
+        if len(newline) == 1:
+            newlines = sum(
+                mm[i : i + LINE_COUNT_CHUNK].count(newline)
+                for i in range(0, size, LINE_COUNT_CHUNK)
+            )
+        else:
+            newlines = 0
+            position = _find_newline(mm, newline, 0)
+            while position != -1:
+                newlines += 1
+                position = _find_newline(mm, newline, position + len(newline))
+        return newlines + (0 if mm[size - len(newline) : size] == newline else 1)
+
+
+def _line_start(mm: mmap.mmap, line: int, newline: bytes = b"\n") -> int:
+    """
+    Returns the byte offset where the 1-based `line` starts, or the file size if it does not exist.
+    """
+    position = 0
+    for _ in range(line - 1):
+        position = _find_newline(mm, newline, position)
+        if position == -1:
+            return len(mm)
+        position += len(newline)
+    return position
+
+
+def _align_to_utf8(mm: mmap.mmap, offset: int, backward: bool = False) -> int:
+    """
+    Moves `offset` off UTF-8 continuation bytes so a slice never starts or ends mid-character.
+    """
+    step = -1 if backward else 1
+    while 0 < offset < len(mm) and mm[offset] & 0xC0 == 0x80:
+        offset += step
+    return offset
+
+
+def _align(mm: mmap.mmap, offset: int, encoding: str, backward: bool = False) -> int:
+    """
+    Moves `offset` to a character boundary of `encoding`.
+    """
+    unit = len(newline_bytes(encoding))
+    if unit > 1:
+        return offset - offset % unit
+    if encoding == "utf-8":
+        return _align_to_utf8(mm, offset, backward)
+    return offset
+
+
+def _binary_content(
+    file_abspath: str,
+    file_type: FileType,
+    size: int,
+    offset: int | None,
+    length: int | None,
+    max_chars: int,
+) -> str:
+    """
+    Returns the preview of a binary file, or a hexdump of the requested bytes if an offset is given.
+    """
+    if offset is None:
+        return preview(file_abspath, file_type, size)
+    start = min(max(offset, 0), size)
+    # A hexdump line takes about five characters per byte.
+    length = max(1, min(length or settings.PREVIEW_HEX_BYTES, max_chars // 5))
+    with open(file_abspath, "rb") as f:
+        f.seek(start)
+        data = f.read(length)
+    content = f"Hexdump of bytes {start}-{start + len(data)}:\n{hexdump(data, start)}"
+    if start + len(data) < size:
+        content += f"\n[...{size - start - len(data)} more bytes, continue with offset={start + len(data)}]"
+    return content
 
 
 def get_file_content(
     working_directory: str,
     file_path: str | None = None,
-    max_chars: int = 10000,
+    max_chars: int | None = None,
+    offset: int | None = None,
+    length: int | None = None,
+    start_line: int | None = None,
+    end_line: int | None = None,
     verbose: bool = False,
 ) -> str:
     """
-    Reads the content of a file within a specified working directory.
+    Reads a slice of a file within a specified working directory.
 
     Args:
         working_directory (str): The base directory within which file access is permitted.
         file_path (str | None, optional): The relative path to the file from the working directory. Defaults to None.
-        max_chars (int, optional): The maximum number of characters to read from the file. Defaults to 10000.
+        max_chars (int | None, optional): The maximum number of bytes returned by one read. Defaults to `settings.MAX_CHARS`.
+        offset (int | None, optional): Byte offset to start reading at. Defaults to the start of the file.
+        length (int | None, optional): Number of bytes to read, capped at `max_chars`. Defaults to `max_chars`.
+        start_line (int | None, optional): First line to read, 1-based. Takes precedence over `offset`.
+            A line past the end of the file is an error.
+        end_line (int | None, optional): Last line to read, inclusive, at least `start_line`. Defaults to reading `length` bytes.
         verbose (bool, optional): If True, prints additional information about the file read operation. Defaults to False.
 
     Returns:
-        str: The content of the file up to `max_chars` characters,
+        str: A header with the file's total size and line count and the range shown, followed by the content,
              or an error message if the file cannot be read or is outside the permitted directory.
 
     Notes:
-        - If the file is larger than `max_chars`, the content is truncated and a notice is appended.
-        - The function prevents reading files outside the specified working directory for security.
+        - The file is memory-mapped, so reading a slice costs the size of the slice, not of the file.
+          Line ranges scan only the lines before `end_line`; the total line count is cached per file version.
+        - If more content follows the slice, a notice with the offset to continue from is appended.
+        - The file's first block is sniffed (`file_types.sniff`). Text is decoded with its detected
+          encoding. Binary files get a preview instead: a member list for archives, the schema for
+          Parquet, or a hexdump, and a hexdump of the requested bytes when `offset` is given.
+          A CSV or TSV file too large for one read shows its columns and first rows unless a range is given.
+        - The function prevents reading files outside the specified working directory for security,
+          including through symlinks.
         - Error messages are printed and returned as strings in case of failure.
     """
-    working_directory_abspath: str = os.path.abspath(working_directory)
-
-    file_abspath: str = os.path.abspath(
-        os.path.join(working_directory_abspath, file_path or "")
-    )
+    try:
+        offset, length, start_line, end_line = (
+            None if value is None else int(value)
+            for value in (offset, length, start_line, end_line)
+        )
+    except (TypeError, ValueError):
+        print("--- error ---")
+        print(
+            f'Error: offset, length, start_line and end_line must be integers, reading "{file_path}"'
+        )
+        return f'Error: offset, length, start_line and end_line must be integers, reading "{file_path}"'
+    if offset is not None:
+        offset = max(offset, 0)
+    if start_line is not None:
+        start_line = max(start_line, 1)
+        if end_line is not None:
+            end_line = max(end_line, start_line)
 
-    common_path = os.path.commonpath([working_directory_abspath, file_abspath])
+    workspace = get_workspace(working_directory)
+    file_abspath = workspace.resolve(file_path)
 
-    if common_path != working_directory_abspath:
+    if file_abspath is None:
         print("--- error ---")
         print(
             f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
         )
         return f'Error: Cannot read "{file_path}" as it is outside the permitted working directory'
 
-    if not os.path.isfile(file_abspath):
+    if not workspace.is_file(file_abspath):
         print("--- error ---")
         print(f'Error: File not found or is not a regular file: "{file_path}"')
         return f'Error: File not found or is not a regular file: "{file_path}"'
 
     try:
-        with open(file_abspath, "r", encoding="utf-8") as f:
-            file_content = f.read(max_chars)
-            if len(file_content) == max_chars:
-                file_content += f'[...File "{file_path}" truncated at 10000 characters]'
+        stat = workspace.stat(file_abspath)
+        size = stat.st_size  # type: ignore
+        if size == 0:
+            return f'File "{file_path}": 0 bytes, 0 lines.'
+
+        file_type = _file_type(file_abspath, stat.st_mtime_ns, size)  # type: ignore
+        max_chars = max_chars or settings.MAX_CHARS
+        if file_type.encoding is None:
+            content = _binary_content(
+                file_abspath, file_type, size, offset, length, max_chars
+            )
+            if verbose:
+                print(f'File "{file_path}": {file_type.description}, preview shown.')
+            return (
+                f'File "{file_path}": {size} bytes, {file_type.description}.\n{content}'
+            )
+
+        encoding = file_type.encoding
+        newline = newline_bytes(encoding)
+        total_lines = _count_lines(file_abspath, stat.st_mtime_ns, size, newline)  # type: ignore
+        length = max(1, min(length or max_chars, max_chars))
+        header = f'File "{file_path}": {size} bytes, {total_lines} lines'
+        if encoding != "utf-8" or file_type.bom or file_type.kind == "csv":
+            header += f", {file_type.description}"
+
+        with (
+            open(file_abspath, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        ):
+            if (
+                file_type.kind == "csv"
+                and offset is None
+                and not start_line
+                and size > length
+            ):
+                sample_end = min(
+                    _line_start(mm, settings.PREVIEW_ROWS + 2, newline), length
+                )
+                sample = mm[
+                    file_type.bom : _align(mm, sample_end, encoding, backward=True)
+                ].decode(encoding, errors="replace")
+                if verbose:
+                    print(f'File "{file_path}": CSV preview shown.')
+                return (
+                    f"{header}. Showing a preview.\n{csv_preview(sample, file_path)}\n"
+                    f"[...Read more rows with start_line and end_line, or bytes with offset]"
+                )
+
+            if start_line:
+                if start_line > total_lines:
+                    print("--- error ---")
+                    print(
+                        f'Error: start_line {start_line} is beyond the end of "{file_path}" ({total_lines} lines)'
+                    )
+                    return f'Error: start_line {start_line} is beyond the end of "{file_path}" ({total_lines} lines)'
+                start = _line_start(mm, start_line, newline)
+                end = _line_start(mm, end_line + 1, newline) if end_line else size
+                shown = (
+                    f"lines {start_line}-{min(end_line or total_lines, total_lines)}"
+                )
+            else:
+                start = min(max(offset or 0, 0), size)
+                end = size
+                shown = "bytes"
+
+            start = _align(mm, max(start, file_type.bom), encoding)
+            requested_end = max(end, start)
+            end = _align(
+                mm, min(requested_end, start + length), encoding, backward=True
+            )
+            file_content = mm[start:end].decode(encoding, errors="replace")
+
+        if shown == "bytes":
+            header += f". Showing bytes {start}-{end}."
+        else:
+            header += f". Showing {shown} (bytes {start}-{end})."
+        file_content = f"{header}\n{file_content}"
+        if end < requested_end:
+            file_content += (
+                f'\n[...File "{file_path}" truncated at {end - start} bytes, '
+                f"{size - end} more bytes, continue with offset={end}]"
+            )
         if verbose:
-            print(f'File "{file_path}": {len(file_content)} characters read.')
+            print(f'File "{file_path}": {end - start} bytes read.')
         return file_content
-    except OSError as err:
+    except (OSError, ValueError) as err:
         print(f"Error: Failed to open {file_path}: {err}")
         return f"Error: Failed to open {file_path}"
 
 
-schema_get_file_content: types.FunctionDeclaration = types.FunctionDeclaration(
-    name="get_file_content",
-    description="Reads the content of a file path up to 10000 characters.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The relative path to the file to read content from, relative to the working directory.",
-            ),
+schema_get_file_content: dict = {
+    "name": "get_file_content",
+    "description": "Reads a slice of a file, up to the configured read limit, from the start or from a given byte offset or line range. The response starts with the file's total size and line count, so long files can be paged through. Text in any common encoding is decoded; binary files return a preview (archive members, Parquet schema, or a hexdump; with offset, a hexdump of those bytes), and large CSV files return their columns and first rows unless a range is given.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The relative path to the file to read content from, relative to the working directory.",
+            },
+            "offset": {
+                "type": "INTEGER",
+                "description": "Byte offset to start reading from. Defaults to 0.",
+            },
+            "length": {
+                "type": "INTEGER",
+                "description": "Number of bytes to read, capped at the read limit. A truncated read ends with the offset to continue from.",
+            },
+            "start_line": {
+                "type": "INTEGER",
+                "description": "First line to read, 1-based. Overrides offset.",
+            },
+            "end_line": {
+                "type": "INTEGER",
+                "description": "Last line to read, inclusive. Used together with start_line.",
+            },
         },
-    ),
-)
-
-# get_file_content("calculator", "main.py", verbose=True)
-# get_file_content("calculator", "pkg/calculator.py", verbose=True)
-# get_file_content("calculator", "/bin/cat", verbose=True)
-# get_file_content("calculator", "lorem.txt", verbose=True)
+    },
+}
@@ -1,59 +1,244 @@
+import fnmatch
 import os
-from google.genai import types
+import re
+
+from workspace import get_workspace
+
+
+def _gitignore_regex(pattern: str, anchored: bool) -> re.Pattern:
+    """
+    Translates a .gitignore glob to a regex over paths relative to the .gitignore's directory.
+
+    Notes:
+        - Unlike `fnmatch`, "*", "?" and "[...]" never match "/"; only "**" crosses directories.
+        - An unanchored pattern may match at any depth.
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            body = pattern[i + 1 : end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            body = body.replace("\\", "\\\\")
+            regex += f"(?!/)[{body}]"
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(("" if anchored else "(?:.*/)?") + regex + "$")
+
+
+class _GitIgnore:
+    """
+    Minimal .gitignore matcher covering globs, negation, anchoring and directory-only patterns.
+    """
+
+    def __init__(self, rules: list[tuple[str, re.Pattern, bool, bool]] | None = None):
+        self.rules = rules or []
+
+    def extended(self, directory_abspath: str, rel_dir: str) -> "_GitIgnore":
+        """
+        Returns a matcher that also applies the .gitignore found in `directory_abspath`, if any.
+        """
+        try:
+            with open(
+                os.path.join(directory_abspath, ".gitignore"), "r", encoding="utf-8"
+            ) as f:
+                lines = f.read().splitlines()
+        except (OSError, UnicodeDecodeError):
+            return self
+
+        rules = list(self.rules)
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            line = line.lstrip("!")
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            # A slash at the start or in the middle anchors the pattern to this directory.
+            anchored = "/" in line
+            line = line.lstrip("/")
+            if not line:
+                continue
+            rules.append((rel_dir, _gitignore_regex(line, anchored), negated, dir_only))
+        return _GitIgnore(rules)
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        for base, pattern, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base and not rel_path.startswith(f"{base}/"):
+                continue
+            path = rel_path[len(base) + 1 :] if base else rel_path
+            if pattern.match(path):
+                ignored = not negated
+        return ignored
+
+
+def _matches(rel_path: str, name: str, patterns: list[str]) -> bool:
+    return any(
+        fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern)
+        for pattern in patterns
+    )
+
+
+def _walk(
+    directory_abspath: str,
+    rel_dir: str,
+    depth: int,
+    max_depth: int,
+    include: list[str],
+    exclude: list[str],
+    gitignore: _GitIgnore | None,
+):
+    """
+    Yields one formatted line per entry, descending into directories up to `max_depth` levels.
+
+    Notes:
+        - `os.scandir` reports the entry type from the directory read itself and caches `stat`,
+          so each entry costs at most one extra syscall.
+    """
+    if gitignore is not None:
+        gitignore = gitignore.extended(directory_abspath, rel_dir)
+
+    try:
+        with os.scandir(directory_abspath) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError as err:
+        yield f"- {rel_dir or '.'}: Error: cannot list directory: {err}"
+        return
+
+    for entry in entries:
+        rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+
+        if entry.name == ".git" and gitignore is not None:
+            continue
+        if gitignore is not None and gitignore.ignored(rel_path, is_dir):
+            continue
+        if exclude and _matches(rel_path, entry.name, exclude):
+            continue
+
+        if not include or is_dir or _matches(rel_path, entry.name, include):
+            try:
+                file_size = entry.stat().st_size
+                yield f"- {rel_path}: file_size:{file_size} bytes, is_dir={is_dir}"
+            except OSError:
+                yield f"- {rel_path}: broken symlink, is_dir=False"
+
+        if is_dir and depth < max_depth and not entry.is_symlink():
+            yield from _walk(
+                entry.path, rel_path, depth + 1, max_depth, include, exclude, gitignore
+            )
 
 
 def get_files_info(
-    working_directory: str, directory: str | None = None, verbose: bool = False
+    working_directory: str,
+    directory: str | None = None,
+    max_depth: int = 1,
+    include: list[str] | None = None,
+    exclude: list[str] | None = None,
+    respect_gitignore: bool = True,
+    max_entries: int = 1000,
+    verbose: bool = False,
 ) -> str:
     """
-    Lists information about files and directories within a specified directory.
+    Lists information about files and directories within a specified directory, optionally recursively.
 
     Args:
         working_directory (str): The root directory within which file listing is permitted.
         directory (str | None, optional): The subdirectory (relative to working_directory) to list. Defaults to None.
+        max_depth (int, optional): How many directory levels to list; 1 lists only `directory` itself. At least 1. Defaults to 1.
+        include (list[str] | None, optional): Glob patterns a file's path or name must match to be listed. Defaults to None.
+        exclude (list[str] | None, optional): Glob patterns of files and directories to skip entirely. Defaults to None.
+        respect_gitignore (bool, optional): If True, skips `.git` and entries ignored by `.gitignore` files. Defaults to True.
+        max_entries (int, optional): Maximum number of entries returned, at least 1. Defaults to 1000.
         verbose (bool, optional): If True, prints detailed information. Defaults to False.
 
     Returns:
-        str: A formatted string listing each file and directory in the target directory,
+        str: A formatted string listing each file and directory, with paths relative to the listed directory,
         including file size (in bytes) and whether it is a directory. Returns an error message
         if the directory is invalid or outside the permitted working directory.
 
     Notes:
         - Errors are returned as strings for AI to digest.
+        - Symlinked directories are listed but not descended into; broken symlinks are reported instead of failing.
+          `directory` itself is resolved through symlinks and must stay inside the working directory.
+        - Entries are streamed from the walk, so it stops as soon as `max_entries` is reached.
     """
-    working_directory_abspath: str = os.path.abspath(working_directory)
-
-    if directory:
-        directory_abspath: str = os.path.abspath(
-            os.path.join(working_directory_abspath, directory)
+    try:
+        max_depth = 1 if max_depth is None else max(int(max_depth), 1)
+        max_entries = 1000 if max_entries is None else max(int(max_entries), 1)
+    except (TypeError, ValueError):
+        print("--- error ---")
+        print(
+            f'Error: max_depth and max_entries must be integers, listing "{directory or "."}"'
         )
+        return f'Error: max_depth and max_entries must be integers, listing "{directory or "."}"'
 
-        common_path = os.path.commonpath([working_directory_abspath, directory_abspath])
+    workspace = get_workspace(working_directory)
 
-        if common_path != working_directory_abspath:
+    if directory:
+        directory_abspath = workspace.resolve(directory)
+
+        if directory_abspath is None:
             print("--- error ---")
             print(
                 f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
             )
             return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
 
-        if not os.path.isdir(directory_abspath):
+        if not workspace.is_dir(directory_abspath):
             print("--- error ---")
             print(f'Error: "{directory}" is not a directory')
             return f'Error: "{directory}" is not a directory'
 
     else:
-        directory_abspath = working_directory_abspath
+        directory_abspath = workspace.root
 
-    directory_content = os.listdir(directory_abspath)
+    if isinstance(include, str):
+        include = [include]
+    if isinstance(exclude, str):
+        exclude = [exclude]
 
     file_info = []
 
-    for file in directory_content:
-        file_path = os.path.join(directory_abspath, file)
-        file_size = os.path.getsize(file_path)
-        file_is_dir = os.path.isdir(file_path)
-        file_info.append(f"- {file}: file_size:{file_size} bytes, is_dir={file_is_dir}")
+    for line in _walk(
+        directory_abspath,
+        "",
+        1,
+        max_depth,
+        include or [],
+        exclude or [],
+        _GitIgnore() if respect_gitignore else None,
+    ):
+        if len(file_info) >= max_entries:
+            file_info.append(f"[...listing truncated at {max_entries} entries]")
+            break
+        file_info.append(line)
 
     if verbose:
         print(f"--- get_files_info: directory: {directory_abspath}")
@@ -61,24 +246,42 @@ def get_files_info(
     return "\n".join(file_info)
 
 
-schema_get_files_info: types.FunctionDeclaration = types.FunctionDeclaration(
-    name="get_files_info",
-    description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "directory": types.Schema(
-                type=types.Type.STRING,
-                description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
-            ),
+schema_get_files_info: dict = {
+    "name": "get_files_info",
+    "description": "Lists files in the specified directory along with their sizes, constrained to the working directory. Set max_depth to map a whole subtree in one call; entries ignored by .gitignore are skipped.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "directory": {
+                "type": "STRING",
+                "description": "The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
+            },
+            "max_depth": {
+                "type": "INTEGER",
+                "description": "Number of directory levels to list. 1 (the default) lists only the directory itself.",
+            },
+            "include": {
+                "type": "ARRAY",
+                "description": 'Glob patterns files must match to be listed, e.g. ["*.py"].',
+                "items": {
+                    "type": "STRING",
+                },
+            },
+            "exclude": {
+                "type": "ARRAY",
+                "description": 'Glob patterns of files and directories to skip, e.g. ["tests/*"].',
+                "items": {
+                    "type": "STRING",
+                },
+            },
+            "respect_gitignore": {
+                "type": "BOOLEAN",
+                "description": "Skip .git and entries ignored by .gitignore files. Defaults to true.",
+            },
+            "max_entries": {
+                "type": "INTEGER",
+                "description": "Maximum number of entries to return. Defaults to 1000.",
+            },
         },
-    ),
-)
-
-
-# test
-# get_files_info("calculator", directory="pkg", verbose=True)
-# get_files_info("calculator", verbose=True)
-# get_files_info("calculator", "../", verbose=True)
-# get_files_info("calculator", "/bin", verbose=True)
-# get_files_info("calculator", ".", verbose=True)
+    },
+}
@@ -1,92 +1,181 @@
 import os
-import subprocess
-from google.genai import types
+import re
+import tempfile
+import settings
+from output_capture import format_resources, format_run_result, run_bounded
+from testing_report import TEST_MODULES, format_report, read_report, runner_args
+from workspace import get_workspace
+
+MODULE_NAME_RE = re.compile(r"^[A-Za-z_]\w*(\.[A-Za-z_]\w*)*$")
 
 
 def run_python_file(
-    working_directory: str, file_path: str, verbose: bool = False
+    working_directory: str,
+    file_path: str | None = None,
+    args: list[str] | None = None,
+    module: str | None = None,
+    tests: list[str] | None = None,
+    stdin: str | None = None,
+    verbose: bool = False,
 ) -> str:
     """
-    Executes a Python file located within a specified working directory.
+    Executes a Python file or module within a specified working directory, optionally as a test run.
 
     Args:
         working_directory (str): The base directory within which the Python file must reside.
-        file_path (str): The relative or absolute path to the Python file to execute.
+        file_path (str | None, optional): The relative path to the Python file to execute. With `module`,
+            it is passed to the module as its first argument instead, e.g. a test file for pytest. Defaults to None.
+        args (list[str] | None, optional): Command-line arguments. Defaults to None.
+        module (str | None, optional): Module to run like `python3 -m module`. Defaults to None.
+        tests (list[str] | None, optional): Tests to run with module "pytest" (node ids such as
+            "tests/test_x.py::test_y") or "unittest" (dotted names). Defaults to None, all tests.
+        stdin (str | None, optional): Text sent to the program's standard input. Defaults to None.
         verbose (bool, optional): If True, prints detailed error and output information. Defaults to False.
 
     Returns:
-        str: The combined standard output and error from the executed Python file, or an error message if execution fails.
+        str: The standard output and error from the executed Python file, its exit code and resource usage,
+             or an error message if execution fails. Test runs return a summary of the failed tests instead.
 
     Notes:
-        - Only files with a ".py" extension are allowed.
-        - Execution is limited to 30 seconds.
+        - Only files with a ".py" extension are run as scripts.
+        - Execution is limited to 30 seconds (`settings.TEST_TIMEOUT_SECONDS` for test runs) and to
+          `settings.RUN_OUTPUT_KILL_BYTES` of output.
+        - Only the head and tail of each output stream are kept; the response says how many bytes were dropped.
+        - With module "pytest" or "unittest" the results are read from a report the run writes, see
+          `testing_report`, so the summary lists every failure however long the output was. If no report
+          was written, e.g. because the run crashed, the raw output is returned.
+        - With `settings.RUN_BACKEND = "warm"` scripts run in a fresh fork of a pre-warmed
+          interpreter from `warm_pool` instead of a new `python3` process; modules always run in a new process.
+        - The path is checked to be inside the working directory, through symlinks, before anything else.
         - Exceptions are caught and returned as error messages.
     """
 
-    working_directory_abspath: str = os.path.abspath(working_directory)
-
-    file_abspath: str = os.path.abspath(
-        os.path.join(working_directory_abspath, file_path or "")
-    )
-
-    if not os.path.isfile(file_abspath):
+    def error(message: str) -> str:
         if verbose:
             print("--- error ---")
-            print(f'Error: File "{file_path}" not found.')
-        return f'Error: File "{file_path}" not found.'
-
-    _, extension = os.path.splitext(file_abspath)
-    if extension != ".py":
-        if verbose:
-            print("--- error ---")
-            print(f'Error: "{file_path}" is not a Python file.')
-        return f'Error: "{file_path}" is not a Python file.'
-
-    common_path = os.path.commonpath([working_directory_abspath, file_abspath])
-
-    if common_path != working_directory_abspath:
-        if verbose:
-            print("--- error ---")
-            print(
-                f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
+            print(f"Error: {message}")
+        return f"Error: {message}"
+
+    workspace = get_workspace(working_directory)
+    if isinstance(args, str):
+        args = [args]
+    if isinstance(tests, str):
+        tests = [tests]
+    args = [str(arg) for arg in args or []]
+    tests = [str(test) for test in tests or []]
+
+    if not file_path and not module:
+        return error("Provide a file_path or a module to run")
+    if module and not MODULE_NAME_RE.match(module):
+        return error(f'"{module}" is not a valid module name')
+    if tests and module not in TEST_MODULES:
+        return error(f"tests can only be selected with module {sorted(TEST_MODULES)}")
+
+    file_abspath = None
+    if file_path:
+        file_abspath = workspace.resolve(file_path)
+        if file_abspath is None:
+            return error(
+                f'Cannot execute "{file_path}" as it is outside the permitted working directory'
             )
-        return f'Error: Cannot execute "{file_path}" as it is outside the permitted working directory'
-
+        if not workspace.is_file(file_abspath):
+            return error(f'File "{file_path}" not found.')
+        _, extension = os.path.splitext(file_abspath)
+        if not module and extension != ".py":
+            return error(f'"{file_path}" is not a Python file.')
+
+    targets = [os.path.relpath(file_abspath, workspace.root)] if file_abspath else []
+    report_path = None
+    timeout = 30
     try:
-        commands = ["python3", file_abspath]
-        result = subprocess.run(
-            commands,
-            capture_output=True,
-            text=True,
-            timeout=30,
-            cwd=working_directory_abspath,
-        )
-        output = []
-        if result.stdout:
-            output.append(f"STDOUT:\n{result.stdout}")
-        if result.stderr:
-            output.append(f"STDERR:\n{result.stderr}")
+        if module in TEST_MODULES:
+            fd, report_path = tempfile.mkstemp(prefix="cli-ai-tool-tests-")
+            os.close(fd)
+            commands = [
+                "python3",
+                *runner_args(module, report_path, [*args, *targets, *tests]),  # type: ignore
+            ]
+            timeout = settings.TEST_TIMEOUT_SECONDS
+            result = run_bounded(
+                commands, cwd=workspace.root, timeout=timeout, stdin=stdin
+            )
+        elif module:
+            commands = ["python3", "-m", module, *targets, *args]
+            result = run_bounded(
+                commands, cwd=workspace.root, timeout=timeout, stdin=stdin
+            )
+        elif settings.RUN_BACKEND == "warm" and hasattr(os, "fork"):
+            from warm_pool import get_pool
 
-        if result.returncode != 0:
-            output.append(f"Process exited with code {result.returncode}")
+            result = get_pool(workspace.root).run(
+                file_abspath, timeout=timeout, args=args, stdin=stdin  # type: ignore
+            )
+        else:
+            commands = ["python3", file_abspath, *args]
+            result = run_bounded(
+                commands, cwd=workspace.root, timeout=timeout, stdin=stdin  # type: ignore
+            )
 
+        report = read_report(module, report_path) if report_path else None  # type: ignore
+        if (
+            report is not None
+            and not result.timed_out
+            and not result.output_limited
+            and (report.passed or report.failures or report.skipped)
+        ):
+            output = format_report(report, workspace.root)
+            if result.returncode != 0:
+                output += f"\nProcess exited with code {result.returncode}"
+            output += f"\n{format_resources(result)}"
+        else:
+            output = format_run_result(result, timeout=timeout)
         if verbose:
-            print("\n".join(output) if output else "No output produced.")
-        return "\n".join(output) if output else "No output produced."
+            print(output)
+        return output
     except Exception as e:
         return f"Error: executing Python file: {e}"
-
-
-schema_run_python_file: types.FunctionDeclaration = types.FunctionDeclaration(
-    name="run_python_file",
-    description="Executes a Python file located in a specified path.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The relative path to the file to write content to",
-            ),
+    finally:
+        if report_path:
+            try:
+                os.remove(report_path)
+            except OSError:
+                pass
+        # The program may have changed any file in the workspace.
+        workspace.invalidate()
+
+
+schema_run_python_file: dict = {
+    "name": "run_python_file",
+    "description": "Executes a Python file, or a module like `python -m`, with optional arguments and input. With module pytest or unittest, runs all or selected tests and returns only a summary of the failures.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The relative path to the Python file to run. With a module, it is passed to the module, e.g. a test file for pytest.",
+            },
+            "args": {
+                "type": "ARRAY",
+                "description": 'Command-line arguments, e.g. ["--verbose", "input.txt"].',
+                "items": {
+                    "type": "STRING",
+                },
+            },
+            "module": {
+                "type": "STRING",
+                "description": 'Module to run instead of a file, e.g. "pytest" or "unittest".',
+            },
+            "tests": {
+                "type": "ARRAY",
+                "description": 'Tests to run with module pytest or unittest, e.g. ["tests/test_calc.py::test_add"] or ["tests.test_calc.TestCalc"]. Runs all tests if omitted.',
+                "items": {
+                    "type": "STRING",
+                },
+            },
+            "stdin": {
+                "type": "STRING",
+                "description": "Text sent to the program's standard input.",
+            },
         },
-    ),
-)
+    },
+}
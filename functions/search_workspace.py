@@ -0,0 +1,84 @@
+import os
+
+from workspace import get_workspace
+from workspace_index import get_index
+
+
+def search_workspace(
+    working_directory: str,
+    query: str | None = None,
+    kind: str = "text",
+    max_results: int = 50,
+    verbose: bool = False,
+) -> str:
+    """
+    Searches the working directory through its persistent index.
+
+    Args:
+        working_directory (str): The directory being searched.
+        query (str | None, optional): Text to find, or part of a symbol name. Defaults to None.
+        kind (str, optional): "text" for lines containing the query, "symbol" for Python class
+            and function definitions. Defaults to "text".
+        max_results (int, optional): Maximum number of hits returned. Defaults to 50.
+        verbose (bool, optional): If True, prints detailed information. Defaults to False.
+
+    Returns:
+        str: One "path:line: text" hit per line, or an error message.
+
+    Notes:
+        - The index is refreshed before a search if a new turn began or a tool wrote since the last
+          one, or at least every `settings.INDEX_RECHECK_SECONDS`. Only files whose mtime or size
+          changed are re-read.
+        - Errors are returned as strings for AI to digest.
+    """
+    if not query:
+        return "Error: A search query is required"
+
+    if kind not in ("text", "symbol"):
+        return f'Error: Unknown search kind "{kind}", expected "text" or "symbol"'
+
+    if not os.path.isdir(working_directory):
+        return f'Error: "{working_directory}" is not a directory'
+
+    index = get_index(working_directory)
+    changed = index.update(get_workspace(working_directory).generation)
+
+    if kind == "symbol":
+        hits = index.search_symbols(query, max_results=max_results)
+    else:
+        hits = index.search_text(query, max_results=max_results)
+
+    if verbose:
+        print(f"--- search_workspace: {changed} files re-indexed, {len(hits)} hits")
+
+    if not hits:
+        return f'No matches for "{query}"'
+
+    lines = [f"{path}:{line}: {text[:200]}" for path, line, text in hits]
+    if len(hits) >= max_results:
+        lines.append(f"[...results truncated at {max_results} hits]")
+    return "\n".join(lines)
+
+
+schema_search_workspace: dict = {
+    "name": "search_workspace",
+    "description": "Searches every file in the working directory at once and returns matching path:line hits. Use it instead of listing directories and reading files one by one to locate code.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "query": {
+                "type": "STRING",
+                "description": "Literal text to find (case-insensitive), or part of a class or function name.",
+            },
+            "kind": {
+                "type": "STRING",
+                "description": '"text" to find lines containing the query, "symbol" to find Python class and function definitions. Defaults to "text".',
+                "enum": ["text", "symbol"],
+            },
+            "max_results": {
+                "type": "INTEGER",
+                "description": "Maximum number of hits to return. Defaults to 50.",
+            },
+        },
+    },
+}
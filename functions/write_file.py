@@ -1,5 +1,6 @@
 import os
-from google.genai import types
+from atomic_io import atomic_write
+from workspace import get_workspace
 
 
 def write_file(
@@ -19,17 +20,14 @@ def write_file(
 
     Notes:
         - Does not raise exceptions directly; returns error messages as strings instead.
+        - The file is replaced atomically, so a failed write never leaves a half-written file behind.
+        - Paths are resolved through symlinks; a symlink pointing outside the working directory is refused.
     """
 
-    working_directory_abspath: str = os.path.abspath(working_directory)
+    workspace = get_workspace(working_directory)
+    file_abspath = workspace.resolve(file_path)
 
-    file_abspath: str = os.path.abspath(
-        os.path.join(working_directory_abspath, file_path or "")
-    )
-
-    common_path = os.path.commonpath([working_directory_abspath, file_abspath])
-
-    if common_path != working_directory_abspath:
+    if file_abspath is None:
         if verbose:
             print("--- error ---")
             print(
@@ -37,23 +35,24 @@ def write_file(
             )
         return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory'
 
-    if not os.path.exists(file_abspath):
+    if workspace.stat(file_abspath) is None:
         try:
             os.makedirs(os.path.dirname(file_abspath), exist_ok=True)
         except Exception as e:
+            workspace.invalidate(file_abspath)
             if verbose:
                 print("--- error ---")
                 print(f"Error: creating directory: {e}")
             return f"Error: creating directory: {e}"
-    if os.path.exists(file_abspath) and os.path.isdir(file_abspath):
+    elif workspace.is_dir(file_abspath):
         if verbose:
             print("--- error ---")
             print(f'Error: "{file_path}" is a directory, not a file')
         return f'Error: "{file_path}" is a directory, not a file'
 
     try:
-        with open(file_abspath, "w", encoding="utf-8") as f:
-            f.write(content)
+        atomic_write(file_abspath, content)
+        workspace.invalidate(file_abspath)
         if verbose:
             print("--- write_file ---")
             print(
@@ -64,26 +63,27 @@ def write_file(
         )
 
     except OSError as err:
+        workspace.invalidate(file_abspath)
         if verbose:
             print("--- error ---")
             print(f"Error: Failed to write to {file_path}: {err}")
         return f"Error: Failed to write to {file_path}: {err}"
 
 
-schema_write_file: types.FunctionDeclaration = types.FunctionDeclaration(
-    name="write_file",
-    description="Writes the given content to a file in specified path. If file exists it will be overwritten.",
-    parameters=types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "file_path": types.Schema(
-                type=types.Type.STRING,
-                description="The relative path to the file to write, from the working directory.",
-            ),
-            "content": types.Schema(
-                type=types.Type.STRING,
-                description="The content to write to the file.",
-            ),
+schema_write_file: dict = {
+    "name": "write_file",
+    "description": "Writes the given content to a file in specified path. If file exists it will be overwritten.",
+    "parameters": {
+        "type": "OBJECT",
+        "properties": {
+            "file_path": {
+                "type": "STRING",
+                "description": "The relative path to the file to write, from the working directory.",
+            },
+            "content": {
+                "type": "STRING",
+                "description": "The content to write to the file.",
+            },
         },
-    ),
-)
+    },
+}
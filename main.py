@@ -1,49 +1,91 @@
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+from __future__ import annotations
+
+import argparse
+import importlib
 import os
 import sys
+import time
+from functools import lru_cache, partial
+from typing import TYPE_CHECKING, Callable
+
 import settings
-from available_functions import available_functions
+from tracing import configure_tracing, span, usage_attributes
+
+# The SDK and the tool modules are imported on first use, so that printing usage
+# or parsing arguments does not pay for them.
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+    from sessions import Session
+    from summary import SessionSummary
+    from tool_cache import ToolResultCache
+
+TOOL_MODULES = {
+    "get_file_content": "functions.get_file_content",
+    "get_files_info": "functions.get_files_info",
+    "run_python_file": "functions.run_python_file",
+    "write_file": "functions.write_file",
+    "search_workspace": "functions.search_workspace",
+    "apply_patch": "functions.apply_patch",
+}
+
+
+@lru_cache(maxsize=None)
+def load_tool(func_name: str) -> Callable[..., str]:
+    """
+    Imports the module of a tool the first time it is called and returns the tool function.
+    """
+    return getattr(importlib.import_module(TOOL_MODULES[func_name]), func_name)
 
 
-def call_function(function_call_part: types.FunctionCall, verbose=False):
+def call_function(
+    function_call_part: types.FunctionCall,
+    verbose=False,
+    cache: ToolResultCache | None = None,
+    working_directory: str | None = None,
+):
     """
     Calls a specified function from a predefined set of avialable functions.
 
     Args:
         function_call_part (types.FunctionCall): An object containing the name of the function to call and its arguments.
         verbose (bool, optional): If True, prints detailed information about the function call. Defaults to False.
+        cache (ToolResultCache | None, optional): Session cache consulted for read-only tools. Defaults to None.
+        working_directory (str | None, optional): The directory the tool is confined to. Defaults to `settings.WORKING_DIR`.
 
     Returns:
         types.Content: An object containing the result of the function call or an error message if the function is unknown.
     """
-    from functions.get_file_content import get_file_content
-    from functions.get_files_info import get_files_info
-    from functions.run_python_file import run_python_file
-    from functions.write_file import write_file
+    from google.genai import types
 
     if verbose:
         print(f"Calling function: {function_call_part.name}({function_call_part.args})")
     else:
         print(f" - Calling function: {function_call_part.name}")
 
-    working_directory = settings.WORKING_DIR
+    working_directory = working_directory or settings.WORKING_DIR
     func_name: str | None = function_call_part.name
     func_args: dict | None = function_call_part.args
 
-    functions_map = {
-        "get_file_content": get_file_content,
-        "get_files_info": get_files_info,
-        "run_python_file": run_python_file,
-        "write_file": write_file,
-    }
-
-    if func_name in functions_map:
-
-        func_call = functions_map[func_name](
-            working_directory=working_directory, verbose=verbose, **func_args  # type: ignore
-        )
+    if func_name in TOOL_MODULES:
+
+        def run() -> str:
+            return load_tool(func_name)(
+                working_directory=working_directory, verbose=verbose, **func_args  # type: ignore
+            )
+
+        with span("tool", function=func_name) as tool_span:
+            if cache is not None:
+                func_call = cache.call(func_name, func_args or {}, run)
+            else:
+                func_call = run()
+            if tool_span.recording:
+                tool_span.set(
+                    bytes_in=len(repr(func_args or {})),
+                    bytes_out=len(func_call),
+                    tool_error=func_call.startswith("Error"),
+                )
 
         return types.Content(
             role="tool",
@@ -85,6 +127,8 @@ def summarise_interaction(
     Returns:
         str: brief yet comprehensive summary of the AI agent's interaction.
     """
+    from google.genai import types
+
     if not system_instruction:
         system_instruction = (
             "Provide a brief yet comprehensive summary of the AI agent's interaction."
@@ -97,98 +141,517 @@ def summarise_interaction(
     summary: str | None = None
 
     try:
-        summary: str | None = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=config,
-        ).text
+        with span("summary", model=model, contents=len(contents)) as summary_span:
+            response = client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=config,
+            )
+            summary_span.set(**usage_attributes(response.usage_metadata))
+        summary: str | None = response.text
     except Exception as err:
         print(f"Error: summary generation failed. Details: {err}")
 
     return summary
 
 
-def main():
+def log_usage(
+    turn: int, usage_metadata: types.GenerateContentResponseUsageMetadata | None
+):
+    """
+    Prints the token usage of a single model turn.
 
-    args: list[str] = sys.argv[1:]
-    verbose: bool = "--verbose" in args
-
-    if not args:
-        print("\nHello from cli-ai-tool!")
-        print("\nUsage MacOS:")
-        print("     python3 main.py [prompt...]")
-        print("Options:")
-        print("     --verbose   provides additional details on program execution")
-        print("Example:")
-        print('     python main.py "How do I build a calculator app?" --verbose\n')
-        sys.exit(1)
+    Args:
+        turn (int): The 1-based iteration number.
+        usage_metadata (types.GenerateContentResponseUsageMetadata | None): Usage reported for the turn.
+    """
+    if not usage_metadata:
+        print(f"Turn {turn}: no usage metadata")
+        return
+    prompt_tokens = usage_metadata.prompt_token_count or 0
+    cached_tokens = usage_metadata.cached_content_token_count or 0
+    print(
+        f"Turn {turn}: prompt tokens {prompt_tokens} "
+        f"(cached {cached_tokens}, uncached {prompt_tokens - cached_tokens}), "
+        f"response tokens {usage_metadata.candidates_token_count}"
+    )
 
-    user_prompt: str = " ".join(arg for arg in args if not arg.startswith("--"))
 
-    contents: list = [types.Content(role="user", parts=[types.Part(text=user_prompt)])]
+def run_agent(
+    client: genai.Client,
+    user_prompt: str,
+    verbose: bool = False,
+    stream: bool = False,
+    session: Session | None = None,
+    summary: SessionSummary | None = None,
+) -> list[types.Content]:
+    """
+    Runs the agent loop for one prompt until the model answers without calling tools.
+
+    Args:
+        client (genai.Client): The generative AI client, or a stand-in such as `replay.ReplayClient`.
+        user_prompt (str): The prompt starting the session.
+        verbose (bool, optional): If True, prints detailed information about the session. Defaults to False.
+        stream (bool, optional): If True, streams each turn and runs tools as they arrive. Defaults to False.
+        session (Session | None, optional): Saved session to continue and to save each turn to. Defaults to None.
+        summary (SessionSummary | None, optional): Summary updated after every model turn. Defaults to None.
+
+    Returns:
+        list[types.Content]: The conversation, ending with the model's final response.
+    """
+    from google.genai import types
+
+    from available_functions import available_functions
+    from compaction import compact_contents
+    from context_cache import ContextCache, workspace_snapshot
+    from executor import run_function_calls
+    from routing import RoutingLog, TurnSignals, load_router, turn_signals
+    from streaming import stream_turn
+    from tool_cache import ToolResultCache
+
+    contents: list = list(session.contents) if session else []
+    contents.append(types.Content(role="user", parts=[types.Part(text=user_prompt)]))
+    # Found by identity each turn: compaction shifts it, or folds it into the first content.
+    prompt = contents[-1]
+    if summary is not None:
+        summary.record(contents[-1:])
 
     config: types.GenerateContentConfig = types.GenerateContentConfig(
         system_instruction=settings.SYSTEM_PROMPT, tools=[available_functions]
     )
 
-    load_dotenv()
-    gem_api_key = os.environ.get("GEMINI_API_KEY")
-    client = genai.Client(api_key=gem_api_key)
+    prefix = ContextCache(
+        client,
+        config,
+        snapshot=(
+            workspace_snapshot(settings.WORKING_DIR)
+            if settings.WORKSPACE_SNAPSHOT
+            else None
+        ),
+        verbose=verbose,
+        enabled=settings.CONTEXT_CACHE,
+    )
 
-    counter: int = 0
+    router = load_router()
+    routing_log = RoutingLog()
+    context_tokens = 0
 
-    while counter < settings.MAX_ITERS:
+    cache = ToolResultCache(settings.WORKING_DIR)
+    summarise_older = partial(
+        summarise_interaction,
+        system_instruction=settings.COMPACTION_PROMPT,
+        client=client,
+        model=router.choose(TurnSignals(0, "summary", 0, 0)).model,
+    )
+    dispatch = partial(call_function, cache=cache)
+    if session is not None:
+        call_tool = dispatch
 
-        counter += 1
+        def dispatch(function_call_part, verbose=False):
+            return session.record_read(
+                function_call_part, partial(call_tool, function_call_part, verbose)
+            )
 
-        response = client.models.generate_content(
-            model=settings.MODEL_ID,
-            contents=contents,
-            config=config,
-        )
-
-        if response.candidates:
-            for candidate in response.candidates:
-                contents.append(candidate.content)
+    counter: int = 0
 
-        if response.function_calls:
-            for call in response.function_calls:
-                func_call = call_function(call, verbose=verbose)
-                contents.append(func_call)
+    with span("session", router=settings.ROUTER, stream=stream) as session_span:
+        while counter < settings.MAX_ITERS:
 
-                if not func_call.parts or not func_call.parts[0].function_response:  # type: ignore
-                    raise Exception("Empty function call result!")
+            counter += 1
+            cache.workspace.begin_turn()
 
-                if func_call.parts and func_call.parts[0].function_response and verbose:  # type: ignore
-                    print(f"-> {func_call.parts[0].function_response.response}")  # type: ignore
+            with span("turn", turn=counter):
+                with span("compaction", contents=len(contents)) as compaction_span:
+                    contents = compact_contents(
+                        contents,
+                        summarise=summarise_older,
+                        prompt_index=next(
+                            (i for i, c in enumerate(contents) if c is prompt), 0
+                        ),
+                    )
+                    compaction_span.set(compacted_contents=len(contents))
 
-                if not func_call:
-                    raise Exception("No function responses generated, exiting.")
+                tool_responses: list[types.Content] | None = None
 
-        else:
-            if response.usage_metadata and response.candidates:
+                signals = turn_signals(contents, counter, context_tokens)
+                route = router.choose(signals)
                 if verbose:
-                    print(f"User prompt: {user_prompt}")
                     print(
-                        f"Prompt tokens: {response.usage_metadata.prompt_token_count}"
+                        f"Routing turn {counter} ({signals.turn_type}) to {route.model}: {route.reason}"
                     )
-                    print(
-                        f"Response tokens: {response.usage_metadata.candidates_token_count}"
+
+                with span(
+                    "model_call",
+                    model=route.model,
+                    turn_type=signals.turn_type,
+                    route_reason=route.reason,
+                ) as model_span:
+                    fell_back = False
+                    while True:
+                        turn_config, turn_contents = prefix.request(
+                            route.model, contents
+                        )
+                        start = time.perf_counter()
+                        try:
+                            if stream:
+                                response, tool_responses = stream_turn(
+                                    client,
+                                    route.model,
+                                    turn_contents,
+                                    turn_config,
+                                    dispatch,
+                                    verbose=verbose,
+                                )
+                            else:
+                                response = client.models.generate_content(
+                                    model=route.model,
+                                    contents=turn_contents,
+                                    config=turn_config,
+                                )
+                        except Exception as err:
+                            routing_log.record(
+                                signals,
+                                route,
+                                time.perf_counter() - start,
+                                None,
+                                error=f"{type(err).__name__}: {err}",
+                            )
+                            # Tools may already have run during a failed stream,
+                            # so only non-streamed turns are retried.
+                            fallback = (
+                                None
+                                if stream or fell_back
+                                else router.fallback(route, err)
+                            )
+                            if fallback is None:
+                                raise
+                            if verbose:
+                                print(
+                                    f"Routing turn {counter} to {fallback.model}: {fallback.reason}"
+                                )
+                            route, fell_back = fallback, True
+                            model_span.set(model=route.model, route_reason=route.reason)
+                            continue
+                        routing_log.record(
+                            signals,
+                            route,
+                            time.perf_counter() - start,
+                            response.usage_metadata,
+                        )
+                        break
+                    model_span.set(
+                        context_cached=prefix.cached is not None,
+                        function_calls=len(response.function_calls or []),
+                        **usage_attributes(response.usage_metadata),
                     )
-                candidate = response.candidates[0]
-                if (
-                    candidate.content
-                    and candidate.content.parts
-                    and candidate.content.parts[0].text
-                ):
-                    print(f"Response: {candidate.content.parts[0].text.strip()}")
-            break
+                    if response.usage_metadata:
+                        context_tokens = response.usage_metadata.prompt_token_count or 0
 
-    summary = summarise_interaction(
-        contents=contents, system_instruction=settings.SUMMARY_PROMPT, client=client
+                if verbose:
+                    log_usage(counter, response.usage_metadata)
+
+                if response.candidates:
+                    for candidate in response.candidates:
+                        contents.append(candidate.content)
+                    if summary is not None:
+                        # Runs in the background while the tools below execute.
+                        summary.update([c.content for c in response.candidates])  # type: ignore
+
+                if not response.function_calls:
+                    if response.usage_metadata and response.candidates:
+                        if verbose:
+                            print(f"User prompt: {user_prompt}")
+                            print(
+                                f"Prompt tokens: {response.usage_metadata.prompt_token_count}"
+                            )
+                            print(
+                                f"Response tokens: {response.usage_metadata.candidates_token_count}"
+                            )
+                        candidate = response.candidates[0]
+                        if (
+                            not stream
+                            and candidate.content
+                            and candidate.content.parts
+                            and candidate.content.parts[0].text
+                        ):
+                            print(
+                                f"Response: {candidate.content.parts[0].text.strip()}"
+                            )
+                    break
+
+                if tool_responses is None:
+                    with span("tools", calls=len(response.function_calls)):
+                        tool_responses = run_function_calls(
+                            response.function_calls, dispatch, verbose=verbose
+                        )
+
+                if summary is not None:
+                    summary.record(tool_responses)
+
+                for func_call in tool_responses:
+                    contents.append(func_call)
+
+                    if not func_call.parts or not func_call.parts[0].function_response:  # type: ignore
+                        raise Exception("Empty function call result!")
+
+                    if func_call.parts and func_call.parts[0].function_response and verbose:  # type: ignore
+                        print(f"-> {func_call.parts[0].function_response.response}")  # type: ignore
+
+                    if not func_call:
+                        raise Exception("No function responses generated, exiting.")
+
+                if session:
+                    session.save(contents)
+
+        if session:
+            session.save(contents)
+
+        session_span.set(
+            turns=counter, cache_hits=cache.hits, cache_misses=cache.misses
+        )
+
+    if verbose:
+        print(f"Tool cache: {cache.hits} hits, {cache.misses} misses")
+        print(f"Routing:\n{routing_log.summary()}")
+
+    return contents
+
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options shared by every entry point that runs the agent; defaults come from `settings`.
+    """
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="provides additional details on program execution",
+    )
+    parser.add_argument(
+        "--model",
+        default=settings.MODEL_ID,
+        help="model to call (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-iters",
+        type=int,
+        default=settings.MAX_ITERS,
+        help="maximum number of model turns (default: %(default)s)",
     )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        metavar="RPM",
+        default=settings.RATE_LIMIT_RPM,
+        help="maximum model requests per minute (default: unlimited)",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="sends a duplicate request when a model call is slower than the recent p95",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="F",
+        help="appends timing spans to JSONL file F (view: python tracing.py F)",
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Returns the command-line parser; option defaults come from `settings`.
+    """
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Hello from cli-ai-tool! An AI coding agent working inside one directory.",
+        epilog='Example:\n     python main.py "How do I build a calculator app?" --verbose',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("prompt", nargs="*", help="the request for the agent")
+    add_common_arguments(parser)
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="streams the response and runs tools as they arrive",
+    )
+    parser.add_argument(
+        "--router",
+        default=settings.ROUTER,
+        help='picks the model per turn: "fixed", "rules" or module:Class (default: %(default)s)',
+    )
+    parser.add_argument(
+        "--route-log",
+        metavar="F",
+        help="appends each routing decision with its latency and tokens to JSONL file F",
+    )
+    parser.add_argument(
+        "--working-dir",
+        help=f"directory the tools are confined to (default: the resumed session's, else {settings.WORKING_DIR})",
+    )
+    parser.add_argument(
+        "--max-chars",
+        type=int,
+        default=settings.MAX_CHARS,
+        help="maximum bytes returned by one file read (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="stops retrying model calls once the session has run this long",
+    )
+    parser.add_argument(
+        "--cache-context",
+        action="store_true",
+        help="caches the system prompt, tools and snapshot server-side between turns",
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="sends the small text files of the working directory up front",
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="ID",
+        help='continues saved session ID ("last" for the most recent one)',
+    )
+    parser.add_argument(
+        "--no-save",
+        action="store_true",
+        help="does not save a new session for a later --resume",
+    )
+    parser.add_argument(
+        "--summary",
+        choices=["rolling", "template", "full", "none"],
+        help=f'how the closing summary is made (default: {settings.SUMMARY_MODE}, "template" with --replay)',
+    )
+    parser.add_argument(
+        "--no-summary",
+        dest="summary",
+        action="store_const",
+        const="none",
+        help="prints no closing summary, same as --summary none",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="F",
+        help="records model requests and responses to JSONL file F",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="F",
+        help="replays model responses from F instead of calling the API",
+    )
+    return parser
+
+
+def main():
+
+    parser = build_parser()
+    args = parser.parse_intermixed_args()
+
+    if not args.prompt:
+        parser.print_help()
+        sys.exit(1)
+
+    settings.MODEL_ID = args.model
+    settings.ROUTER = args.router
+    settings.ROUTING_LOG = args.route_log or settings.ROUTING_LOG
+    settings.MAX_ITERS = args.max_iters
+    settings.MAX_CHARS = args.max_chars
+    settings.CONTEXT_CACHE = args.cache_context or settings.CONTEXT_CACHE
+    settings.WORKSPACE_SNAPSHOT = args.snapshot or settings.WORKSPACE_SNAPSHOT
+    settings.RATE_LIMIT_RPM = args.rate_limit
+    settings.HEDGE_REQUESTS = args.hedge or settings.HEDGE_REQUESTS
+
+    session: Session | None = None
+    if args.resume:
+        from sessions import Session
+
+        try:
+            session = Session.load(args.resume)
+        except FileNotFoundError as err:
+            print(f"Error: cannot resume session {args.resume}: {err}")
+            sys.exit(1)
+        if session.pruned:
+            print(
+                f"Resumed session {session.id}: dropped {session.pruned} file read(s) of files changed since"
+            )
+        settings.WORKING_DIR = args.working_dir or session.working_directory
+    else:
+        settings.WORKING_DIR = args.working_dir or settings.WORKING_DIR
+        if not args.no_save:
+            from sessions import Session
+
+            session = Session(working_directory=settings.WORKING_DIR)
+
+    user_prompt: str = " ".join(args.prompt)
+
+    configure_tracing(args.trace)
+
+    if args.replay:
+        from replay import ReplayClient
+
+        base_client = ReplayClient(args.replay)
+    else:
+        from dotenv import load_dotenv
+        from google import genai
+
+        load_dotenv()
+        gem_api_key = os.environ.get("GEMINI_API_KEY")
+        base_client = genai.Client(api_key=gem_api_key)
+    client = base_client
+    if args.record:
+        from replay import RecordingClient
+
+        client = RecordingClient(client, args.record)
+
+    from resilience import ResilientClient
+
+    deadline = time.monotonic() + args.deadline if args.deadline else None
+    client = ResilientClient(client, deadline=deadline, verbose=args.verbose)
+
+    from routing import TurnSignals, load_router
+    from summary import SessionSummary
+
+    # A replay answers calls strictly in order, so rolling updates running beside the
+    # agent's turns would take its answers: replays default to the local template, and
+    # rolling updates are left out of recordings.
+    summary_mode = args.summary or ("template" if args.replay else None)
+    summary = SessionSummary(
+        (
+            ResilientClient(base_client, deadline=deadline)
+            if args.record and summary_mode in (None, "rolling")
+            else client
+        ),
+        model=load_router().choose(TurnSignals(0, "summary", 0, 0)).model,
+        mode=summary_mode,
+        verbose=args.verbose,
+    )
+
+    contents = run_agent(
+        client,
+        user_prompt,
+        verbose=args.verbose,
+        stream=args.stream,
+        session=session,
+        summary=summary,
+    )
+
+    summary_text = summary.result(contents)
+    if summary_text is not None:
+        print(summary_text)
+
+    if args.verbose:
+        stats = client.stats
+        print(
+            f"Model calls: {stats['calls']}, {stats['retries']} retries, "
+            f"{stats['failures']} failed, {stats['hedges']} hedged ({stats['hedge_wins']} won by the hedge)"
+        )
+
+    if session:
+        print(f"Session saved; continue it with --resume {session.id}")
 
-    print(summary)
+    configure_tracing(None)
 
 
 if __name__ == "__main__":
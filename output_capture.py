@@ -0,0 +1,244 @@
+import os
+import selectors
+import signal
+import subprocess
+import tempfile
+import time
+from typing import NamedTuple
+
+import settings
+
+
+class BoundedCapture:
+    """
+    Keeps the first `head_bytes` and the last `tail_bytes` of a stream and counts what falls in between.
+
+    Args:
+        head_bytes (int, optional): Bytes kept from the start. Defaults to `settings.RUN_OUTPUT_HEAD_BYTES`.
+        tail_bytes (int, optional): Bytes kept from the end. Defaults to `settings.RUN_OUTPUT_TAIL_BYTES`.
+    """
+
+    def __init__(
+        self,
+        head_bytes: int = settings.RUN_OUTPUT_HEAD_BYTES,
+        tail_bytes: int = settings.RUN_OUTPUT_TAIL_BYTES,
+    ):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[: len(self.tail) - self.tail_bytes]
+
+    @property
+    def dropped(self) -> int:
+        return self.total - len(self.head) - len(self.tail)
+
+    def text(self) -> str:
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.dropped:
+            return f"{head}\n[... {self.dropped} bytes of output dropped ...]\n{tail}"
+        return head + tail
+
+    def to_dict(self) -> dict:
+        """
+        Returns the capture as JSON-compatible data, bytes kept as latin-1 text.
+        """
+        return {
+            "head": self.head.decode("latin-1"),
+            "tail": self.tail.decode("latin-1"),
+            "total": self.total,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BoundedCapture":
+        capture = cls()
+        capture.head += data["head"].encode("latin-1")
+        capture.tail += data["tail"].encode("latin-1")
+        capture.total = data["total"]
+        return capture
+
+
+class RunResult(NamedTuple):
+    returncode: int
+    stdout: BoundedCapture
+    stderr: BoundedCapture
+    timed_out: bool
+    output_limited: bool
+    wall_time: float
+    cpu_time: float
+    max_rss_kb: int
+
+
+def _reap(pid: int, deadline: float):
+    """
+    Waits for `pid` to exit until `deadline`, keeping its resource usage.
+
+    Returns:
+        tuple | None: (wait status, rusage), or None if the process is still running at the deadline.
+    """
+    delay = 0.001
+    while True:
+        waited_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+        if waited_pid:
+            return status, rusage
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def drain_pipes(
+    captures: dict[int, BoundedCapture], deadline: float, max_output_bytes: int
+) -> tuple[bool, bool]:
+    """
+    Reads pipes into their captures until every pipe is closed, the deadline passes or the output grows too large.
+
+    Args:
+        captures (dict[int, BoundedCapture]): Capture of each pipe's read end, by file descriptor.
+        deadline (float): `time.monotonic()` value after which reading stops.
+        max_output_bytes (int): Combined output after which reading stops.
+
+    Returns:
+        tuple[bool, bool]: Whether the deadline passed and whether the output limit was hit.
+    """
+    with selectors.DefaultSelector() as selector:
+        for fd, capture in captures.items():
+            selector.register(fd, selectors.EVENT_READ, capture)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True, False
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                key.data.write(data)
+            if sum(capture.total for capture in captures.values()) > max_output_bytes:
+                return False, True
+    return False, False
+
+
+def run_bounded(
+    commands: list[str],
+    cwd: str,
+    timeout: float = 30,
+    max_output_bytes: int = settings.RUN_OUTPUT_KILL_BYTES,
+    stdin: str | None = None,
+) -> RunResult:
+    """
+    Runs a command, streaming its stdout and stderr into bounded captures.
+
+    Args:
+        commands (list[str]): The command and its arguments.
+        cwd (str): Directory to run the command in.
+        timeout (float, optional): Seconds after which the process is killed. Defaults to 30.
+        max_output_bytes (int, optional): Combined output after which the process is killed. Defaults to `settings.RUN_OUTPUT_KILL_BYTES`.
+        stdin (str | None, optional): Text sent to the process's standard input. Defaults to None, an empty input.
+
+    Returns:
+        RunResult: Exit code, captured output, why the process was stopped early, and resource usage.
+
+    Notes:
+        - The process runs in its own session, so stopping it kills any children it started too.
+        - Input comes from a temporary file rather than a pipe, so a process that never reads it cannot block.
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+    with tempfile.TemporaryFile() as input_file:
+        if stdin:
+            input_file.write(stdin.encode("utf-8"))
+            input_file.seek(0)
+        process = subprocess.Popen(
+            commands,
+            cwd=cwd,
+            stdin=input_file if stdin else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+    stdout, stderr = BoundedCapture(), BoundedCapture()
+    timed_out, output_limited = drain_pipes(
+        {process.stdout.fileno(): stdout, process.stderr.fileno(): stderr},  # type: ignore
+        deadline,
+        max_output_bytes,
+    )
+
+    reaped = None
+    if not (timed_out or output_limited):
+        reaped = _reap(process.pid, deadline)
+        timed_out = reaped is None
+    if reaped is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        _, status, rusage = os.wait4(process.pid, 0)
+    else:
+        status, rusage = reaped
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stdout.close()  # type: ignore
+    process.stderr.close()  # type: ignore
+
+    return RunResult(
+        returncode=process.returncode,
+        stdout=stdout,
+        stderr=stderr,
+        timed_out=timed_out,
+        output_limited=output_limited,
+        wall_time=time.monotonic() - start,
+        cpu_time=rusage.ru_utime + rusage.ru_stime,
+        max_rss_kb=rusage.ru_maxrss,
+    )
+
+
+def format_run_result(result: RunResult, timeout: float = 30) -> str:
+    """
+    Formats a run the way `run_python_file` reports it to the model.
+
+    Returns:
+        str: STDOUT and STDERR sections, the exit code if non-zero, why the run was stopped early
+        and a resource usage line.
+    """
+    output = []
+    if result.stdout.total:
+        output.append(f"STDOUT:\n{result.stdout.text()}")
+    if result.stderr.total:
+        output.append(f"STDERR:\n{result.stderr.text()}")
+    if not output:
+        output.append("No output produced.")
+
+    if result.timed_out:
+        output.append(f"Process killed: timed out after {timeout:g} seconds")
+    elif result.output_limited:
+        output.append(
+            f"Process killed: output exceeded {settings.RUN_OUTPUT_KILL_BYTES} bytes"
+        )
+    elif result.returncode != 0:
+        output.append(f"Process exited with code {result.returncode}")
+
+    output.append(format_resources(result))
+    return "\n".join(output)
+
+
+def format_resources(result: RunResult) -> str:
+    """
+    Returns the resource usage line of a run.
+    """
+    return (
+        f"Resources: wall {result.wall_time:.2f}s, cpu {result.cpu_time:.2f}s, "
+        f"max RSS {result.max_rss_kb / 1024:.1f} MB"
+    )
@@ -0,0 +1,348 @@
+"""
+Record and replay of model calls, so agent sessions can run offline and deterministically.
+
+A recording is a JSONL file with one line per model call. Each line holds the request
+(model, a structural signature of the contents, and their serialized size) and either
+the full response or, for streamed calls, the list of chunks.
+
+`ReplayClient.caches` emulates the context caching endpoints in memory, so cached sessions
+replay offline too.
+"""
+
+import datetime
+import itertools
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from google.genai import types
+
+
+class ReplayMismatch(Exception):
+    pass
+
+
+def contents_signature(contents: list[types.Content]) -> list:
+    """
+    Describes the shape of a conversation: roles, text parts and which functions were called or answered.
+
+    Notes:
+        - Tool output text is deliberately left out, as it contains timings and other run-dependent values.
+    """
+    signature = []
+    for content in contents:
+        parts = []
+        for part in content.parts or []:
+            if part.function_call:
+                parts.append(f"call:{part.function_call.name}")
+            elif part.function_response:
+                parts.append(f"response:{part.function_response.name}")
+            elif part.text is not None:
+                parts.append("text")
+        signature.append([content.role, parts])
+    return signature
+
+
+def serialize_contents(contents: list[types.Content]) -> str:
+    return json.dumps(
+        [content.model_dump(mode="json", exclude_none=True) for content in contents]
+    )
+
+
+class _RecordingModels:
+    def __init__(self, recorder: "RecordingClient", models):
+        self._recorder = recorder
+        self._models = models
+
+    def generate_content(self, *, model: str, contents: list, config=None):
+        response = self._models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        self._recorder.write(
+            model,
+            contents,
+            {"response": response.model_dump(mode="json", exclude_none=True)},
+        )
+        return response
+
+    def generate_content_stream(self, *, model: str, contents: list, config=None):
+        chunks = []
+        for chunk in self._models.generate_content_stream(
+            model=model, contents=contents, config=config
+        ):
+            chunks.append(chunk.model_dump(mode="json", exclude_none=True))
+            yield chunk
+        self._recorder.write(model, contents, {"chunks": chunks})
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _AsyncRecordingModels:
+    def __init__(self, recorder: "RecordingClient", models):
+        self._recorder = recorder
+        self._models = models
+
+    async def generate_content(self, *, model: str, contents: list, config=None):
+        response = await self._models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        self._recorder.write(
+            model,
+            contents,
+            {"response": response.model_dump(mode="json", exclude_none=True)},
+        )
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class RecordingClient:
+    """
+    Wraps a `genai.Client` and appends every model call to a JSONL recording.
+
+    Args:
+        client (genai.Client): The client doing the real calls.
+        path (str): The recording file; calls are appended to it.
+    """
+
+    def __init__(self, client, path: str):
+        self._client = client
+        self.path = path
+        self._lock = threading.Lock()
+        self.models = _RecordingModels(self, client.models)
+        self.aio = SimpleNamespace(
+            models=_AsyncRecordingModels(self, client.aio.models)
+        )
+
+    def write(self, model: str, contents: list, result: dict) -> None:
+        serialized = serialize_contents(contents)
+        record = {
+            "model": model,
+            "request": {
+                "signature": contents_signature(contents),
+                "bytes": len(serialized),
+            },
+            **result,
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class StubCaches:
+    """
+    In-memory stand-in for `client.caches`, with the same create/get/update/delete/list calls.
+
+    Notes:
+        - Token counts are estimated at four characters per token.
+        - Using, getting or updating an expired or deleted cache raises `ValueError`.
+    """
+
+    def __init__(self):
+        self.caches: dict[str, types.CachedContent] = {}
+        self.created = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _expiry(ttl: str | None) -> datetime.datetime:
+        seconds = float(ttl.rstrip("s")) if ttl else 3600.0
+        return datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=seconds
+        )
+
+    def create(self, *, model: str, config=None) -> types.CachedContent:
+        config = types.CreateCachedContentConfig.model_validate(config or {})
+        now = datetime.datetime.now(datetime.timezone.utc)
+        prefix = config.model_dump_json(
+            include={"system_instruction", "tools", "contents"}, exclude_none=True
+        )
+        cached = types.CachedContent(
+            name=f"cachedContents/stub-{next(self._ids)}",
+            display_name=config.display_name,
+            model=model,
+            create_time=now,
+            update_time=now,
+            expire_time=self._expiry(config.ttl),
+            usage_metadata=types.CachedContentUsageMetadata(
+                total_token_count=len(prefix) // 4
+            ),
+        )
+        with self._lock:
+            self.caches[cached.name] = cached  # type: ignore
+            self.created += 1
+        return cached
+
+    def get(self, *, name: str, config=None) -> types.CachedContent:
+        with self._lock:
+            cached = self.caches.get(name)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        if cached is None or cached.expire_time <= now:  # type: ignore
+            raise ValueError(f"CachedContent not found (or expired): {name}")
+        return cached
+
+    def update(self, *, name: str, config=None) -> types.CachedContent:
+        config = types.UpdateCachedContentConfig.model_validate(config or {})
+        cached = self.get(name=name).model_copy(
+            update={
+                "expire_time": self._expiry(config.ttl),
+                "update_time": datetime.datetime.now(datetime.timezone.utc),
+            }
+        )
+        with self._lock:
+            self.caches[name] = cached
+        return cached
+
+    def delete(self, *, name: str, config=None) -> None:
+        with self._lock:
+            self.caches.pop(name, None)
+
+    def list(self, *, config=None) -> list[types.CachedContent]:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        with self._lock:
+            return [c for c in self.caches.values() if c.expire_time > now]  # type: ignore
+
+    def apply_usage(
+        self, response: types.GenerateContentResponse, config
+    ) -> types.GenerateContentResponse:
+        """
+        Reports the cached tokens of `config.cached_content` in a replayed response's usage.
+        """
+        name = getattr(config, "cached_content", None)
+        if not name:
+            return response
+        tokens = self.get(name=name).usage_metadata.total_token_count or 0  # type: ignore
+        usage = response.usage_metadata
+        if usage is None or usage.cached_content_token_count:
+            return response
+        return response.model_copy(
+            update={
+                "usage_metadata": usage.model_copy(
+                    update={
+                        "cached_content_token_count": tokens,
+                        "prompt_token_count": (usage.prompt_token_count or 0) + tokens,
+                    }
+                )
+            }
+        )
+
+
+class _ReplayModels:
+    def __init__(self, replay: "ReplayClient"):
+        self._replay = replay
+
+    def generate_content(self, *, model: str, contents: list, config=None):
+        caches = self._replay.caches
+        record = self._replay.next_record(model, contents)
+        if "response" in record:
+            return caches.apply_usage(
+                types.GenerateContentResponse.model_validate(record["response"]),
+                config,
+            )
+        chunks = [
+            types.GenerateContentResponse.model_validate(c) for c in record["chunks"]
+        ]
+        return caches.apply_usage(_merge_chunks(chunks), config)
+
+    def generate_content_stream(self, *, model: str, contents: list, config=None):
+        caches = self._replay.caches
+        record = self._replay.next_record(model, contents)
+        for chunk in record["chunks"] if "chunks" in record else [record["response"]]:
+            yield caches.apply_usage(
+                types.GenerateContentResponse.model_validate(chunk), config
+            )
+
+
+class _AsyncReplayModels:
+    def __init__(self, models: _ReplayModels):
+        self._models = models
+
+    async def generate_content(self, *, model: str, contents: list, config=None):
+        return self._models.generate_content(
+            model=model, contents=contents, config=config
+        )
+
+
+class ReplayClient:
+    """
+    Stands in for `genai.Client`, answering model calls from a recording in order.
+
+    Args:
+        path (str | None, optional): A recording made by `RecordingClient`. Defaults to None.
+        records (list[dict] | None, optional): Recorded calls given directly instead of a file. Defaults to None.
+        strict (bool, optional): If True, raises `ReplayMismatch` when a request's shape differs from the
+            recorded one. Defaults to False.
+
+    Notes:
+        - Per call it keeps the time the request arrived and how long serializing its contents took,
+          so benchmarks can measure the agent loop without a network in the way.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        records: list[dict] | None = None,
+        strict: bool = False,
+    ):
+        if records is None:
+            with open(path, "r", encoding="utf-8") as f:  # type: ignore
+                records = [json.loads(line) for line in f if line.strip()]
+        self.records = records
+        self.strict = strict
+        self.position = 0
+        self.calls: list[dict] = []
+        self._lock = threading.Lock()
+        self.caches = StubCaches()
+        self.models = _ReplayModels(self)
+        self.aio = SimpleNamespace(models=_AsyncReplayModels(self.models))
+
+    def next_record(self, model: str, contents: list) -> dict:
+        start = time.perf_counter()
+        serialized = serialize_contents(contents)
+        serialize_time = time.perf_counter() - start
+
+        with self._lock:
+            if self.position >= len(self.records):
+                raise ReplayMismatch(
+                    f"Recording exhausted after {len(self.records)} model calls"
+                )
+            record = self.records[self.position]
+            self.position += 1
+            self.calls.append(
+                {
+                    "started": start,
+                    "serialize_time": serialize_time,
+                    "request_bytes": len(serialized),
+                    "contents": len(contents),
+                }
+            )
+
+        if self.strict:
+            expected = record.get("request", {}).get("signature")
+            actual = contents_signature(contents)
+            if expected is not None and expected != actual:
+                raise ReplayMismatch(
+                    f"Model call {self.position} differs from the recording: "
+                    f"expected {expected}, got {actual}"
+                )
+        return record
+
+
+def _merge_chunks(
+    chunks: list[types.GenerateContentResponse],
+) -> types.GenerateContentResponse:
+    parts = []
+    role = "model"
+    for chunk in chunks:
+        if chunk.candidates and chunk.candidates[0].content:
+            role = chunk.candidates[0].content.role or role
+            parts.extend(chunk.candidates[0].content.parts or [])
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role=role, parts=parts))],
+        usage_metadata=chunks[-1].usage_metadata if chunks else None,
+    )
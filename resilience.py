@@ -0,0 +1,453 @@
+"""
+Retries, deadlines, rate limiting and request hedging around model calls.
+
+`ResilientClient` wraps a `genai.Client` (or a stand-in such as `replay.ReplayClient`) and
+exposes the same `models` and `aio.models` calls:
+
+- Transient failures (408, 429, 5xx and connection errors) are retried with exponential
+  backoff and full jitter, up to `settings.RETRY_ATTEMPTS` attempts.
+- Every call has a deadline: the session deadline if one was given, capped at
+  `settings.MODEL_CALL_TIMEOUT_SECONDS`. Each attempt is sent with the remaining time as its
+  HTTP timeout, and no retry is started that could not finish before the deadline.
+- One token bucket per process limits the request rate of all sessions together.
+- With `settings.HEDGE_REQUESTS`, a duplicate request is sent once a call has taken longer
+  than the p95 latency of recent calls to the same model, and the first answer wins.
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+import httpx
+from google.genai import types
+
+import settings
+from tracing import current_span
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def is_retryable(err: BaseException) -> bool:
+    """
+    Tells whether a failed model call may succeed when sent again.
+    """
+    if isinstance(err, DeadlineExceeded):
+        return False
+    code = getattr(err, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(err, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Returns the delay before retry number `attempt` (0-based), with full jitter.
+    """
+    return random.uniform(
+        0, min(settings.RETRY_MAX_DELAY, settings.RETRY_BASE_DELAY * 2**attempt)
+    )
+
+
+class RateLimiter:
+    """
+    Token bucket limiting requests per minute, safe to share between threads and event loops.
+
+    Args:
+        requests_per_minute (float): Sustained request rate.
+        burst (int, optional): Requests allowed at once after an idle period. Defaults to `settings.RATE_LIMIT_BURST`.
+
+    Notes:
+        - Callers reserve a token up front and then wait for their turn, so waiting callers
+          are served in order and the lock is never held while sleeping.
+    """
+
+    def __init__(
+        self, requests_per_minute: float, burst: int = settings.RATE_LIMIT_BURST
+    ):
+        self.rate = requests_per_minute / 60
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Takes a token and returns how many seconds to wait before using it.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a token only if one is free right now, without waiting or going into debt.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def acquire(self, deadline: float | None = None) -> None:
+        delay = self.reserve()
+        if deadline is not None and time.monotonic() + delay > deadline:
+            raise DeadlineExceeded("Rate limit wait would pass the deadline")
+        time.sleep(delay)
+
+    async def aacquire(self, deadline: float | None = None) -> None:
+        delay = self.reserve()
+        if deadline is not None and time.monotonic() + delay > deadline:
+            raise DeadlineExceeded("Rate limit wait would pass the deadline")
+        await asyncio.sleep(delay)
+
+
+class LatencyTracker:
+    """
+    Keeps recent successful call latencies per model and their p95.
+    """
+
+    def __init__(self, window: int = settings.HEDGE_WINDOW):
+        self.window = window
+        self._latencies: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(self, model: str, latency: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.window)).append(latency)
+
+    def p95(self, model: str) -> float | None:
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if len(latencies) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+
+_limiter: RateLimiter | None = None
+_latencies = LatencyTracker()
+_hedge_pool: ThreadPoolExecutor | None = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """
+    Returns the process-wide rate limiter, or None if `settings.RATE_LIMIT_RPM` is unset.
+    """
+    global _limiter
+    with _shared_lock:
+        if _limiter is None and settings.RATE_LIMIT_RPM:
+            _limiter = RateLimiter(settings.RATE_LIMIT_RPM)
+        return _limiter
+
+
+def _get_hedge_pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _shared_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=settings.HEDGE_WORKERS)
+        return _hedge_pool
+
+
+def _may_hedge() -> bool:
+    """
+    Takes a rate limit token for a hedge if one is free; hedging must not cost a slot other sessions are waiting for.
+    """
+    limiter = get_rate_limiter()
+    return limiter is None or limiter.try_acquire()
+
+
+def _with_timeout(config, seconds: float):
+    config = types.GenerateContentConfig.model_validate(config or {})
+    http_options = config.http_options or types.HttpOptions()
+    return config.model_copy(
+        update={
+            "http_options": http_options.model_copy(
+                update={"timeout": max(int(seconds * 1000), 1)}
+            )
+        }
+    )
+
+
+class _ResilientModels:
+    def __init__(self, resilient: "ResilientClient", models):
+        self._resilient = resilient
+        self._models = models
+
+    def _call(self, model: str, contents: list, config):
+        start = time.monotonic()
+        response = self._models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        _latencies.add(model, time.monotonic() - start)
+        return response
+
+    def _hedged(self, model: str, contents: list, config, deadline: float):
+        threshold = _latencies.p95(model) if settings.HEDGE_REQUESTS else None
+        if threshold is None:
+            return self._call(model, contents, config), False
+
+        pool = _get_hedge_pool()
+        primary = pool.submit(
+            contextvars.copy_context().run, self._call, model, contents, config
+        )
+        done, _ = wait([primary], timeout=threshold)
+        if done:
+            return primary.result(), False
+
+        if not _may_hedge():
+            return primary.result(timeout=max(deadline - time.monotonic(), 0)), False
+        self._resilient.stats["hedges"] += 1
+        hedge = pool.submit(
+            contextvars.copy_context().run, self._call, model, contents, config
+        )
+        # The losing request cannot be cancelled and finishes in the background.
+        pending = {primary, hedge}
+        error: BaseException | None = None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=max(deadline - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            if not done:
+                raise DeadlineExceeded(f"No response from {model} before the deadline")
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._resilient.stats["hedge_wins"] += 1
+                    return future.result(), True
+                error = future.exception()
+        raise error  # type: ignore
+
+    def generate_content(self, *, model: str, contents: list, config=None):
+        deadline = self._resilient.call_deadline()
+        limiter = get_rate_limiter()
+        self._resilient.stats["calls"] += 1
+        for attempt in range(settings.RETRY_ATTEMPTS):
+            if limiter is not None:
+                limiter.acquire(deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No time left to call {model}")
+            try:
+                response, hedged = self._hedged(
+                    model, contents, _with_timeout(config, remaining), deadline
+                )
+            except Exception as err:
+                delay = backoff_delay(attempt)
+                if not is_retryable(err) or attempt + 1 == settings.RETRY_ATTEMPTS:
+                    self._resilient.stats["failures"] += 1
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    self._resilient.stats["failures"] += 1
+                    raise DeadlineExceeded(
+                        f"Retrying {model} would pass the deadline"
+                    ) from err
+                self._resilient.note_retry(model, attempt, delay, err)
+                time.sleep(delay)
+                continue
+            current_span().set(attempts=attempt + 1, hedged=hedged)
+            return response
+
+    def generate_content_stream(self, *, model: str, contents: list, config=None):
+        """
+        Retries a stream until its first chunk arrives; later failures are raised, since the
+        caller may already have acted on earlier chunks.
+        """
+        deadline = self._resilient.call_deadline()
+        limiter = get_rate_limiter()
+        self._resilient.stats["calls"] += 1
+        for attempt in range(settings.RETRY_ATTEMPTS):
+            if limiter is not None:
+                limiter.acquire(deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No time left to call {model}")
+            try:
+                chunks = iter(
+                    self._models.generate_content_stream(
+                        model=model,
+                        contents=contents,
+                        config=_with_timeout(config, remaining),
+                    )
+                )
+                first = next(chunks)
+            except StopIteration:
+                return
+            except Exception as err:
+                delay = backoff_delay(attempt)
+                if not is_retryable(err) or attempt + 1 == settings.RETRY_ATTEMPTS:
+                    self._resilient.stats["failures"] += 1
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    self._resilient.stats["failures"] += 1
+                    raise DeadlineExceeded(
+                        f"Retrying {model} would pass the deadline"
+                    ) from err
+                self._resilient.note_retry(model, attempt, delay, err)
+                time.sleep(delay)
+                continue
+            current_span().set(attempts=attempt + 1)
+            yield first
+            yield from chunks
+            return
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class _AsyncResilientModels:
+    def __init__(self, resilient: "ResilientClient", models):
+        self._resilient = resilient
+        self._models = models
+
+    async def _call(self, model: str, contents: list, config):
+        start = time.monotonic()
+        response = await self._models.generate_content(
+            model=model, contents=contents, config=config
+        )
+        _latencies.add(model, time.monotonic() - start)
+        return response
+
+    async def _hedged(self, model: str, contents: list, config, deadline: float):
+        threshold = _latencies.p95(model) if settings.HEDGE_REQUESTS else None
+        if threshold is None:
+            return await self._call(model, contents, config), False
+
+        primary = asyncio.ensure_future(self._call(model, contents, config))
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done:
+            return primary.result(), False
+        if not _may_hedge():
+            return (
+                await asyncio.wait_for(primary, max(deadline - time.monotonic(), 0)),
+                False,
+            )
+
+        self._resilient.stats["hedges"] += 1
+        hedge = asyncio.ensure_future(self._call(model, contents, config))
+        pending = {primary, hedge}
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(deadline - time.monotonic(), 0),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    raise DeadlineExceeded(
+                        f"No response from {model} before the deadline"
+                    )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._resilient.stats["hedge_wins"] += 1
+                        return task.result(), True
+                    error = task.exception()
+            raise error  # type: ignore
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_content(self, *, model: str, contents: list, config=None):
+        deadline = self._resilient.call_deadline()
+        limiter = get_rate_limiter()
+        self._resilient.stats["calls"] += 1
+        for attempt in range(settings.RETRY_ATTEMPTS):
+            if limiter is not None:
+                await limiter.aacquire(deadline)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"No time left to call {model}")
+            try:
+                response, hedged = await self._hedged(
+                    model, contents, _with_timeout(config, remaining), deadline
+                )
+            except Exception as err:
+                delay = backoff_delay(attempt)
+                if not is_retryable(err) or attempt + 1 == settings.RETRY_ATTEMPTS:
+                    self._resilient.stats["failures"] += 1
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    self._resilient.stats["failures"] += 1
+                    raise DeadlineExceeded(
+                        f"Retrying {model} would pass the deadline"
+                    ) from err
+                self._resilient.note_retry(model, attempt, delay, err)
+                await asyncio.sleep(delay)
+                continue
+            current_span().set(attempts=attempt + 1, hedged=hedged)
+            return response
+
+    def __getattr__(self, name):
+        return getattr(self._models, name)
+
+
+class ResilientClient:
+    """
+    Wraps a `genai.Client` so model calls are retried, rate limited, bounded by a deadline and optionally hedged.
+
+    Args:
+        client (genai.Client): The client doing the real calls.
+        deadline (float | None, optional): `time.monotonic()` value by which the whole session must be done.
+            Defaults to None, leaving only the per-call timeout.
+        verbose (bool, optional): If True, prints every retry. Defaults to False.
+
+    Notes:
+        - `stats` counts calls, retries, failures, hedges and hedges that won.
+    """
+
+    def __init__(self, client, deadline: float | None = None, verbose: bool = False):
+        self._client = client
+        self.deadline = deadline
+        self.verbose = verbose
+        self.stats = {
+            "calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+        self.models = _ResilientModels(self, client.models)
+        self.aio = SimpleNamespace(
+            models=_AsyncResilientModels(self, client.aio.models)
+        )
+
+    def call_deadline(self) -> float:
+        """
+        Returns the deadline of a call starting now.
+        """
+        deadline = time.monotonic() + settings.MODEL_CALL_TIMEOUT_SECONDS
+        if self.deadline is not None:
+            deadline = min(deadline, self.deadline)
+        return deadline
+
+    def note_retry(
+        self, model: str, attempt: int, delay: float, err: BaseException
+    ) -> None:
+        self.stats["retries"] += 1
+        if self.verbose:
+            print(
+                f"Model call to {model} failed ({type(err).__name__}: {err}); "
+                f"retry {attempt + 1} in {delay:.1f}s"
+            )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,235 @@
+"""
+Per-turn model routing.
+
+A router looks at signals about the coming turn and picks the model to send it to. It can
+also name a fallback model when a call fails. Routers are chosen by name with
+`settings.ROUTER`: "fixed" always uses `settings.MODEL_ID`, "rules" sends exploration to
+`settings.ROUTER_FAST_MODEL` and edits, debugging and large contexts to
+`settings.ROUTER_STRONG_MODEL`. "module:attribute" loads any class with the same methods.
+"""
+
+import importlib
+import json
+import threading
+from typing import NamedTuple
+
+from google.genai import types
+
+import settings
+
+EDIT_FUNCTIONS = {"write_file", "apply_patch", "run_python_file"}
+
+
+class TurnSignals(NamedTuple):
+    turn: int  # 1-based iteration, 0 for the closing summary
+    turn_type: str  # "exploration", "edit", "final" or "summary"
+    context_tokens: int  # prompt tokens reported for the previous turn
+    recent_errors: int  # failed tool calls in the previous turn
+
+
+class Route(NamedTuple):
+    model: str
+    reason: str
+
+
+def is_error_result(result) -> bool:
+    """
+    Tells whether a tool result reports a failure.
+    """
+    return isinstance(result, str) and (
+        result.startswith("Error") or "Process exited with code" in result
+    )
+
+
+def turn_signals(
+    contents: list[types.Content],
+    turn: int,
+    context_tokens: int,
+    max_iters: int | None = None,
+) -> TurnSignals:
+    """
+    Derives the routing signals for the next turn from the conversation so far.
+
+    Args:
+        contents (list[types.Content]): The conversation so far.
+        turn (int): The 1-based iteration about to run.
+        context_tokens (int): Prompt tokens reported for the previous turn, 0 for the first.
+        max_iters (int | None, optional): The iteration limit. Defaults to `settings.MAX_ITERS`.
+
+    Returns:
+        TurnSignals: The signals for the turn.
+
+    Notes:
+        - The turn type follows the previous turn: after writes or runs the model is editing
+          and testing, otherwise it is still exploring. The last allowed turn is "final".
+    """
+    max_iters = max_iters or settings.MAX_ITERS
+    last_calls: list[str] = []
+    errors = 0
+    for content in reversed(contents):
+        if content.role == "model":
+            last_calls = [
+                part.function_call.name or ""
+                for part in content.parts or []
+                if part.function_call
+            ]
+            break
+        for part in content.parts or []:
+            if part.function_response and is_error_result(
+                (part.function_response.response or {}).get("result")
+            ):
+                errors += 1
+
+    if turn >= max_iters:
+        turn_type = "final"
+    elif EDIT_FUNCTIONS.intersection(last_calls):
+        turn_type = "edit"
+    else:
+        turn_type = "exploration"
+    return TurnSignals(turn, turn_type, context_tokens, errors)
+
+
+class FixedRouter:
+    """
+    Always routes to one model, with no fallback.
+
+    Args:
+        model (str | None, optional): The model. Defaults to `settings.MODEL_ID`.
+    """
+
+    def __init__(self, model: str | None = None):
+        self.model = model or settings.MODEL_ID
+
+    def choose(self, signals: TurnSignals) -> Route:
+        return Route(self.model, "fixed")
+
+    def fallback(self, route: Route, error: Exception) -> Route | None:
+        return None
+
+
+class RuleRouter:
+    """
+    Routes cheap turns to a fast model and hard ones to a strong model.
+
+    Args:
+        fast_model (str, optional): Model for exploration and summaries. Defaults to `settings.ROUTER_FAST_MODEL`.
+        strong_model (str, optional): Model for edits, final answers, tool errors and large contexts.
+            Defaults to `settings.ROUTER_STRONG_MODEL`.
+        large_context_tokens (int, optional): Context size from which the strong model is used.
+            Defaults to `settings.ROUTER_LARGE_CONTEXT_TOKENS`.
+        error_threshold (int, optional): Tool errors in the previous turn from which the strong model is used.
+            Defaults to `settings.ROUTER_ERROR_THRESHOLD`.
+
+    Notes:
+        - A failed call is retried once on the other model: the fast model escalates to the
+          strong one and the strong one falls back to the fast one.
+    """
+
+    def __init__(
+        self,
+        fast_model: str = settings.ROUTER_FAST_MODEL,
+        strong_model: str = settings.ROUTER_STRONG_MODEL,
+        large_context_tokens: int = settings.ROUTER_LARGE_CONTEXT_TOKENS,
+        error_threshold: int = settings.ROUTER_ERROR_THRESHOLD,
+    ):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.large_context_tokens = large_context_tokens
+        self.error_threshold = error_threshold
+
+    def choose(self, signals: TurnSignals) -> Route:
+        if signals.recent_errors >= self.error_threshold:
+            return Route(self.strong_model, f"{signals.recent_errors} tool error(s)")
+        if signals.context_tokens >= self.large_context_tokens:
+            return Route(self.strong_model, f"{signals.context_tokens} context tokens")
+        if signals.turn_type in ("edit", "final"):
+            return Route(self.strong_model, signals.turn_type)
+        return Route(self.fast_model, signals.turn_type)
+
+    def fallback(self, route: Route, error: Exception) -> Route | None:
+        if route.model == self.fast_model:
+            return Route(self.strong_model, f"escalated after {type(error).__name__}")
+        if route.model == self.strong_model:
+            return Route(self.fast_model, f"fell back after {type(error).__name__}")
+        return None
+
+
+ROUTERS = {"fixed": FixedRouter, "rules": RuleRouter}
+
+
+def load_router(name: str | None = None):
+    """
+    Returns a router by name, or by "module:attribute" for a custom router class.
+
+    Args:
+        name (str | None, optional): The router. Defaults to `settings.ROUTER`.
+
+    Raises:
+        ValueError: If the name is neither a known router nor a "module:attribute" path.
+    """
+    name = name or settings.ROUTER
+    if name in ROUTERS:
+        return ROUTERS[name]()
+    if ":" not in name:
+        raise ValueError(
+            f"Unknown router {name!r}; use one of {sorted(ROUTERS)} or 'module:attribute'"
+        )
+    module_name, attribute = name.split(":", 1)
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+class RoutingLog:
+    """
+    Records every routing decision with the latency and tokens of the call it routed.
+
+    Args:
+        path (str | None, optional): JSONL file decisions are appended to. Defaults to `settings.ROUTING_LOG`.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path or settings.ROUTING_LOG
+        self.decisions: list[dict] = []
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        signals: TurnSignals,
+        route: Route,
+        latency: float,
+        usage_metadata: types.GenerateContentResponseUsageMetadata | None,
+        error: str | None = None,
+    ) -> None:
+        decision = {
+            **signals._asdict(),
+            "model": route.model,
+            "reason": route.reason,
+            "latency_ms": round(latency * 1000, 1),
+            "prompt_tokens": (
+                usage_metadata.prompt_token_count or 0 if usage_metadata else 0
+            ),
+            "response_tokens": (
+                usage_metadata.candidates_token_count or 0 if usage_metadata else 0
+            ),
+            "error": error,
+        }
+        with self._lock:
+            self.decisions.append(decision)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(decision) + "\n")
+
+    def summary(self) -> str:
+        """
+        Returns calls, mean latency and tokens per model.
+        """
+        lines = []
+        for model in dict.fromkeys(d["model"] for d in self.decisions):
+            decisions = [d for d in self.decisions if d["model"] == model]
+            lines.append(
+                f"{model}: {len(decisions)} call(s), "
+                f"mean {sum(d['latency_ms'] for d in decisions) / len(decisions):.0f} ms, "
+                f"{sum(d['prompt_tokens'] for d in decisions)} prompt / "
+                f"{sum(d['response_tokens'] for d in decisions)} response tokens, "
+                f"{sum(d['error'] is not None for d in decisions)} failed"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,275 @@
+"""
+Persistent agent sessions, so a follow-up question can continue where the last run stopped.
+
+A session is a JSONL file in `settings.SESSIONS_DIR`: a header line, then one line per
+`types.Content`. Tool outputs longer than `settings.SESSION_BLOB_MIN_BYTES` are stored once
+under `blobs/` by their SHA-256 and referenced as {"$blob": hash}. Each `get_file_content`
+result also records the file's mtime and size as they were when it was read, so a resumed
+session can drop reads of files that changed in the meantime.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Callable
+
+from google.genai import types
+
+import settings
+from atomic_io import atomic_write
+from compaction import pair_calls, with_response
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(settings.SESSIONS_DIR, "blobs", digest[:2], digest)
+
+
+def _store_blob(text: str) -> str:
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, text, fsync=False)
+    return digest
+
+
+def _load_blob(digest: str) -> str:
+    with open(_blob_path(digest), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _read_key(path: str, result: str) -> tuple[str, str]:
+    return path, hashlib.sha256(result.encode("utf-8")).hexdigest()
+
+
+def _read_result(content: types.Content, part_index: int) -> str | None:
+    parts = content.parts or []
+    if part_index >= len(parts) or not parts[part_index].function_response:
+        return None
+    result = (parts[part_index].function_response.response or {}).get("result")  # type: ignore
+    return result if isinstance(result, str) else None
+
+
+def _file_stat(working_directory: str, rel_path: str) -> list[int] | None:
+    try:
+        stat = os.stat(os.path.join(working_directory, rel_path))
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def list_sessions() -> list[str]:
+    """
+    Returns the saved session ids, most recently updated last.
+    """
+    try:
+        names = [n for n in os.listdir(settings.SESSIONS_DIR) if n.endswith(".jsonl")]
+    except FileNotFoundError:
+        return []
+    names.sort(key=lambda n: os.path.getmtime(os.path.join(settings.SESSIONS_DIR, n)))
+    return [name[: -len(".jsonl")] for name in names]
+
+
+class Session:
+    """
+    A conversation saved to disk after every turn.
+
+    Args:
+        session_id (str | None, optional): Id of the session; a new one is generated if omitted. Defaults to None.
+        working_directory (str, optional): The directory the session's tools ran in. Defaults to `settings.WORKING_DIR`.
+
+    Notes:
+        - `save` appends only the contents added since the last save. The file is rewritten
+          only when compaction changed earlier contents, reusing the lines that did not change.
+        - The stat saved with a read is the one `record_read` took just before the file was read,
+          looked up by path and result, so it survives later writes and rewrites. A read without
+          one, such as a compacted stub, is saved without a stat and dropped on resume.
+    """
+
+    def __init__(
+        self,
+        session_id: str | None = None,
+        working_directory: str = settings.WORKING_DIR,
+    ):
+        self.id = (
+            session_id or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}"
+        )
+        self.working_directory = os.path.realpath(working_directory)
+        self.path = os.path.join(settings.SESSIONS_DIR, f"{self.id}.jsonl")
+        self.contents: list[types.Content] = []
+        self.pruned = 0
+        self._lines: list[str] = []
+        self._rewrite = False
+        self._read_stats: dict[tuple[str, str], list[int] | None] = {}
+
+    def _header(self) -> str:
+        return json.dumps(
+            {"session": self.id, "working_directory": self.working_directory}
+        )
+
+    def record_read(
+        self,
+        function_call_part: types.FunctionCall,
+        run: Callable[[], types.Content],
+    ) -> types.Content:
+        """
+        Runs a tool call and, if it is a `get_file_content`, remembers the file's stat from just before the read.
+
+        Args:
+            function_call_part (types.FunctionCall): The call being run.
+            run (Callable[[], types.Content]): Runs the call and returns its response.
+
+        Returns:
+            types.Content: The response returned by `run`.
+
+        Notes:
+            - Taking the stat before the read errs on the safe side: a change made while the file
+              is read leaves a stat that no longer matches, and the read is dropped on resume.
+        """
+        path = (function_call_part.args or {}).get("file_path")
+        if function_call_part.name != "get_file_content" or not path:
+            return run()
+        path = os.path.normpath(path)
+        stat = _file_stat(self.working_directory, path)
+        response = run()
+        result = _read_result(response, 0)
+        if result is not None:
+            self._read_stats[_read_key(path, result)] = stat
+        return response
+
+    def _serialize(self, content: types.Content, reads: dict[int, str]) -> str:
+        record = content.model_dump(mode="json", exclude_none=True)
+        for part_index, part in enumerate(record.get("parts", [])):
+            response = part.get("function_response", {}).get("response") or {}
+            for key, value in response.items():
+                if (
+                    isinstance(value, str)
+                    and len(value) >= settings.SESSION_BLOB_MIN_BYTES
+                ):
+                    response[key] = {"$blob": _store_blob(value)}
+        line = {"content": record}
+        file_stats = []
+        for part_index, path in reads.items():
+            result = _read_result(content, part_index)
+            key = _read_key(path, result) if result is not None else None
+            file_stats.append([part_index, path, self._read_stats.get(key)])  # type: ignore
+        if file_stats:
+            line["reads"] = file_stats
+        return json.dumps(line)
+
+    def _reads_by_content(
+        self, contents: list[types.Content]
+    ) -> dict[int, dict[int, str]]:
+        reads: dict[int, dict[int, str]] = {}
+        for content_index, part_index, call in pair_calls(contents):
+            if call is not None and call.name == "get_file_content" and call.args:
+                path = call.args.get("file_path")
+                if path:
+                    reads.setdefault(content_index, {})[part_index] = os.path.normpath(
+                        path
+                    )
+        return reads
+
+    def save(self, contents: list[types.Content]) -> None:
+        """
+        Writes the conversation to disk, appending when only new contents were added.
+        """
+        unchanged = 0
+        for saved, current in zip(self.contents, contents):
+            if saved is not current and saved != current:
+                break
+            unchanged += 1
+
+        reads = self._reads_by_content(contents)
+        lines = self._lines[:unchanged] + [
+            self._serialize(contents[index], reads.get(index, {}))
+            for index in range(unchanged, len(contents))
+        ]
+
+        os.makedirs(settings.SESSIONS_DIR, exist_ok=True)
+        if (
+            unchanged == len(self._lines)
+            and not self._rewrite
+            and os.path.exists(self.path)
+        ):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(line + "\n" for line in lines[unchanged:])
+        else:
+            atomic_write(
+                self.path,
+                "".join(line + "\n" for line in [self._header(), *lines]),
+                fsync=False,
+            )
+        self.contents = list(contents)
+        self._lines = lines
+        self._rewrite = False
+
+    @classmethod
+    def load(cls, session_id: str) -> "Session":
+        """
+        Loads a saved session, dropping file reads whose files changed since they were saved.
+
+        Args:
+            session_id (str): Id of the session, or "last" for the most recently updated one.
+
+        Returns:
+            Session: The session, with its conversation in `contents` and the number of dropped reads in `pruned`.
+
+        Raises:
+            FileNotFoundError: If no session with that id exists.
+        """
+        if session_id == "last":
+            saved = list_sessions()
+            if not saved:
+                raise FileNotFoundError(f"No saved sessions in {settings.SESSIONS_DIR}")
+            session_id = saved[-1]
+
+        path = os.path.join(settings.SESSIONS_DIR, f"{session_id}.jsonl")
+        with open(path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            raw_lines = f.read().splitlines()
+
+        session = cls(session_id, header["working_directory"])
+        for raw in raw_lines:
+            try:
+                line = json.loads(raw)
+            except json.JSONDecodeError:
+                # A run interrupted mid-write leaves a partial last line.
+                session._rewrite = True
+                break
+            reads = line.get("reads", [])
+            stale = {
+                part_index: path
+                for part_index, path, stat in reads
+                if stat is None or stat != _file_stat(session.working_directory, path)
+            }
+            parts = line["content"].get("parts", [])
+            for part_index, part in enumerate(parts):
+                response = part.get("function_response", {}).get("response") or {}
+                for key, value in response.items():
+                    if isinstance(value, dict) and "$blob" in value:
+                        response[key] = (
+                            "" if part_index in stale else _load_blob(value["$blob"])
+                        )
+            content = types.Content.model_validate(line["content"])
+            for part_index, path, stat in reads:
+                result = _read_result(content, part_index)
+                if part_index not in stale and result is not None:
+                    session._read_stats[_read_key(path, result)] = stat
+            for part_index, path in stale.items():
+                content = with_response(
+                    content,
+                    part_index,
+                    {
+                        "result": f'[Stale content of "{path}" dropped, the file changed since the session was saved]'
+                    },
+                )
+            session.contents.append(content)
+            if stale:
+                session.pruned += len(stale)
+                session._lines.append(session._serialize(content, {}))
+                session._rewrite = True
+            else:
+                session._lines.append(raw)
+        return session
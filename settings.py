@@ -1,7 +1,76 @@
+import os
+
 MAX_ITERS = 15
 MAX_CHARS = 10000
 WORKING_DIR = "./calculator"
+IO_WORKERS = 8  # threads for concurrent file-system tool calls within one turn
+SUBPROCESS_WORKERS = 4  # threads for concurrent run_python_file calls within one turn
+BATCH_CONCURRENCY = 8  # agent sessions driven at once by agent_async.run_batch
+BATCH_WORKERS = 4  # agent processes run at once by batch.py
+BATCH_CLONE_MODE = "auto"  # "auto" tries "reflink", then "copy"; or "hardlink"
+BATCH_WORKSPACES_DIR = None  # clones go here; None: beside the workspace
+CACHE_MAX_ENTRIES = 256  # read-only tool results kept per session
+CACHE_MAX_BYTES = 8 * 1024 * 1024  # memory bound for cached tool results
+CONTEXT_TOKEN_BUDGET = 30000  # estimated prompt tokens before older turns get compacted
+COMPACT_KEEP_TURNS = 3  # most recent model turns always sent verbatim
+COMPACT_MIN_CHARS = 500  # tool outputs shorter than this are never stubbed
+INDEX_DIR = os.path.expanduser(
+    "~/.cache/cli_ai_tool/index"
+)  # on-disk workspace indexes
+INDEX_MAX_FILE_BYTES = 1024 * 1024  # larger files are not indexed
+INDEX_RECHECK_SECONDS = 10  # searches re-walk the tree at least this often
+RUN_BACKEND = (
+    "subprocess"  # "subprocess" or "warm" (forks pre-warmed interpreters, POSIX only)
+)
+WARM_POOL_SIZE = 2  # warm interpreters per working directory
+WARM_PRELOAD_MODULES = [
+    "unittest",
+    "json",
+    "decimal",
+]  # imported once by each warm interpreter
+RUN_OUTPUT_HEAD_BYTES = 4000  # bytes kept from the start of each output stream of a run
+RUN_OUTPUT_TAIL_BYTES = 4000  # bytes kept from the end of each output stream of a run
+RUN_OUTPUT_KILL_BYTES = 10 * 1024 * 1024  # combined output after which a run is killed
+TEST_TIMEOUT_SECONDS = 120  # limit of a pytest or unittest run by run_python_file
+TEST_MAX_FAILURES = 10  # failed tests detailed in a test run summary
+TEST_TRACE_LINES = 10  # traceback lines kept per failed test
+SNIFF_BYTES = 8192  # bytes read to detect a file's type and encoding
+SNIFF_CONTROL_RATIO = 0.3  # share of control bytes that marks a file as binary
+PREVIEW_HEX_BYTES = 256  # bytes in the hexdump of a binary file
+PREVIEW_MEMBERS = 50  # archive members listed in a preview
+PREVIEW_ROWS = 10  # rows shown in a CSV or Parquet preview
+FSYNC_WRITES = True  # flush file edits to disk before reporting success
+SESSIONS_DIR = os.path.expanduser(
+    "~/.cache/cli_ai_tool/sessions"
+)  # saved conversations for --resume
+SESSION_BLOB_MIN_BYTES = 1024  # tool outputs at least this long are stored once by hash
+CONTEXT_CACHE = False  # cache the system prompt, tools and snapshot server-side
+CONTEXT_CACHE_TTL_SECONDS = 600  # lifetime of a context cache
+CONTEXT_CACHE_REFRESH_SECONDS = 60  # extend the cache TTL once less than this remains
+CONTEXT_CACHE_MIN_TOKENS = 1024  # smaller prefixes are sent as is; the API rejects them
+WORKSPACE_SNAPSHOT = False  # send small workspace files with the first request
+SNAPSHOT_MAX_FILE_BYTES = 8000  # larger files are left out of the snapshot
+SNAPSHOT_MAX_BYTES = 200_000  # total size of the workspace snapshot
 MODEL_ID = "gemini-2.5-flash"  #  ["gemini-2.5-flash", "gemini-2.5-pro", "gemini-2.0-flash", "gemini-2.5-flash-lite-preview-06-17"]
+ROUTER = "fixed"  # "fixed" (MODEL_ID), "rules" or "module:Class"
+ROUTER_FAST_MODEL = "gemini-2.5-flash"  # exploration and summaries under "rules"
+ROUTER_STRONG_MODEL = "gemini-2.5-pro"  # edits, final answers, error recovery
+ROUTER_LARGE_CONTEXT_TOKENS = 20000  # prompt size that routes to the strong model
+ROUTER_ERROR_THRESHOLD = 1  # tool errors in a turn that route to the strong model
+ROUTING_LOG = None  # JSONL file routing decisions are appended to
+SUMMARY_MODE = "rolling"  # "rolling", "template" (no model call), "full" or "none"
+SUMMARY_BACKGROUND = True  # update the rolling summary while the tools run
+SUMMARY_RESULT_CHARS = 400  # tool output kept per call in a rolling summary update
+RETRY_ATTEMPTS = 5  # attempts per model call on 408, 429, 5xx and connection errors
+RETRY_BASE_DELAY = 0.5  # seconds; backoff doubles per retry, with full jitter
+RETRY_MAX_DELAY = 20.0  # longest wait between two attempts
+MODEL_CALL_TIMEOUT_SECONDS = 120  # deadline of one model call, retries included
+RATE_LIMIT_RPM = None  # requests per minute shared by all sessions; None is unlimited
+RATE_LIMIT_BURST = 5  # requests allowed at once under the rate limit
+HEDGE_REQUESTS = False  # send a duplicate request once a call exceeds the p95 latency
+HEDGE_MIN_SAMPLES = 20  # latencies needed per model before hedging starts
+HEDGE_WINDOW = 200  # recent latencies per model the p95 is taken from
+HEDGE_WORKERS = 8  # threads running hedged calls
 SUMMARY_PROMPT = """\
 Provide a brief yet comprehensive summary of the AI agent's interaction.
 Focus on core takeaways, crucial decisions made, and the ultimate resolution.
@@ -13,11 +82,21 @@ clearly outlining the operations needed. You can perform the following:
 
 List files and directories (to explore the project structure)
 Read file contents (to understand existing code)
-Execute Python files (with optional arguments for testing or running scripts)
-Write or overwrite files (for creating or modifying code)
+Execute Python files or modules with arguments, and run all or selected tests with pytest or unittest
+Write or overwrite files (for creating new files or rewriting small ones)
+Apply patches to existing files (unified diffs or search/replace edits, preferred for changes to existing code)
+Search all files for text or Python definitions (to locate code quickly)
 
 Execute these steps sequentially. 
 If an operation fails or a file isn't found in the current directory, 
 strategically attempt alternative approaches or check other relevant directories to achieve the goal.
 Do not ask user for more feedback, you are on your own.
 All paths you provide should be relative to the working directory."""
+ROLLING_SUMMARY_PROMPT = """\
+You keep a running summary of an AI coding agent's session.
+Given the current summary and the agent's latest steps, reply with the updated summary only.
+Keep core takeaways, crucial decisions, files changed, errors and the resolution so far,
+and note the tools used. Stay brief; drop details later steps made irrelevant."""
+COMPACTION_PROMPT = """\
+Summarise the earlier part of this AI agent's session so it can continue without it.
+Keep file paths, findings, changes made and errors still relevant; drop raw file contents."""
@@ -0,0 +1,94 @@
+import time
+from typing import Callable
+
+from google import genai
+from google.genai import types
+
+from executor import FunctionCallRunner
+from tracing import current_span
+
+
+def _append_part(parts: list[types.Part], part: types.Part) -> None:
+    """
+    Appends a streamed part, joining consecutive plain text fragments into one part.
+    """
+    if (
+        parts
+        and part.text is not None
+        and parts[-1].text is not None
+        and not part.thought
+        and not parts[-1].thought
+        and not part.thought_signature
+    ):
+        parts[-1] = parts[-1].model_copy(update={"text": parts[-1].text + part.text})
+    else:
+        parts.append(part)
+
+
+def stream_turn(
+    client: genai.Client,
+    model: str,
+    contents: list[types.Content],
+    config: types.GenerateContentConfig,
+    call_function: Callable[..., types.Content],
+    verbose: bool = False,
+) -> tuple[types.GenerateContentResponse, list[types.Content]]:
+    """
+    Runs one model turn with `generate_content_stream`, printing text and dispatching tools as they arrive.
+
+    Args:
+        client (genai.Client): The generative AI client.
+        model (str): The model to call.
+        contents (list[types.Content]): The conversation so far.
+        config (types.GenerateContentConfig): Generation config including the tools.
+        call_function (Callable): Dispatcher turning one function call into a tool response.
+        verbose (bool, optional): Passed through to `call_function`. Defaults to False.
+
+    Returns:
+        tuple[types.GenerateContentResponse, list[types.Content]]: A response assembled from
+        the streamed chunks, and the tool responses for its function calls in request order.
+
+    Notes:
+        - Function call parts arrive complete, so each one is handed to the tool pools
+          while the model keeps generating the rest of the turn.
+        - The time to the first chunk is recorded on the current span.
+    """
+    parts: list[types.Part] = []
+    role: str = "model"
+    last_chunk: types.GenerateContentResponse | None = None
+    line_open: bool = False
+    start = time.perf_counter()
+
+    with FunctionCallRunner(call_function, verbose=verbose) as runner:
+        for chunk in client.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        ):
+            if last_chunk is None:
+                current_span().set(first_chunk_ms=(time.perf_counter() - start) * 1000)
+            last_chunk = chunk
+            if not chunk.candidates or not chunk.candidates[0].content:
+                continue
+            chunk_content = chunk.candidates[0].content
+            role = chunk_content.role or role
+            for part in chunk_content.parts or []:
+                if part.function_call:
+                    if line_open:
+                        print()
+                        line_open = False
+                    runner.submit(part.function_call)
+                elif part.text and not part.thought:
+                    print(part.text, end="", flush=True)
+                    line_open = True
+                _append_part(parts, part)
+
+        if line_open:
+            print()
+        tool_responses = runner.results()
+
+    response = types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role=role, parts=parts))],
+        usage_metadata=last_chunk.usage_metadata if last_chunk else None,
+    )
+    return response, tool_responses
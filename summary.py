@@ -0,0 +1,297 @@
+"""
+Session summaries built while the agent works, instead of from the whole history at the end.
+
+Modes, chosen with `settings.SUMMARY_MODE`:
+
+- "rolling": after every model turn the running summary is updated from that turn's new
+  contents only, in a background thread while the tools run. Each update sends the current
+  summary and a compact rendering of the new steps, never the full conversation.
+- "template": no model call; the report is built locally from the recorded tool calls.
+- "full": one call with the whole conversation at the end (`main.summarise_interaction`).
+- "none": no summary.
+"""
+
+import contextvars
+import json
+import re
+import threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from google.genai import types
+
+import settings
+from functions.apply_patch import patched_paths
+from routing import is_error_result
+from tracing import span, usage_attributes
+
+SUMMARY_MODES = ("rolling", "template", "full", "none")
+EXIT_CODE_RE = re.compile(r"Process exited with code (-?\d+)")
+
+
+def _shorten(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _first_line(text: str) -> str:
+    return text.strip().splitlines()[0] if text.strip() else ""
+
+
+class SessionSummary:
+    """
+    Keeps a summary of one agent run up to date turn by turn.
+
+    Args:
+        client (genai.Client | None, optional): Client for the summary calls; unused by "template" and "none".
+            Defaults to None.
+        model (str | None, optional): Model for the summary calls. Defaults to `settings.MODEL_ID`.
+        mode (str | None, optional): One of `SUMMARY_MODES`. Defaults to `settings.SUMMARY_MODE`.
+        background (bool | None, optional): If True, rolling updates run in a background thread.
+            Defaults to `settings.SUMMARY_BACKGROUND`.
+        verbose (bool, optional): If True, prints failed updates. Defaults to False.
+
+    Notes:
+        - The agent loop calls `record` with every content it adds and `update` once per model turn.
+          Updates run one at a time; steps that arrive while one is running are folded into the next.
+        - A failed update keeps its steps for the next one. If the last update fails too, `result`
+          falls back to the template report, which is always complete.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        model: str | None = None,
+        mode: str | None = None,
+        background: bool | None = None,
+        verbose: bool = False,
+    ):
+        self.client = client
+        self.model = model or settings.MODEL_ID
+        self.mode = mode or settings.SUMMARY_MODE
+        if self.mode not in SUMMARY_MODES:
+            raise ValueError(
+                f"Unknown summary mode {self.mode!r}; use one of {SUMMARY_MODES}"
+            )
+        self.background = (
+            settings.SUMMARY_BACKGROUND if background is None else background
+        )
+        self.verbose = verbose
+        self.summary: str | None = None
+        self.updates = 0
+        self.failures = 0
+        self.prompt: str | None = None
+        self.final_text: str | None = None
+        self.turns = 0
+        self.calls: list[dict] = []
+        self._pending_calls: list[dict] = []
+        self._unsummarised: list[str] = []
+        self._lock = threading.Lock()
+        self._pool: ThreadPoolExecutor | None = None
+        self._future: Future | None = None
+
+    def _render(self, content: types.Content) -> list[str]:
+        lines = []
+        for part in content.parts or []:
+            if part.function_call:
+                args = json.dumps(part.function_call.args or {}, default=str)
+                lines.append(
+                    f"Call {part.function_call.name}({_shorten(args, settings.SUMMARY_RESULT_CHARS)})"
+                )
+            elif part.function_response:
+                result = (part.function_response.response or {}).get("result")
+                if result is None:
+                    result = json.dumps(part.function_response.response, default=str)
+                lines.append(
+                    f"Result of {part.function_response.name}: "
+                    f"{_shorten(str(result), settings.SUMMARY_RESULT_CHARS)}"
+                )
+            elif part.text:
+                speaker = "Agent" if content.role == "model" else "User"
+                lines.append(f"{speaker}: {part.text.strip()}")
+        return lines
+
+    def record(self, contents: list[types.Content]) -> None:
+        """
+        Notes contents added to the conversation, without calling the model.
+        """
+        for content in contents:
+            if content is None:
+                continue
+            for part in content.parts or []:
+                if part.function_call:
+                    call = {
+                        "name": part.function_call.name,
+                        "args": dict(part.function_call.args or {}),
+                        "result": None,
+                    }
+                    self.calls.append(call)
+                    self._pending_calls.append(call)
+                elif part.function_response:
+                    result = (part.function_response.response or {}).get("result")
+                    if self._pending_calls:
+                        self._pending_calls.pop(0)["result"] = (
+                            result
+                            if result is not None
+                            else str(part.function_response.response)
+                        )
+                elif part.text and content.role == "user" and self.prompt is None:
+                    self.prompt = part.text
+                elif part.text and content.role == "model":
+                    self.final_text = part.text
+            if content.role == "model":
+                self.turns += 1
+            if self.mode == "rolling":
+                with self._lock:
+                    self._unsummarised.extend(self._render(content))
+
+    def update(self, contents: list[types.Content] = ()) -> None:  # type: ignore
+        """
+        Records a model turn's contents and, in rolling mode, schedules a summary update.
+        """
+        self.record(contents)
+        if self.mode != "rolling":
+            return
+        if not self.background:
+            self._run_update()
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self._future = self._pool.submit(
+            contextvars.copy_context().run, self._run_update
+        )
+
+    def _run_update(self) -> None:
+        with self._lock:
+            steps, self._unsummarised = self._unsummarised, []
+            summary = self.summary
+        if not steps:
+            return
+
+        prompt = (
+            f"Current summary:\n{summary or '(none yet)'}\n\n"
+            "Latest steps:\n" + "\n".join(steps)
+        )
+        try:
+            with span("summary_update", model=self.model, steps=len(steps)) as s:
+                response = self.client.models.generate_content(  # type: ignore
+                    model=self.model,
+                    contents=[
+                        types.Content(role="user", parts=[types.Part(text=prompt)])
+                    ],
+                    config=types.GenerateContentConfig(
+                        system_instruction=settings.ROLLING_SUMMARY_PROMPT
+                    ),
+                )
+                s.set(**usage_attributes(response.usage_metadata))
+            text = (response.text or "").strip()
+            if not text:
+                raise ValueError("empty summary")
+        except Exception as err:
+            with self._lock:
+                self._unsummarised[:0] = steps
+                self.failures += 1
+            if self.verbose:
+                print(f"Summary update failed, retrying with the next turn: {err}")
+            return
+        with self._lock:
+            self.summary = text
+            self.updates += 1
+
+    def template(self) -> str:
+        """
+        Returns a report built from the recorded tool calls, without calling the model.
+        """
+        lines = []
+        if self.prompt:
+            lines.append(f"Request: {_shorten(self.prompt, 300)}")
+        counts = Counter(call["name"] for call in self.calls)
+        lines.append(
+            f"Turns: {self.turns}; tool calls: "
+            + (
+                ", ".join(f"{name} x{count}" for name, count in counts.items())
+                or "none"
+            )
+        )
+
+        read: dict[str, None] = {}
+        changed: dict[str, None] = {}
+        runs = []
+        errors = []
+        for call in self.calls:
+            name, args, result = call["name"], call["args"], call["result"]
+            if name == "get_file_content" and args.get("file_path"):
+                read[args["file_path"]] = None
+            elif name == "write_file" and args.get("file_path"):
+                changed[args["file_path"]] = None
+            elif name == "apply_patch":
+                for path in patched_paths(args.get("patch"), args.get("edits")):
+                    changed[path] = None
+            elif name == "run_python_file" and isinstance(result, str):
+                target = " ".join(
+                    str(part)
+                    for part in (
+                        args.get("module") and f"-m {args['module']}",
+                        args.get("file_path"),
+                        *(args.get("tests") or []),
+                    )
+                    if part
+                )
+                exit_code = EXIT_CODE_RE.search(result)
+                outcome = (
+                    _first_line(result)
+                    if args.get("module") in ("pytest", "unittest")
+                    else f"exit code {exit_code.group(1) if exit_code else 0}"
+                )
+                runs.append(f"{target}: {outcome}")
+            if is_error_result(result) and not name == "run_python_file":
+                errors.append(f"{name}: {_shorten(_first_line(result), 160)}")  # type: ignore
+
+        if read:
+            lines.append(f"Files read: {', '.join(read)}")
+        if changed:
+            lines.append(f"Files changed: {', '.join(changed)}")
+        if runs:
+            lines.append("Runs:\n" + "\n".join(f"  {run}" for run in runs))
+        if errors:
+            lines.append(
+                f"Failed tool calls ({len(errors)}):\n"
+                + "\n".join(f"  {error}" for error in errors[:5])
+            )
+        if self.final_text:
+            lines.append(f"Final response: {_shorten(self.final_text, 500)}")
+        return "\n".join(lines)
+
+    def result(self, contents: list[types.Content] | None = None) -> str | None:
+        """
+        Returns the summary of the run, waiting for any update still in flight.
+
+        Args:
+            contents (list[types.Content] | None, optional): The whole conversation; only used by "full". Defaults to None.
+
+        Returns:
+            str | None: The summary, or None in mode "none" or if a "full" summary failed.
+        """
+        if self.mode == "none":
+            return None
+        if self.mode == "template":
+            return self.template()
+        if self.mode == "full":
+            from main import summarise_interaction
+
+            return summarise_interaction(
+                contents=contents or [],
+                system_instruction=settings.SUMMARY_PROMPT,
+                client=self.client,
+                model=self.model,
+            )
+
+        if self._future is not None:
+            self._future.result()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._run_update()
+        if self._unsummarised or not self.summary:
+            return self.template()
+        return self.summary
@@ -0,0 +1,261 @@
+"""
+Structured results of pytest and unittest runs, reported to the model as a failures-only summary.
+
+The test run writes a machine-readable report next to its normal output: a JUnit XML file for
+pytest, a JSON file for unittest (through `UNITTEST_RUNNER`). The summary is built from that
+report rather than from the captured output, so it stays complete however much output the run
+produced and however much of it `output_capture` dropped.
+"""
+
+import json
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from typing import NamedTuple
+
+import settings
+
+TEST_MODULES = {"pytest", "unittest"}
+
+PYTEST_ARGS = [
+    "-q",
+    "--tb=short",
+    "-p",
+    "no:cacheprovider",
+    "-o",
+    "junit_family=xunit1",
+]
+
+# Runs like `python -m unittest`, then writes the results to the file named by the first argument.
+UNITTEST_RUNNER = """\
+import json, sys, time, unittest
+report = sys.argv.pop(1)
+start = time.perf_counter()
+program = unittest.main(module=None, exit=False, argv=["python -m unittest", *sys.argv[1:]])
+result = program.result
+with open(report, "w", encoding="utf-8") as f:
+    json.dump({
+        "tests": result.testsRun,
+        "failures": [[test.id(), detail] for test, detail in result.failures],
+        "errors": [[test.id(), detail] for test, detail in result.errors],
+        "unexpected_successes": [test.id() for test in result.unexpectedSuccesses],
+        "skipped": len(result.skipped) + len(result.expectedFailures),
+        "time": time.perf_counter() - start,
+    }, f)
+sys.exit(not result.wasSuccessful())
+"""
+
+LOCATION_RE = re.compile(
+    r'^\s*(?:File "([^"]+)", line (\d+)|([^\s:]+\.py):(\d+)(?::|$))'
+)
+
+
+class TestFailure(NamedTuple):
+    test_id: str
+    kind: str  # "FAILED" or "ERROR"
+    message: str
+    detail: str  # traceback, as reported by the framework
+
+
+class TestReport(NamedTuple):
+    framework: str
+    passed: int
+    failed: int
+    errors: int
+    skipped: int
+    duration: float
+    failures: list[TestFailure]
+
+
+def runner_args(
+    module: str, report_path: str, args: list[str] | None = None
+) -> list[str]:
+    """
+    Returns the interpreter arguments running `module`'s tests with a report written to `report_path`.
+
+    Args:
+        module (str): "pytest" or "unittest".
+        report_path (str): File the machine-readable report is written to.
+        args (list[str] | None, optional): Further arguments, such as test ids. Defaults to None.
+
+    Returns:
+        list[str]: Arguments to pass after `python3`.
+    """
+    if module == "pytest":
+        return [
+            "-m",
+            "pytest",
+            *PYTEST_ARGS,
+            f"--junitxml={report_path}",
+            *(args or []),
+        ]
+    return ["-c", UNITTEST_RUNNER, report_path, *(args or [])]
+
+
+def _message(detail: str) -> str:
+    lines = [line.strip() for line in detail.strip().splitlines() if line.strip()]
+    return lines[-1] if lines else ""
+
+
+def _pytest_id(case: ElementTree.Element) -> str:
+    name = case.get("name", "")
+    classname = case.get("classname", "")
+    path = case.get("file")
+    if not path:
+        return f"{classname}::{name}" if classname else name
+    module = os.path.splitext(path)[0].replace("/", ".").replace(os.sep, ".")
+    rest = classname[len(module) + 1 :] if classname.startswith(module) else ""
+    return "::".join(part for part in (path, rest, name) if part)
+
+
+def parse_junit_xml(path: str) -> TestReport:
+    """
+    Reads a JUnit XML report as written by `pytest --junitxml`.
+
+    Raises:
+        OSError: If the report cannot be read.
+        ElementTree.ParseError: If it is not valid XML.
+    """
+    root = ElementTree.parse(path).getroot()
+    suites = [root] if root.tag == "testsuite" else root.findall("testsuite")
+    passed = failed = errors = skipped = 0
+    duration = 0.0
+    failures = []
+    for suite in suites:
+        duration += float(suite.get("time") or 0)
+        for case in suite.iter("testcase"):
+            outcome = None
+            for child in case:
+                if child.tag in ("failure", "error"):
+                    outcome = child
+                    break
+                if child.tag == "skipped":
+                    outcome = child
+            if outcome is None:
+                passed += 1
+            elif outcome.tag == "skipped":
+                skipped += 1
+            else:
+                if outcome.tag == "failure":
+                    failed += 1
+                else:
+                    errors += 1
+                detail = outcome.text or ""
+                failures.append(
+                    TestFailure(
+                        _pytest_id(case),
+                        "FAILED" if outcome.tag == "failure" else "ERROR",
+                        outcome.get("message") or _message(detail),
+                        detail,
+                    )
+                )
+    return TestReport("pytest", passed, failed, errors, skipped, duration, failures)
+
+
+def parse_unittest_json(path: str) -> TestReport:
+    """
+    Reads the JSON report written by `UNITTEST_RUNNER`.
+
+    Raises:
+        OSError: If the report cannot be read.
+        ValueError: If it is not valid JSON.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    failures = [
+        TestFailure(test_id, "FAILED", _message(detail), detail)
+        for test_id, detail in data["failures"]
+    ]
+    failures += [
+        TestFailure(test_id, "ERROR", _message(detail), detail)
+        for test_id, detail in data["errors"]
+    ]
+    failures += [
+        TestFailure(test_id, "FAILED", "unexpected success", "")
+        for test_id in data["unexpected_successes"]
+    ]
+    failed = len(data["failures"]) + len(data["unexpected_successes"])
+    errors = len(data["errors"])
+    passed = data["tests"] - failed - errors - data["skipped"]
+    return TestReport(
+        "unittest", passed, failed, errors, data["skipped"], data["time"], failures
+    )
+
+
+def read_report(module: str, path: str) -> TestReport | None:
+    """
+    Returns the report a test run wrote, or None if it wrote none, e.g. because it crashed or timed out.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    try:
+        if module == "pytest":
+            return parse_junit_xml(path)
+        return parse_unittest_json(path)
+    except (OSError, ValueError, KeyError, ElementTree.ParseError):
+        return None
+
+
+def _location(detail: str, working_directory: str) -> str | None:
+    location = None
+    for line in detail.splitlines():
+        match = LOCATION_RE.match(line)
+        if not match:
+            continue
+        path = match.group(1) or match.group(3)
+        line_number = match.group(2) or match.group(4)
+        if os.path.isabs(path):
+            if os.path.commonpath([working_directory, path]) != working_directory:
+                continue
+            path = os.path.relpath(path, working_directory)
+        location = f"{path}:{line_number}"
+    return location
+
+
+def format_report(
+    report: TestReport,
+    working_directory: str,
+    max_failures: int = settings.TEST_MAX_FAILURES,
+    trace_lines: int = settings.TEST_TRACE_LINES,
+) -> str:
+    """
+    Formats a test report as a summary line followed by the failed tests only.
+
+    Args:
+        report (TestReport): The parsed report.
+        working_directory (str): Paths in tracebacks are shown relative to it.
+        max_failures (int, optional): Failures shown in detail. Defaults to `settings.TEST_MAX_FAILURES`.
+        trace_lines (int, optional): Traceback lines kept per failure. Defaults to `settings.TEST_TRACE_LINES`.
+
+    Returns:
+        str: The summary. Each failure shows its id, the innermost location in the working
+        directory, the error message and the end of its traceback.
+    """
+    counts = [
+        f"{count} {label}"
+        for count, label in (
+            (report.failed, "failed"),
+            (report.errors, "error" if report.errors == 1 else "errors"),
+            (report.passed, "passed"),
+            (report.skipped, "skipped"),
+        )
+        if count
+    ]
+    lines = [
+        f"{report.framework}: {', '.join(counts) or 'no tests ran'} in {report.duration:.2f}s"
+    ]
+    for failure in report.failures[:max_failures]:
+        lines.append(f"{failure.kind} {failure.test_id}")
+        location = _location(failure.detail, working_directory)
+        if location:
+            lines.append(f"  at {location}")
+        if failure.message:
+            lines.append(f"  {failure.message[:300]}")
+        detail = [line for line in failure.detail.rstrip().splitlines() if line.strip()]
+        for line in detail[-trace_lines:]:
+            lines.append(f"    {line[:200]}")
+    if len(report.failures) > max_failures:
+        lines.append(
+            f"[... {len(report.failures) - max_failures} more failures not shown]"
+        )
+    return "\n".join(lines)
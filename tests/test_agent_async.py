@@ -0,0 +1,303 @@
+"""
+Tests of `agent_async` against a local fake model server.
+
+The server speaks the `generateContent` endpoint of the Gemini API and answers by prompt: a
+prompt starting with "fail" gets a 400 error, one starting with "write" first gets a
+`write_file` call of the prompt to notes.txt, any other prompt first gets a `get_files_info`
+call, and once the tool result is sent back, a final text answer. A real `genai.Client`
+drives it through `client.aio`.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google import genai
+from google.genai import types
+
+import settings
+from agent_async import run_agent_async, run_batch
+from executor import arun_function_calls
+from resilience import ResilientClient
+
+
+class FakeModel:
+    """
+    Scripted model behind the fake server; records what it was sent and how many requests overlapped.
+    """
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.requests: list[dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def answer(self, request: dict) -> tuple[int, dict]:
+        with self._lock:
+            self.requests.append(request)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            contents = request["contents"]
+            prompt = contents[0]["parts"][0]["text"]
+            if prompt.startswith("fail"):
+                return 400, {
+                    "error": {"code": 400, "message": "bad prompt", "status": "X"}
+                }
+            first_turn = not any(content.get("role") == "model" for content in contents)
+            if first_turn and prompt.startswith("write"):
+                part = {
+                    "functionCall": {
+                        "name": "write_file",
+                        "args": {"file_path": "notes.txt", "content": prompt},
+                    }
+                }
+            elif first_turn:
+                part = {
+                    "functionCall": {
+                        "name": "get_files_info",
+                        "args": {"directory": "."},
+                    }
+                }
+            else:
+                part = {"text": f"done: {prompt}"}
+            return 200, {
+                "candidates": [
+                    {
+                        "content": {"role": "model", "parts": [part]},
+                        "finishReason": "STOP",
+                    }
+                ],
+                "usageMetadata": {"promptTokenCount": 1, "candidatesTokenCount": 1},
+            }
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def make_handler(model: FakeModel):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, payload = model.answer(request)
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class AgentAsyncTestCase(unittest.TestCase):
+    def setUp(self):
+        self.model = FakeModel()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(self.model))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = genai.Client(
+            api_key="test",
+            http_options=types.HttpOptions(
+                base_url=f"http://127.0.0.1:{self.server.server_address[1]}"
+            ),
+        )
+
+        workspace = tempfile.TemporaryDirectory()
+        self.addCleanup(workspace.cleanup)
+        self.workspace = workspace.name
+        with open(os.path.join(workspace.name, "marker.txt"), "w") as f:
+            f.write("x")
+        workspaces = tempfile.TemporaryDirectory()
+        self.addCleanup(workspaces.cleanup)
+        self.workspaces = workspaces.name
+        patcher = mock.patch.multiple(
+            settings,
+            WORKING_DIR=workspace.name,
+            RATE_LIMIT_RPM=None,
+            HEDGE_REQUESTS=False,
+            RETRY_BASE_DELAY=0.01,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The tools print every call.
+        quiet = contextlib.redirect_stdout(io.StringIO())
+        quiet.__enter__()
+        self.addCleanup(quiet.__exit__, None, None, None)
+
+    def test_session_runs_a_tool_and_answers(self):
+        client = ResilientClient(self.client)
+
+        result = asyncio.run(run_agent_async(client, "look around"))
+
+        self.assertEqual(result, "done: look around")
+        self.assertEqual(len(self.model.requests), 2)
+        tool_result = json.dumps(self.model.requests[1]["contents"][-1])
+        self.assertIn("functionResponse", tool_result)
+        self.assertIn("marker.txt", tool_result)
+
+    def test_batch_keeps_prompt_order(self):
+        prompts = [f"prompt {i}" for i in range(5)]
+
+        results = asyncio.run(
+            run_batch(
+                prompts,
+                concurrency=5,
+                client=self.client,
+                workspaces_dir=self.workspaces,
+            )
+        )
+
+        self.assertEqual(results, [f"done: {prompt}" for prompt in prompts])
+
+    def test_batch_respects_the_concurrency_limit(self):
+        prompts = [f"prompt {i}" for i in range(6)]
+
+        asyncio.run(
+            run_batch(
+                prompts,
+                concurrency=2,
+                client=self.client,
+                workspaces_dir=self.workspaces,
+            )
+        )
+
+        self.assertEqual(self.model.max_in_flight, 2)
+        self.assertEqual(len(self.model.requests), 12)
+
+    def test_failed_session_does_not_affect_the_others(self):
+        prompts = ["prompt a", "fail b", "prompt c"]
+
+        results = asyncio.run(
+            run_batch(
+                prompts,
+                concurrency=3,
+                client=self.client,
+                workspaces_dir=self.workspaces,
+            )
+        )
+
+        self.assertEqual(results[0], "done: prompt a")
+        self.assertTrue(results[1].startswith("Error: session failed"))
+        self.assertEqual(results[2], "done: prompt c")
+
+    def test_sessions_write_to_their_own_clones(self):
+        prompts = ["write a", "write b", "look around"]
+
+        results = asyncio.run(
+            run_batch(
+                prompts,
+                concurrency=3,
+                client=self.client,
+                workspaces_dir=self.workspaces,
+            )
+        )
+
+        self.assertEqual(results, [f"done: {prompt}" for prompt in prompts])
+        self.assertFalse(os.path.exists(os.path.join(self.workspace, "notes.txt")))
+        [batch_dir] = os.listdir(self.workspaces)
+        clones = os.path.join(self.workspaces, batch_dir)
+        self.assertEqual(
+            sorted(os.listdir(clones)), ["session-0000", "session-0001", "session-0002"]
+        )
+        for index, expected in enumerate(["write a", "write b", None]):
+            path = os.path.join(clones, f"session-{index:04d}", "notes.txt")
+            if expected is None:
+                self.assertFalse(os.path.exists(path))
+            else:
+                with open(path) as f:
+                    self.assertEqual(f.read(), expected)
+
+
+class ArunFunctionCallsTestCase(unittest.TestCase):
+    def run_calls(self, calls: list[types.FunctionCall]):
+        events: list[tuple[str, int]] = []
+
+        async def acall_function(call: types.FunctionCall, verbose=False):
+            index = next(i for i, known in enumerate(calls) if known is call)
+            events.append(("start", index))
+            await asyncio.sleep(0.02)
+            events.append(("end", index))
+            return types.Content(
+                role="tool",
+                parts=[
+                    types.Part.from_function_response(
+                        name=call.name, response={"result": index}
+                    )
+                ],
+            )
+
+        results = asyncio.run(arun_function_calls(calls, acall_function))
+        return results, events
+
+    def test_results_keep_the_call_order(self):
+        calls = [
+            types.FunctionCall(name="get_file_content", args={"file_path": f"f{i}"})
+            for i in range(4)
+        ]
+
+        results, _ = self.run_calls(calls)
+
+        self.assertEqual(
+            [
+                result.parts[0].function_response.response["result"]
+                for result in results
+            ],
+            [0, 1, 2, 3],
+        )
+
+    def test_reads_run_concurrently(self):
+        calls = [
+            types.FunctionCall(name="get_file_content", args={"file_path": "a"}),
+            types.FunctionCall(name="get_file_content", args={"file_path": "a"}),
+        ]
+
+        _, events = self.run_calls(calls)
+
+        self.assertEqual(events[:2], [("start", 0), ("start", 1)])
+
+    def test_calls_wait_for_conflicting_earlier_calls(self):
+        calls = [
+            types.FunctionCall(
+                name="write_file", args={"file_path": "pkg/a.py", "content": ""}
+            ),
+            types.FunctionCall(name="get_file_content", args={"file_path": "pkg/a.py"}),
+            types.FunctionCall(name="get_file_content", args={"file_path": "b.txt"}),
+            types.FunctionCall(name="run_python_file", args={"file_path": "main.py"}),
+            types.FunctionCall(name="get_file_content", args={"file_path": "out.txt"}),
+        ]
+
+        _, events = self.run_calls(calls)
+
+        def before(first: tuple[str, int], second: tuple[str, int]) -> bool:
+            return events.index(first) < events.index(second)
+
+        self.assertTrue(before(("end", 0), ("start", 1)))
+        self.assertTrue(before(("start", 2), ("end", 0)))
+        for earlier in (0, 1, 2):
+            self.assertTrue(before(("end", earlier), ("start", 3)))
+        self.assertTrue(before(("end", 3), ("start", 4)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests of `compaction.compact_contents`.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types
+
+from compaction import compact_contents
+
+
+def user(text: str) -> types.Content:
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def turn(index: int) -> list[types.Content]:
+    """
+    One model turn reading a file, and the tool's large result.
+    """
+    call = types.FunctionCall(
+        name="get_file_content", args={"file_path": f"file{index}.py"}
+    )
+    return [
+        types.Content(role="model", parts=[types.Part(function_call=call)]),
+        types.Content(
+            role="tool",
+            parts=[
+                types.Part.from_function_response(
+                    name="get_file_content", response={"result": "x" * 40}
+                )
+            ],
+        ),
+    ]
+
+
+def texts(contents: list[types.Content]) -> list[str]:
+    return [part.text for content in contents for part in content.parts if part.text]
+
+
+class CompactContentsTestCase(unittest.TestCase):
+    def compact(self, contents: list[types.Content], prompt_index: int = 0):
+        self.summarised: list[types.Content] = []
+
+        def summarise(older: list[types.Content]) -> str:
+            self.summarised = older
+            return "earlier work"
+
+        return compact_contents(
+            contents,
+            token_budget=10,
+            keep_recent_turns=1,
+            min_chars=1000,
+            summarise=summarise,
+            prompt_index=prompt_index,
+        )
+
+    def test_summary_keeps_the_first_prompt(self):
+        contents = [user("first"), *turn(0), *turn(1), *turn(2)]
+
+        compacted = self.compact(contents)
+
+        self.assertEqual(len(self.summarised), 5)
+        self.assertEqual(
+            texts(compacted[:1]),
+            ["first", "Summary of the work done so far:\nearlier work"],
+        )
+        self.assertEqual(compacted[1:], contents[5:])
+
+    def test_resumed_session_keeps_the_current_prompt(self):
+        contents = [user("first"), *turn(0), user("current"), *turn(1), *turn(2)]
+
+        compacted = self.compact(contents, prompt_index=3)
+
+        self.assertEqual(
+            texts(compacted[:1]),
+            [
+                "first",
+                "Summary of the work done so far:\nearlier work",
+                "Current request:",
+                "current",
+            ],
+        )
+        self.assertEqual(compacted[1:], contents[6:])
+
+    def test_current_prompt_is_pinned_once(self):
+        contents = [user("first"), *turn(0), *turn(1), user("current"), *turn(2)]
+
+        compacted = self.compact(contents, prompt_index=5)
+
+        self.assertEqual(texts(compacted).count("current"), 1)
+        self.assertEqual(compacted[1:], contents[6:])
+
+    def test_fresh_session_pins_only_its_prompt(self):
+        contents = [user("current"), *turn(0), *turn(1), *turn(2)]
+
+        compacted = self.compact(contents, prompt_index=0)
+
+        self.assertEqual(texts(compacted).count("current"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
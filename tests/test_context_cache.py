@@ -0,0 +1,107 @@
+"""
+Tests of `context_cache.ContextCache` against the in-memory `replay.StubCaches`.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import datetime
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import types
+
+from context_cache import ContextCache
+from replay import StubCaches
+
+MODEL = "gemini-2.0-flash-001"
+
+
+def snapshot(text: str) -> list[types.Content]:
+    return [types.Content(role="user", parts=[types.Part(text=text)])]
+
+
+class ContextCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.client = SimpleNamespace(caches=StubCaches())
+        self.config = types.GenerateContentConfig(system_instruction="Be brief.")
+        self.contents = snapshot("question")
+
+    def context_cache(self, text: str = "files") -> ContextCache:
+        return ContextCache(
+            self.client, self.config, snapshot=snapshot(text), min_tokens=0
+        )
+
+    def test_prefix_is_cached_once_and_referred_to_by_name(self):
+        prefix = self.context_cache()
+
+        for _ in range(3):
+            config, contents = prefix.request(MODEL, self.contents)
+
+        self.assertEqual(self.client.caches.created, 1)
+        self.assertEqual(config.cached_content, prefix.cached.name)
+        self.assertIsNone(config.system_instruction)
+        self.assertEqual(contents, self.contents)
+
+    def test_live_cache_of_an_earlier_session_is_reused(self):
+        first = self.context_cache()
+        first.request(MODEL, self.contents)
+
+        second = self.context_cache()
+        second.request(MODEL, self.contents)
+
+        self.assertEqual(self.client.caches.created, 1)
+        self.assertEqual(second.cached.name, first.cached.name)
+
+    def test_changed_prefix_gets_a_new_cache(self):
+        first = self.context_cache("files")
+        first.request(MODEL, self.contents)
+
+        second = self.context_cache("edited files")
+        second.request(MODEL, self.contents)
+
+        self.assertEqual(self.client.caches.created, 2)
+        self.assertNotEqual(second.cached.name, first.cached.name)
+
+    def test_expired_cache_is_not_reused(self):
+        first = self.context_cache()
+        first.request(MODEL, self.contents)
+        past = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+            seconds=1
+        )
+        self.client.caches.caches[first.cached.name].expire_time = past
+
+        second = self.context_cache()
+        second.request(MODEL, self.contents)
+
+        self.assertEqual(self.client.caches.created, 2)
+        self.assertNotEqual(second.cached.name, first.cached.name)
+
+    def test_failing_caches_fall_back_to_the_full_prefix(self):
+        def fail(**kwargs):
+            raise RuntimeError("caching unavailable")
+
+        self.client.caches.create = fail
+        prefix = self.context_cache()
+
+        config, contents = prefix.request(MODEL, self.contents)
+
+        self.assertTrue(prefix.disabled)
+        self.assertIs(config, self.config)
+        self.assertEqual(contents, snapshot("files") + self.contents)
+
+    def test_small_prefix_is_not_cached(self):
+        prefix = ContextCache(self.client, self.config, snapshot=snapshot("files"))
+
+        config, _ = prefix.request(MODEL, self.contents)
+
+        self.assertEqual(self.client.caches.created, 0)
+        self.assertIsNone(config.cached_content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests of `file_types.preview` on damaged files: each must fall back to a hexdump instead of raising.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import gzip
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_types import preview, sniff
+from functions.get_file_content import get_file_content
+
+
+def parquet(footer: bytes) -> bytes:
+    return b"PAR1" + footer + struct.pack("<i", len(footer)) + b"PAR1"
+
+
+class CorruptPreviewTestCase(unittest.TestCase):
+    def setUp(self):
+        workspace = tempfile.TemporaryDirectory()
+        self.addCleanup(workspace.cleanup)
+        self.working_directory = workspace.name
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.working_directory, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def assert_hexdump(self, name: str, data: bytes):
+        path = self.write(name, data)
+        file_type = sniff(data[:4096], name)
+        self.assertNotEqual(file_type.kind, "binary")
+
+        self.assertTrue(preview(path, file_type, len(data)).startswith("Hexdump"))
+        self.assertIn("Hexdump", get_file_content(self.working_directory, name))
+
+    def test_truncated_gzip(self):
+        data = gzip.compress(b"hello world\n" * 1000)
+        self.assert_hexdump("truncated.txt.gz", data[: len(data) // 2])
+
+    def test_corrupt_gzip_stream(self):
+        data = bytearray(gzip.compress(b"hello world\n" * 1000))
+        data[10:30] = b"\xff" * 20
+        self.assert_hexdump("corrupt.txt.gz", bytes(data))
+
+    def test_parquet_schema_of_non_structs(self):
+        # Field 2, the schema, holds a list of one i32 instead of structs.
+        self.assert_hexdump("ints.parquet", parquet(b"\x29\x15\x04\x00"))
+
+    def test_parquet_nested_too_deeply(self):
+        # Field 1 holds a struct holding a struct, and so on far past the recursion limit.
+        footer = b"\x1c" * 5000 + b"\x00" * 5001
+        self.assert_hexdump("deep.parquet", parquet(footer))
+
+
+if __name__ == "__main__":
+    unittest.main()
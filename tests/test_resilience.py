@@ -0,0 +1,257 @@
+"""
+Tests of `resilience.ResilientClient` against a local server that injects faults.
+
+A real `genai.Client` talks HTTP to the fault-injecting server of `benchmarks/bench_resilience.py`,
+scripted here so every response is known in advance.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from google import genai
+from google.genai import errors, types
+
+import resilience
+import settings
+from bench_resilience import MODEL, FaultInjector, make_handler
+from resilience import DeadlineExceeded, RateLimiter, ResilientClient
+
+
+class ScriptedFaults(FaultInjector):
+    """
+    Answers requests with scripted (status, delay in seconds) pairs, then with fast successes.
+    """
+
+    def __init__(self):
+        super().__init__(error_rate=0, slow_rate=0, slow_ms=0, fast_ms=0)
+        self.script: list[tuple[int, float]] = []
+
+    def decide(self) -> tuple[int, float]:
+        with self._lock:
+            self.requests += 1
+            return self.script.pop(0) if self.script else (200, 0.0)
+
+
+class ResilienceTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.faults = ScriptedFaults()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(cls.faults))
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.raw = genai.Client(
+            api_key="test",
+            http_options=types.HttpOptions(
+                base_url=f"http://127.0.0.1:{cls.server.server_address[1]}"
+            ),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.faults.script = []
+        self.faults.requests = 0
+        patcher = mock.patch.multiple(
+            settings,
+            RETRY_ATTEMPTS=4,
+            RETRY_BASE_DELAY=0.01,
+            RETRY_MAX_DELAY=0.05,
+            MODEL_CALL_TIMEOUT_SECONDS=10,
+            RATE_LIMIT_RPM=None,
+            HEDGE_REQUESTS=False,
+            HEDGE_MIN_SAMPLES=5,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        resilience._limiter = None
+        resilience._latencies = resilience.LatencyTracker()
+
+    def prime_latencies(self, seconds: float):
+        for _ in range(settings.HEDGE_MIN_SAMPLES):
+            resilience._latencies.add(MODEL, seconds)
+
+    def test_transient_errors_are_retried(self):
+        self.faults.script = [(503, 0.0), (429, 0.0)]
+        client = ResilientClient(self.raw)
+
+        response = client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(self.faults.requests, 3)
+        self.assertEqual(client.stats["retries"], 2)
+        self.assertEqual(client.stats["failures"], 0)
+
+    def test_client_errors_are_not_retried(self):
+        self.faults.script = [(400, 0.0)]
+        client = ResilientClient(self.raw)
+
+        with self.assertRaises(errors.APIError):
+            client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(self.faults.requests, 1)
+        self.assertEqual(client.stats["retries"], 0)
+        self.assertEqual(client.stats["failures"], 1)
+
+    def test_retries_stop_after_the_last_attempt(self):
+        self.faults.script = [(503, 0.0)] * 10
+        client = ResilientClient(self.raw)
+
+        with self.assertRaises(errors.APIError):
+            client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(self.faults.requests, settings.RETRY_ATTEMPTS)
+        self.assertEqual(client.stats["retries"], settings.RETRY_ATTEMPTS - 1)
+
+    def test_session_deadline_bounds_a_slow_call(self):
+        self.faults.script = [(200, 2.0)] * 10
+        client = ResilientClient(self.raw, deadline=time.monotonic() + 0.5)
+
+        start = time.monotonic()
+        with self.assertRaises(Exception):
+            client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(client.stats["failures"], 1)
+
+    def test_no_call_is_started_after_the_deadline(self):
+        client = ResilientClient(self.raw, deadline=time.monotonic() - 1)
+
+        with self.assertRaises(DeadlineExceeded):
+            client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(self.faults.requests, 0)
+
+    def test_rate_limiter_serves_burst_then_waits(self):
+        limiter = RateLimiter(requests_per_minute=600, burst=2)
+
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertEqual(limiter.reserve(), 0.0)
+        self.assertAlmostEqual(limiter.reserve(), 0.1, delta=0.01)
+        self.assertAlmostEqual(limiter.reserve(), 0.2, delta=0.01)
+
+    def test_try_acquire_never_goes_into_debt(self):
+        limiter = RateLimiter(requests_per_minute=60, burst=1)
+
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        self.assertAlmostEqual(limiter.reserve(), 1.0, delta=0.05)
+
+    def test_rate_limited_calls_are_spaced(self):
+        settings.RATE_LIMIT_RPM = 600
+        resilience._limiter = RateLimiter(settings.RATE_LIMIT_RPM, burst=1)
+        client = ResilientClient(self.raw)
+
+        start = time.monotonic()
+        for _ in range(3):
+            client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        self.assertEqual(self.faults.requests, 3)
+
+    def test_hedge_wins_over_a_slow_primary(self):
+        settings.HEDGE_REQUESTS = True
+        self.prime_latencies(0.05)
+        self.faults.script = [(200, 1.5)]
+        client = ResilientClient(self.raw)
+
+        start = time.monotonic()
+        response = client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(response.text, "ok")
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual(client.stats["hedges"], 1)
+        self.assertEqual(client.stats["hedge_wins"], 1)
+        self.assertEqual(self.faults.requests, 2)
+
+    def test_no_hedge_before_enough_samples(self):
+        settings.HEDGE_REQUESTS = True
+        self.faults.script = [(200, 0.3)]
+        client = ResilientClient(self.raw)
+
+        client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(client.stats["hedges"], 0)
+        self.assertEqual(self.faults.requests, 1)
+
+    def test_hedge_without_a_free_token_costs_no_token(self):
+        settings.HEDGE_REQUESTS = True
+        self.prime_latencies(0.05)
+        limiter = resilience._limiter = RateLimiter(requests_per_minute=1, burst=1)
+        settings.RATE_LIMIT_RPM = 1
+        self.faults.script = [(200, 0.3)]
+        client = ResilientClient(self.raw)
+
+        client.models.generate_content(model=MODEL, contents="ping")
+
+        self.assertEqual(client.stats["hedges"], 0)
+        self.assertEqual(self.faults.requests, 1)
+        # Only the call's own token was taken: the bucket is empty, not in debt.
+        self.assertGreater(limiter._tokens, -0.5)
+
+    def test_async_hedge_wins_over_a_slow_primary(self):
+        settings.HEDGE_REQUESTS = True
+        self.prime_latencies(0.05)
+        self.faults.script = [(200, 1.5)]
+        client = ResilientClient(self.raw)
+
+        async def call():
+            return await client.aio.models.generate_content(
+                model=MODEL, contents="ping"
+            )
+
+        response = asyncio.run(call())
+
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(client.stats["hedges"], 1)
+        self.assertEqual(client.stats["hedge_wins"], 1)
+
+    def test_async_hedge_respects_the_rate_limit(self):
+        settings.HEDGE_REQUESTS = True
+        self.prime_latencies(0.05)
+        resilience._limiter = RateLimiter(requests_per_minute=1, burst=1)
+        settings.RATE_LIMIT_RPM = 1
+        self.faults.script = [(200, 0.3)]
+        client = ResilientClient(self.raw)
+
+        async def call():
+            return await client.aio.models.generate_content(
+                model=MODEL, contents="ping"
+            )
+
+        asyncio.run(call())
+
+        self.assertEqual(client.stats["hedges"], 0)
+        self.assertEqual(self.faults.requests, 1)
+
+    def test_async_transient_errors_are_retried(self):
+        self.faults.script = [(500, 0.0), (503, 0.0)]
+        client = ResilientClient(self.raw)
+
+        async def call():
+            return await client.aio.models.generate_content(
+                model=MODEL, contents="ping"
+            )
+
+        response = asyncio.run(call())
+
+        self.assertEqual(response.text, "ok")
+        self.assertEqual(client.stats["retries"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
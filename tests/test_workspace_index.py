@@ -0,0 +1,84 @@
+"""
+Tests of the on-disk housekeeping of `workspace_index.WorkspaceIndex`.
+
+Usage:
+    python -m unittest discover -s tests
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings
+import workspace_index
+from workspace_index import WorkspaceIndex, evict_orphans
+
+
+class WorkspaceIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        index_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(index_dir.cleanup)
+        self.index_dir = index_dir.name
+
+    def make_tree(self) -> str:
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        with open(os.path.join(root, "a.py"), "w") as f:
+            f.write("def alpha():\n    pass\n")
+        return root
+
+    def index_files(self) -> list[str]:
+        return sorted(os.listdir(self.index_dir))
+
+    def test_index_round_trips_through_disk(self):
+        root = self.make_tree()
+        WorkspaceIndex(root, index_dir=self.index_dir).update()
+
+        loaded = WorkspaceIndex(root, index_dir=self.index_dir)
+
+        self.assertEqual(loaded.search_symbols("alpha"), [("a.py", 1, "def alpha")])
+        self.assertEqual([name[-7:] for name in self.index_files()], [".pickle"])
+
+    def test_indexes_of_deleted_roots_are_evicted(self):
+        kept, deleted = self.make_tree(), self.make_tree()
+        for root in (kept, deleted):
+            WorkspaceIndex(root, index_dir=self.index_dir).update()
+        shutil.rmtree(deleted)
+        kept_path = WorkspaceIndex(kept, index_dir=self.index_dir).index_path
+
+        self.assertEqual(evict_orphans(self.index_dir), 1)
+        self.assertEqual(self.index_files(), [os.path.basename(kept_path)])
+
+    def test_only_old_temp_files_are_evicted(self):
+        old = os.path.join(self.index_dir, "x.pickle.old.tmp")
+        new = os.path.join(self.index_dir, "x.pickle.new.tmp")
+        for path in (old, new):
+            open(path, "wb").close()
+        past = time.time() - workspace_index.TEMP_FILE_MAX_AGE - 1
+        os.utime(old, (past, past))
+
+        self.assertEqual(evict_orphans(self.index_dir), 1)
+        self.assertEqual(self.index_files(), ["x.pickle.new.tmp"])
+
+    def test_update_skips_the_walk_while_the_generation_is_unchanged(self):
+        root = self.make_tree()
+        index = WorkspaceIndex(root, index_dir=self.index_dir)
+        index.update(generation=1)
+        with open(os.path.join(root, "b.py"), "w") as f:
+            f.write("def beta():\n    pass\n")
+
+        self.assertEqual(index.update(generation=1), 0)
+        self.assertEqual(index.update(generation=2), 1)
+        with mock.patch.object(settings, "INDEX_RECHECK_SECONDS", 0):
+            os.remove(os.path.join(root, "b.py"))
+            self.assertEqual(index.update(generation=2), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
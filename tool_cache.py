@@ -0,0 +1,137 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+import settings
+from functions.apply_patch import patched_paths
+from tracing import current_span
+from workspace import get_workspace
+
+CACHEABLE_FUNCTIONS = {"get_files_info", "get_file_content"}
+PATH_INVALIDATING_FUNCTIONS = {"write_file", "apply_patch"}
+TREE_INVALIDATING_FUNCTIONS = {"run_python_file"}
+
+
+class ToolResultCache:
+    """
+    Per-session LRU cache for the results of read-only tools.
+
+    Args:
+        working_directory (str): The directory tool paths are relative to.
+        max_entries (int, optional): Maximum number of cached results. Defaults to `settings.CACHE_MAX_ENTRIES`.
+        max_bytes (int, optional): Maximum memory held by cached results. Defaults to `settings.CACHE_MAX_BYTES`.
+
+    Notes:
+        - Entries are keyed on the function, its arguments, the resolved path and the path's mtime and size,
+          so a file changed behind the agent's back misses from the next turn on. Paths and stats come from
+          the shared `workspace.Workspace`, so the tool itself does not stat the path again.
+        - `write_file` and `apply_patch` drop every entry for the written paths, their parents and children;
+          `run_python_file` may touch anything, so it clears the whole cache.
+        - Error results are never cached.
+    """
+
+    def __init__(
+        self,
+        working_directory: str,
+        max_entries: int = settings.CACHE_MAX_ENTRIES,
+        max_bytes: int = settings.CACHE_MAX_BYTES,
+    ):
+        self.workspace = get_workspace(working_directory)
+        self.working_directory = self.workspace.root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _resolve(self, func_args: dict) -> str | None:
+        path = func_args.get("file_path") or func_args.get("directory") or ""
+        return self.workspace.resolve(path)
+
+    def _key(self, func_name: str, func_args: dict) -> tuple | None:
+        path = self._resolve(func_args)
+        stat = self.workspace.stat(path) if path is not None else None
+        if stat is None:
+            return None
+        args = tuple(sorted((k, repr(v)) for k, v in func_args.items()))
+        return (func_name, path, stat.st_mtime_ns, stat.st_size, args)
+
+    def _remove(self, key: tuple) -> None:
+        self._bytes -= sys.getsizeof(self._entries.pop(key))
+
+    def _store(self, key: tuple, result: str) -> None:
+        size = sys.getsizeof(result)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = result
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, path: str | None = None) -> None:
+        """
+        Drops cached results overlapping `path`, or everything if no path is given.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._bytes = 0
+                return
+            for key in [k for k in self._entries if _paths_overlap(k[1], path)]:
+                self._remove(key)
+
+    def call(self, func_name: str, func_args: dict, func: Callable[[], str]) -> str:
+        """
+        Returns the cached result of a tool call, running `func` on a miss.
+
+        Args:
+            func_name (str): Name of the tool being called.
+            func_args (dict): Arguments of the tool call, as sent by the model.
+            func (Callable[[], str]): Runs the tool and returns its result.
+
+        Returns:
+            str: The tool result.
+        """
+        if func_name not in CACHEABLE_FUNCTIONS:
+            result = func()
+            if func_name in PATH_INVALIDATING_FUNCTIONS:
+                for path in _written_paths(func_name, func_args):
+                    resolved = self.workspace.resolve(path)
+                    if resolved is not None:
+                        self.invalidate(resolved)
+            elif func_name in TREE_INVALIDATING_FUNCTIONS:
+                self.invalidate()
+            return result
+
+        key = self._key(func_name, func_args)
+        if key is not None:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    current_span().set(cache_hit=True)
+                    return self._entries[key]
+
+        current_span().set(cache_hit=False)
+        result = func()
+        with self._lock:
+            self.misses += 1
+            if key is not None and not result.startswith("Error"):
+                self._store(key, result)
+        return result
+
+
+def _written_paths(func_name: str, func_args: dict) -> list[str]:
+    if func_name == "apply_patch":
+        return patched_paths(func_args.get("patch"), func_args.get("edits"))
+    return [func_args.get("file_path") or ""]
+
+
+def _paths_overlap(first: str, second: str) -> bool:
+    return os.path.commonpath([first, second]) in (first, second)
@@ -0,0 +1,233 @@
+"""
+Span tracing for the agent loop, written as JSONL with OpenTelemetry span field names.
+
+Enable it with `configure_tracing(path)` (or `main.py --trace=FILE`) and wrap work in
+`with span("name", key=value) as s:`. Nested spans find their parent through a context
+variable, so spans opened in tool threads attach to the turn that started them as long
+as the thread runs in a copy of the caller's context.
+
+Render a trace as a timeline:
+    python tracing.py trace.jsonl
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Span:
+    def __init__(
+        self, name: str, trace_id: str, parent: "Span | None", attributes: dict
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.recording = True
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    recording = False
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Appends finished spans to a JSONL file.
+
+    Args:
+        path (str): The trace file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, finished: Span) -> None:
+        line = json.dumps(finished.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+_tracer: Tracer | None = None
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def configure_tracing(path: str | None) -> None:
+    """
+    Starts writing spans to `path`, or stops tracing if `path` is None.
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(path) if path else None
+
+
+def current_span() -> Span | _NoopSpan:
+    return _current.get() or NOOP_SPAN
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block as a span named `name`, nested under the current span.
+
+    Yields:
+        Span | _NoopSpan: The span, whose `set` adds attributes; a no-op object when tracing is off.
+    """
+    if _tracer is None:
+        yield NOOP_SPAN
+        return
+
+    parent = _current.get()
+    trace_id = parent.trace_id if parent else os.urandom(16).hex()
+    new_span = Span(name, trace_id, parent, attributes)
+    token = _current.set(new_span)
+    try:
+        yield new_span
+    except BaseException as err:
+        new_span.set(error=f"{type(err).__name__}: {err}")
+        raise
+    finally:
+        _current.reset(token)
+        new_span.end_ns = time.time_ns()
+        tracer = _tracer
+        if tracer is not None:
+            tracer.export(new_span)
+
+
+def usage_attributes(usage_metadata) -> dict:
+    """
+    Returns the token counts of a model response as span attributes.
+    """
+    if not usage_metadata:
+        return {}
+    prompt_tokens = usage_metadata.prompt_token_count or 0
+    cached_tokens = usage_metadata.cached_content_token_count or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": prompt_tokens - cached_tokens,
+        "response_tokens": usage_metadata.candidates_token_count or 0,
+    }
+
+
+def render_timeline(spans: list[dict], width: int = 50) -> str:
+    """
+    Renders spans as an indented timeline with one bar per span, followed by totals per span name.
+
+    Args:
+        spans (list[dict]): Spans as written to the trace file.
+        width (int, optional): Width of the bars in characters. Defaults to 50.
+
+    Returns:
+        str: The timeline.
+    """
+    if not spans:
+        return "No spans."
+
+    by_parent: dict[str | None, list[dict]] = {}
+    ids = {s["spanId"] for s in spans}
+    for s in spans:
+        parent = s["parentSpanId"] if s["parentSpanId"] in ids else None
+        by_parent.setdefault(parent, []).append(s)
+    for children in by_parent.values():
+        children.sort(key=lambda s: s["startTimeUnixNano"])
+
+    start = min(s["startTimeUnixNano"] for s in spans)
+    end = max(s["endTimeUnixNano"] for s in spans)
+    scale = width / max(end - start, 1)
+
+    lines = []
+
+    def label(s: dict) -> str:
+        attributes = s["attributes"]
+        for key in ("function", "turn", "model"):
+            if key in attributes:
+                return f"{s['name']} {attributes[key]}"
+        return s["name"]
+
+    def walk(parent: str | None, depth: int) -> None:
+        for s in by_parent.get(parent, []):
+            offset = int((s["startTimeUnixNano"] - start) * scale)
+            length = max(
+                int((s["endTimeUnixNano"] - s["startTimeUnixNano"]) * scale), 1
+            )
+            bar = " " * offset + "█" * length
+            duration_ms = (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6
+            lines.append(
+                f"{('  ' * depth + label(s))[:36]:<36} |{bar:<{width}}| {duration_ms:10.1f} ms"
+            )
+            walk(s["spanId"], depth + 1)
+
+    walk(None, 0)
+
+    totals: dict[str, list[float]] = {}
+    for s in spans:
+        totals.setdefault(label(s) if s["name"] == "tool" else s["name"], []).append(
+            (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e6
+        )
+    lines.append("")
+    lines.append(f"{'span':<36} {'count':>6} {'total ms':>12} {'mean ms':>10}")
+    for name, durations in sorted(totals.items(), key=lambda item: -sum(item[1])):
+        lines.append(
+            f"{name[:36]:<36} {len(durations):>6} {sum(durations):>12.1f} {sum(durations) / len(durations):>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python tracing.py trace.jsonl [--width=N]")
+        sys.exit(1)
+
+    width = 50
+    for arg in sys.argv[2:]:
+        if arg.startswith("--width="):
+            width = int(arg.split("=", 1)[1])
+
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f if line.strip()]
+
+    for trace_id in dict.fromkeys(s["traceId"] for s in spans):
+        print(f"trace {trace_id}")
+        print(render_timeline([s for s in spans if s["traceId"] == trace_id], width))
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Pool of pre-warmed Python interpreters that fork a fresh child for every script run.
+
+Each worker is started once per working directory with `settings.WARM_PRELOAD_MODULES`
+imported, then serves run requests over its stdin/stdout as JSON lines. A request forks
+the warm interpreter, so the script starts with the imports already done but with no
+state left over from earlier runs. The child's output goes through pipes that the worker
+drains into bounded captures, as `output_capture.run_bounded` does.
+"""
+
+import atexit
+import importlib
+import json
+import os
+import queue
+import runpy
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import settings
+from output_capture import BoundedCapture, RunResult, drain_pipes
+
+
+def _run_child(working_directory: str, request: dict, stdout: int, stderr: int) -> None:
+    """
+    Body of the forked child: runs the script like `python3 <file>` would, then exits.
+    """
+    os.setpgid(0, 0)
+    stdin = os.open(request.get("stdin") or os.devnull, os.O_RDONLY)
+    os.dup2(stdin, 0)
+    os.dup2(stdout, 1)
+    os.dup2(stderr, 2)
+    os.close(stdout)
+    os.close(stderr)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", closefd=False)
+    sys.stderr = open(2, "w", closefd=False)
+
+    os.chdir(working_directory)
+    sys.argv = [request["path"], *request.get("args", [])]
+    sys.path[0] = os.path.dirname(request["path"])
+
+    code = 0
+    try:
+        runpy.run_path(request["path"], run_name="__main__")
+    except SystemExit as exit_request:
+        if exit_request.code is None:
+            code = 0
+        elif isinstance(exit_request.code, int):
+            code = exit_request.code
+        else:
+            print(exit_request.code, file=sys.stderr)
+            code = 1
+    except BaseException as err:
+        # Hide the worker and runpy frames so the traceback matches a plain `python3 <file>` run.
+        tb = err.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != request["path"]:
+            tb = tb.tb_next
+        traceback.print_exception(type(err), err, tb or err.__traceback__)
+        code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+    os._exit(code)
+
+
+def _run_request(working_directory: str, request: dict) -> dict:
+    """
+    Forks a child for one run and drains its output pipes, killing its process group on
+    timeout or as soon as its output grows past `max_output_bytes`.
+
+    Returns:
+        dict: The exit code (negative signal number if killed), the captured output, why the run
+            was stopped early and its resource usage.
+
+    Notes:
+        - The output goes through pipes rather than files, so a fast writer is stopped within
+          one read of passing the limit, as with `output_capture.run_bounded`.
+    """
+    deadline = time.monotonic() + request["timeout"]
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_read)
+        os.close(stderr_read)
+        _run_child(working_directory, request, stdout_write, stderr_write)
+    os.close(stdout_write)
+    os.close(stderr_write)
+
+    stdout = BoundedCapture(request["head_bytes"], request["tail_bytes"])
+    stderr = BoundedCapture(request["head_bytes"], request["tail_bytes"])
+    try:
+        timed_out, output_limited = drain_pipes(
+            {stdout_read: stdout, stderr_read: stderr},
+            deadline,
+            request["max_output_bytes"],
+        )
+    finally:
+        os.close(stdout_read)
+        os.close(stderr_read)
+
+    status = rusage = None
+    if not (timed_out or output_limited):
+        pidfd = os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+        try:
+            while True:
+                waited_pid, status, rusage = os.wait4(pid, os.WNOHANG)
+                if waited_pid:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    timed_out = True
+                    status = None
+                    break
+                if pidfd is not None:
+                    select.select([pidfd], [], [], remaining)
+                else:
+                    time.sleep(min(remaining, 0.05))
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+    if status is None:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+        _, status, rusage = os.wait4(pid, 0)
+
+    return {
+        "returncode": os.waitstatus_to_exitcode(status),
+        "stdout": stdout.to_dict(),
+        "stderr": stderr.to_dict(),
+        "timed_out": timed_out,
+        "output_limited": output_limited,
+        "cpu_time": rusage.ru_utime + rusage.ru_stime,  # type: ignore
+        "max_rss_kb": rusage.ru_maxrss,  # type: ignore
+    }
+
+
+def _worker_main(working_directory: str) -> None:
+    """
+    Entry point of a worker process: preloads modules, then forks one child per request.
+    """
+    protocol = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    os.chdir(working_directory)
+    sys.path.insert(0, working_directory)
+    for module in settings.WARM_PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except Exception:
+            pass
+
+    # Project modules may be edited between runs and this tool's own modules (such as `settings`)
+    # would shadow the project's, so only third-party and stdlib imports stay warm.
+    tool_directory = os.path.dirname(os.path.abspath(__file__))
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None) or ""
+        if name != "__main__" and (
+            module_file.startswith(working_directory + os.sep)
+            or os.path.dirname(module_file) == tool_directory
+        ):
+            del sys.modules[name]
+    sys.path.remove(working_directory)
+
+    for line in sys.stdin:
+        reply = _run_request(working_directory, json.loads(line))
+        protocol.write(json.dumps(reply))
+        protocol.write("\n")
+        protocol.flush()
+
+
+class _Worker:
+    def __init__(self, working_directory: str):
+        self.process = subprocess.Popen(
+            ["python3", os.path.abspath(__file__), working_directory],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, request: dict) -> dict:
+        self.process.stdin.write(json.dumps(request) + "\n")  # type: ignore
+        self.process.stdin.flush()  # type: ignore
+        line = self.process.stdout.readline()  # type: ignore
+        if not line:
+            raise RuntimeError("warm worker exited unexpectedly")
+        return json.loads(line)
+
+    def close(self) -> None:
+        if self.alive():
+            self.process.stdin.close()  # type: ignore
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class WarmPool:
+    """
+    Fixed-size pool of warm workers rooted at one working directory.
+
+    Args:
+        working_directory (str): The directory scripts run in.
+        size (int, optional): Number of workers, i.e. scripts that can run at once. Defaults to `settings.WARM_POOL_SIZE`.
+    """
+
+    def __init__(self, working_directory: str, size: int = settings.WARM_POOL_SIZE):
+        self.working_directory = os.path.realpath(working_directory)
+        self._idle: queue.Queue[_Worker] = queue.Queue()
+        for _ in range(size):
+            self._idle.put(_Worker(self.working_directory))
+
+    def run(
+        self,
+        file_abspath: str,
+        timeout: float,
+        max_output_bytes: int = settings.RUN_OUTPUT_KILL_BYTES,
+        args: list[str] | None = None,
+        stdin: str | None = None,
+    ) -> RunResult:
+        """
+        Runs a script in a fresh fork of a warm worker.
+
+        Args:
+            file_abspath (str): Absolute path of the script.
+            timeout (float): Seconds after which the run is killed.
+            max_output_bytes (int, optional): Combined output after which the run is killed. Defaults to `settings.RUN_OUTPUT_KILL_BYTES`.
+            args (list[str] | None, optional): Command-line arguments of the script. Defaults to None.
+            stdin (str | None, optional): Text sent to the script's standard input. Defaults to None, an empty input.
+
+        Returns:
+            RunResult: Exit code, the head and tail of each output stream, why the run was stopped early and resource usage.
+        """
+        start = time.monotonic()
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                worker = _Worker(self.working_directory)
+            with tempfile.NamedTemporaryFile() as stdin_file:
+                if stdin:
+                    stdin_file.write(stdin.encode("utf-8"))
+                    stdin_file.flush()
+                reply = worker.run(
+                    {
+                        "path": file_abspath,
+                        "args": args or [],
+                        "stdin": stdin_file.name if stdin else None,
+                        "timeout": timeout,
+                        "max_output_bytes": max_output_bytes,
+                        "head_bytes": settings.RUN_OUTPUT_HEAD_BYTES,
+                        "tail_bytes": settings.RUN_OUTPUT_TAIL_BYTES,
+                    }
+                )
+                return RunResult(
+                    returncode=reply["returncode"],
+                    stdout=BoundedCapture.from_dict(reply["stdout"]),
+                    stderr=BoundedCapture.from_dict(reply["stderr"]),
+                    timed_out=reply["timed_out"],
+                    output_limited=reply["output_limited"],
+                    wall_time=time.monotonic() - start,
+                    cpu_time=reply["cpu_time"],
+                    max_rss_kb=reply["max_rss_kb"],
+                )
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get().close()
+
+
+_pools: dict[str, WarmPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(working_directory: str) -> WarmPool:
+    """
+    Returns the process-wide warm pool for `working_directory`, starting it on first use.
+    """
+    key = os.path.realpath(working_directory)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = WarmPool(key)
+        return _pools[key]
+
+
+@atexit.register
+def _close_pools() -> None:
+    for pool in _pools.values():
+        pool.close()
+
+
+if __name__ == "__main__":
+    _worker_main(sys.argv[1])
@@ -0,0 +1,115 @@
+"""
+Confined, memoized access to the files of the working directory, shared by all tools.
+
+Every tool path goes through `Workspace.resolve`, which resolves symlinks with `realpath` and
+rejects anything that ends up outside the working directory, so a symlink inside the workspace
+cannot be used to read or write files elsewhere. Resolved paths and `stat` results are cached
+for the current turn, so the confinement check, the file-type check and the tool's own size
+check share one system call per path.
+"""
+
+import os
+import stat
+import threading
+
+
+class Workspace:
+    """
+    Resolves and stats paths inside one working directory, caching the results for a turn.
+
+    Args:
+        working_directory (str): The directory tools are confined to.
+
+    Notes:
+        - `begin_turn` drops everything cached, so changes made outside the agent between
+          turns are seen. Within a turn, tools that write call `invalidate` with the paths
+          they changed; `run_python_file` may change anything and invalidates everything.
+        - `generation` goes up with every `begin_turn` and `invalidate`, so callers such as the
+          workspace index can tell whether anything may have changed since they last looked.
+        - Safe to use from the executor's worker threads.
+    """
+
+    def __init__(self, working_directory: str):
+        self.root = os.path.realpath(working_directory)
+        self._resolved: dict[str, str | None] = {}
+        self._stats: dict[str, os.stat_result | None] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def begin_turn(self) -> None:
+        """
+        Drops the cached paths and stats at the start of a turn.
+        """
+        with self._lock:
+            self.generation += 1
+            self._resolved.clear()
+            self._stats.clear()
+
+    def resolve(self, path: str | None) -> str | None:
+        """
+        Returns the real absolute path of `path`, relative to the working directory, or None if it is outside it.
+        """
+        path = path or ""
+        with self._lock:
+            if path in self._resolved:
+                return self._resolved[path]
+        resolved = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, resolved]) != self.root:
+            resolved = None
+        with self._lock:
+            self._resolved[path] = resolved
+        return resolved
+
+    def stat(self, abspath: str) -> os.stat_result | None:
+        """
+        Returns the stat of a resolved path, or None if it does not exist.
+        """
+        with self._lock:
+            if abspath in self._stats:
+                return self._stats[abspath]
+        try:
+            result = os.stat(abspath)
+        except OSError:
+            result = None
+        with self._lock:
+            self._stats[abspath] = result
+        return result
+
+    def is_file(self, abspath: str) -> bool:
+        result = self.stat(abspath)
+        return result is not None and stat.S_ISREG(result.st_mode)
+
+    def is_dir(self, abspath: str) -> bool:
+        result = self.stat(abspath)
+        return result is not None and stat.S_ISDIR(result.st_mode)
+
+    def invalidate(self, *abspaths: str) -> None:
+        """
+        Forgets the stats of written paths and their parent directories, or everything if no path is given.
+        """
+        with self._lock:
+            self.generation += 1
+            if not abspaths:
+                self._resolved.clear()
+                self._stats.clear()
+                return
+            for abspath in abspaths:
+                while True:
+                    self._stats.pop(abspath, None)
+                    if abspath == self.root or len(abspath) <= len(self.root):
+                        break
+                    abspath = os.path.dirname(abspath)
+
+
+_workspaces: dict[str, Workspace] = {}
+_workspaces_lock = threading.Lock()
+
+
+def get_workspace(working_directory: str) -> Workspace:
+    """
+    Returns the process-wide `Workspace` of `working_directory`.
+    """
+    with _workspaces_lock:
+        if working_directory not in _workspaces:
+            _workspaces[working_directory] = Workspace(working_directory)
+        return _workspaces[working_directory]
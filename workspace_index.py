@@ -0,0 +1,382 @@
+import ast
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+
+import settings
+from file_types import sniff
+
+INDEX_VERSION = 3
+# Seconds after which a temp file is taken to be left over from a crashed writer.
+TEMP_FILE_MAX_AGE = 3600
+SKIP_DIRS = {".git", "__pycache__", ".venv", "venv", "node_modules", ".mypy_cache"}
+WORD_RE = re.compile(r"\w{3,}")
+
+
+def _trigrams(text: str) -> set[str]:
+    """
+    Returns the trigrams of every word of at least three characters in `text`, lowercased.
+
+    Notes:
+        - Only word characters are indexed. Any literal query occurrence contains its words as
+          substrings of file words, so their trigrams still select a superset of matching files.
+    """
+    trigrams: set[str] = set()
+    for word in set(WORD_RE.findall(text.lower())):
+        trigrams.update(word[i : i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def _symbols(text: str) -> list[tuple[str, int, str]]:
+    """
+    Returns (name, line, kind) for every class and function defined in Python source.
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return []
+    symbols = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ClassDef):
+            symbols.append((node.name, node.lineno, "class"))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append((node.name, node.lineno, "def"))
+    return symbols
+
+
+def _read_header(index_path: str) -> dict | None:
+    """
+    Returns the header pickled ahead of an index's state, without loading the state itself.
+    """
+    try:
+        with open(index_path, "rb") as f:
+            header = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    return header if isinstance(header, dict) else None
+
+
+def evict_orphans(index_dir: str = settings.INDEX_DIR) -> int:
+    """
+    Deletes the index files of directories that no longer exist, of older index versions, and
+    temp files left behind by writers that crashed.
+
+    Returns:
+        int: Number of files deleted.
+    """
+    try:
+        entries = list(os.scandir(index_dir))
+    except OSError:
+        return 0
+    removed = 0
+    for entry in entries:
+        if entry.name.endswith(".pickle"):
+            header = _read_header(entry.path)
+            orphan = (
+                header is None
+                or header.get("version") != INDEX_VERSION
+                or not os.path.isdir(header.get("root", ""))
+            )
+        elif entry.name.endswith(".tmp"):
+            try:
+                orphan = time.time() - entry.stat().st_mtime > TEMP_FILE_MAX_AGE
+            except OSError:
+                orphan = False
+        else:
+            continue
+        if orphan:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def _read_text(file_abspath: str) -> str | None:
+    try:
+        with open(file_abspath, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    file_type = sniff(
+        data[: settings.SNIFF_BYTES], truncated=len(data) > settings.SNIFF_BYTES
+    )
+    if file_type.encoding is None:
+        return None
+    return data[file_type.bom :].decode(file_type.encoding, errors="replace")
+
+
+class WorkspaceIndex:
+    """
+    Trigram text index and Python symbol table of a working directory, persisted between runs.
+
+    Args:
+        working_directory (str): The directory to index.
+        index_dir (str, optional): Where index files are stored. Defaults to `settings.INDEX_DIR`.
+
+    Notes:
+        - `update` re-reads only files whose mtime or size changed since the last update.
+        - An index file starts with a small header naming its root, so `evict_orphans` can drop
+          the indexes of deleted directories (batch clones, temp dirs) without loading them.
+        - File ids are never reused, so postings of changed or removed files are filtered out
+          on lookup and dropped by rebuilding the postings once they outnumber the live files.
+    """
+
+    def __init__(self, working_directory: str, index_dir: str = settings.INDEX_DIR):
+        self.working_directory = os.path.realpath(working_directory)
+        digest = hashlib.sha1(self.working_directory.encode()).hexdigest()[:16]
+        self.index_dir = index_dir
+        self.index_path = os.path.join(index_dir, f"{digest}.pickle")
+        self.files: dict[str, tuple[int, int, int]] = {}
+        self.paths: dict[int, str] = {}
+        self.postings: dict[str, set[int]] = {}
+        self.symbols: dict[str, list[tuple[int, int, str]]] = {}
+        self.next_id = 0
+        self.stale = 0
+        self.generation: int | None = None
+        self.walked_at = float("-inf")
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "rb") as f:
+                header = pickle.load(f)
+                if header != {"version": INDEX_VERSION, "root": self.working_directory}:
+                    return
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return
+        self.files = state["files"]
+        self.paths = state["paths"]
+        self.postings = state["postings"]
+        self.symbols = state["symbols"]
+        self.next_id = state["next_id"]
+        self.stale = state["stale"]
+
+    def save(self) -> None:
+        """
+        Writes the index atomically: to a temp file of its own first, so concurrent writers of
+        the same index never mix their partial writes.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=self.index_dir,
+            prefix=os.path.basename(self.index_path) + ".",
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                self._dump(f)
+            os.replace(temp_path, self.index_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _dump(self, f) -> None:
+        pickle.dump(
+            {"version": INDEX_VERSION, "root": self.working_directory},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        pickle.dump(
+            {
+                "files": self.files,
+                "paths": self.paths,
+                "postings": self.postings,
+                "symbols": self.symbols,
+                "next_id": self.next_id,
+                "stale": self.stale,
+            },
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+    def _walk(self):
+        stack = [self.working_directory]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in SKIP_DIRS:
+                        stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.st_size <= settings.INDEX_MAX_FILE_BYTES:
+                        yield entry.path, stat.st_mtime_ns, stat.st_size
+
+    def _add(self, rel_path: str, file_abspath: str, mtime_ns: int, size: int) -> None:
+        file_id = self.next_id
+        self.next_id += 1
+        self.files[rel_path] = (file_id, mtime_ns, size)
+        self.paths[file_id] = rel_path
+        text = _read_text(file_abspath)
+        if text is None:
+            return
+        for trigram in _trigrams(text):
+            self.postings.setdefault(trigram, set()).add(file_id)
+        if rel_path.endswith(".py"):
+            for name, line, kind in _symbols(text):
+                self.symbols.setdefault(name, []).append((file_id, line, kind))
+
+    def _remove(self, rel_path: str) -> None:
+        file_id, _, _ = self.files.pop(rel_path)
+        del self.paths[file_id]
+        self.stale += 1
+
+    def _compact(self) -> None:
+        live = set(self.paths)
+        self.postings = {
+            trigram: ids & live
+            for trigram, ids in self.postings.items()
+            if not ids.isdisjoint(live)
+        }
+        self.stale = 0
+        self.symbols = {
+            name: kept
+            for name, defs in self.symbols.items()
+            if (kept := [d for d in defs if d[0] in live])
+        }
+
+    def update(self, generation: int | None = None) -> int:
+        """
+        Brings the index in line with the working directory and saves it if anything changed.
+
+        Args:
+            generation (int | None, optional): The `Workspace.generation` of the working
+                directory. If it is the one of the last update, no tool wrote since, and the
+                walk is skipped for up to `settings.INDEX_RECHECK_SECONDS` to catch outside
+                changes. Defaults to None, always walking.
+
+        Returns:
+            int: Number of files added, changed or removed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if (
+                generation is not None
+                and generation == self.generation
+                and now - self.walked_at < settings.INDEX_RECHECK_SECONDS
+            ):
+                return 0
+            self.generation = generation
+            self.walked_at = now
+            seen: set[str] = set()
+            changed = 0
+            for file_abspath, mtime_ns, size in self._walk():
+                rel_path = os.path.relpath(file_abspath, self.working_directory)
+                seen.add(rel_path)
+                known = self.files.get(rel_path)
+                if known and known[1] == mtime_ns and known[2] == size:
+                    continue
+                if known:
+                    self._remove(rel_path)
+                self._add(rel_path, file_abspath, mtime_ns, size)
+                changed += 1
+            for rel_path in [path for path in self.files if path not in seen]:
+                self._remove(rel_path)
+                changed += 1
+            if changed:
+                if self.stale > len(self.paths):
+                    self._compact()
+                self.save()
+            return changed
+
+    def search_text(
+        self, query: str, max_results: int = 50
+    ) -> list[tuple[str, int, str]]:
+        """
+        Finds lines containing `query`, case-insensitively.
+
+        Returns:
+            list[tuple[str, int, str]]: (relative path, 1-based line, line text) per hit.
+        """
+        with self.lock:
+            return self._search_text(query, max_results)
+
+    def _search_text(self, query: str, max_results: int) -> list[tuple[str, int, str]]:
+        needle = query.lower()
+        trigrams = _trigrams(query)
+        if trigrams:
+            candidates = set(self.paths)
+            for trigram in trigrams:
+                candidates &= self.postings.get(trigram, set())
+                if not candidates:
+                    return []
+        else:
+            candidates = set(self.paths)
+
+        hits = []
+        for rel_path in sorted(self.paths[file_id] for file_id in candidates):
+            text = _read_text(os.path.join(self.working_directory, rel_path))
+            if text is None or needle not in text.lower():
+                continue
+            for line_number, line in enumerate(text.splitlines(), start=1):
+                if needle in line.lower():
+                    hits.append((rel_path, line_number, line.strip()))
+                    if len(hits) >= max_results:
+                        return hits
+        return hits
+
+    def search_symbols(
+        self, query: str, max_results: int = 50
+    ) -> list[tuple[str, int, str]]:
+        """
+        Finds Python classes and functions whose name contains `query`, exact matches first.
+
+        Returns:
+            list[tuple[str, int, str]]: (relative path, 1-based line, "kind name") per definition.
+        """
+        with self.lock:
+            return self._search_symbols(query, max_results)
+
+    def _search_symbols(
+        self, query: str, max_results: int
+    ) -> list[tuple[str, int, str]]:
+        needle = query.lower()
+        names = sorted(
+            (name for name in self.symbols if needle in name.lower()),
+            key=lambda name: (name.lower() != needle, name),
+        )
+        hits = []
+        for name in names:
+            for file_id, line, kind in self.symbols[name]:
+                if file_id in self.paths:
+                    hits.append((self.paths[file_id], line, f"{kind} {name}"))
+                    if len(hits) >= max_results:
+                        return hits
+        return hits
+
+
+_indexes: dict[str, WorkspaceIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(working_directory: str) -> WorkspaceIndex:
+    """
+    Returns the process-wide index of `working_directory`, loading it from disk on first use.
+
+    The first call of a process also evicts the index files of directories that are gone.
+    """
+    key = os.path.realpath(working_directory)
+    with _indexes_lock:
+        if key not in _indexes:
+            if not _indexes:
+                evict_orphans()
+            _indexes[key] = WorkspaceIndex(key)
+        return _indexes[key]